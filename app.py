@@ -2,6 +2,7 @@ import atexit
 import json
 import logging
 import os
+import queue
 import signal
 import subprocess
 import sys
@@ -11,13 +12,21 @@ import traceback
 from pathlib import Path
 
 from flask import Flask, request, jsonify, send_from_directory, render_template, abort
-from flask import send_file
-from flask_caching import Cache
+from flask import send_file, Response
 from modpybass.pybass import BASS_INFO, BASS_GetInfo, BASS_DEVICEINFO, BASS_GetDeviceInfo, BASS_DEVICE_ENABLED, \
     BASS_ErrorGetCode
 from werkzeug.utils import secure_filename
 
-from audioplayer_module import AudioPlayer, BASS_DEVICE_LOOPBACK
+from audio_directory import AudioDirectoryIndex
+from audioplayer_module import AudioPlayer, BASS_DEVICE_LOOPBACK, METER_INTERVAL
+from library_import import ImportFormatError, stream_import, validate_markers, validate_track_mix, validate_transitions
+from library_store import LibraryStore, BatchOperationError, entry_transitions
+from persistence import JournaledJsonFile, JsonFileCache, atomic_write, file_signature, journal_path_for, \
+    replay_journal, truncate_journal
+from ram_samples import DEFAULT_RAM_BUDGET_MB
+from render_cache import DEFAULT_RENDER_CACHE_MB
+from show_bundle import BUNDLE_MIMETYPE, BundleFormatError, ShowBundleExport, read_show_bundle
+from sqlite_backend import SqliteLibraryDatabase
 app = Flask(__name__)
 # structural
 DEFAULT_AUDIO_UPLOAD_FOLDER_NAME = 'data/audio'  # Default relative path
@@ -27,20 +36,35 @@ SONGS_FILE = 'songs.json'
 SETLISTS_FILE = 'setlists.json'
 SETTINGS_FILE = 'settings.json'
 MIDI_SETTINGS_FILE = 'midi_settings.json'  # currently only keyboard settings.
+LIBRARY_DB_FILE = 'library.db'  # Only used by the sqlite storage backend
+AUDIO_METADATA_FILE = 'audio_metadata.json'  # Durations/channels of audio files, see audio_metadata.py
 
 DEFAULT_SAMPLE_RATE = 48000
 MAX_LOGICAL_CHANNELS = 64
 SUPPORTED_SAMPLE_RATES = [44100, 48000, 88200, 96000]
+PLAYBACK_EVENTS_KEEPALIVE = 15  # Seconds between keepalive comments on an idle event stream
+SERVER_THREADS = 16  # Waitress worker threads, see run.py and kiosk.py
+# Every event stream holds a server thread for as long as it is open; the remaining threads stay free for the API
+PLAYBACK_EVENT_STREAMS = 8
+PLAYBACK_STREAM_MAX_AGE = 300  # Seconds a stream lasts before its client reconnects, which frees slots of vanished ones
+PLAYBACK_EVENTS_RETRY = 5  # Seconds a client waits before reconnecting, also after it was turned away
+DEFAULT_STORAGE_BACKEND = 'json'
+# Editable track fields with their type and default value
+TRACK_FIELDS = [('output_channel', int, 1), ('volume', float, 1.0), ('is_stereo', bool, False)]
+STORAGE_BACKENDS = ['json', 'sqlite']
 
 SONGS_CACHE_KEY = 'songs_data'
 SETLISTS_CACHE_KEY = 'setlists_data'
 SETTINGS_CACHE_KEY = 'settings_data'
 MIDI_SETTINGS_CACHE_KEY = 'midi_settings_data'
 
+# Files persisted as a base file plus a change journal, with the collection key they hold
+JOURNALED_COLLECTIONS = {SONGS_FILE: 'songs', SETLISTS_FILE: 'setlists'}
+
 logging.basicConfig(level=logging.DEBUG)  # Ensure logging is enabled
-config = {"DEBUG": True, "CACHE_TYPE": "SimpleCache", "CACHE_DEFAULT_TIMEOUT": 300, "KIOSK_MODE": False}
+config = {"DEBUG": True, "KIOSK_MODE": False}
 app.config.from_mapping(config)
-cache = Cache(app)
+cache = JsonFileCache()  # Parsed JSON files, re-parsed only when the file on disk changes
 
 
 def get_current_audio_upload_folder_path_setting():
@@ -73,7 +97,8 @@ def initialize_app_files():
         'audio_outputs': [],
         'volume': 1.0,
         'sample_rate': DEFAULT_SAMPLE_RATE,
-        'audio_directory_path': DEFAULT_AUDIO_UPLOAD_FOLDER_NAME
+        'audio_directory_path': DEFAULT_AUDIO_UPLOAD_FOLDER_NAME,
+        'storage_backend': DEFAULT_STORAGE_BACKEND
     })
     _init_settings_file(MIDI_SETTINGS_FILE, {
         'enabled': True,
@@ -102,19 +127,17 @@ def _init_settings_file(file_name, default_data):
             sys.exit(f"Failed to initialize critical file: {file_path}")
     else:
         try:
-            with open(file_path, 'r+', encoding='utf-8') as f:
+            with open(file_path, 'r', encoding='utf-8') as f:
                 current_data = json.load(f)
-                updated = False
-                for key, value in default_data.items():
-                    if key not in current_data:
-                        current_data[key] = value
-                        updated = True
-                if updated:
-                    logging.info(f"Updating existing settings file {file_path} with missing default keys.")
-                    f.seek(0)
-                    json.dump(current_data, f, indent=2)
-                    f.truncate()
-                    if cache_key: cache.delete(cache_key)  # Invalidate cache if updated
+            updated = False
+            for key, value in default_data.items():
+                if key not in current_data:
+                    current_data[key] = value
+                    updated = True
+            if updated:
+                logging.info(f"Updating existing settings file {file_path} with missing default keys.")
+                if not write_json(file_path, current_data, cache_key):
+                    raise IOError(f"Failed to update {file_path}")
         except (json.JSONDecodeError, IOError) as e:
             logging.error(f"Error reading/updating existing settings file {file_path}: {e}. Re-initializing.")
             # If file is corrupt or unreadable, overwrite with defaults
@@ -128,7 +151,11 @@ def allowed_file(filename):
 
 
 def read_json(file_path, cache_key):
-    cached_data = cache.get(cache_key)
+    if os.path.basename(file_path) in JOURNALED_COLLECTIONS:
+        signature = file_signature(file_path, journal_path_for(file_path))
+    else:
+        signature = file_signature(file_path)
+    cached_data = cache.get(cache_key, signature)
     if cached_data is not None:
         return cached_data
 
@@ -139,7 +166,8 @@ def read_json(file_path, cache_key):
             'audio_outputs': [],
             'volume': 1.0,
             'sample_rate': DEFAULT_SAMPLE_RATE,
-            'audio_directory_path': DEFAULT_AUDIO_UPLOAD_FOLDER_NAME
+            'audio_directory_path': DEFAULT_AUDIO_UPLOAD_FOLDER_NAME,
+            'storage_backend': DEFAULT_STORAGE_BACKEND
         },
         os.path.basename(MIDI_SETTINGS_FILE): {
             'enabled': False,
@@ -152,46 +180,79 @@ def read_json(file_path, cache_key):
 
     if not os.path.exists(file_path):
         logging.warning(f"File not found: {file_path}. Returning default structure and caching.")
-        cache.set(cache_key, default_value, timeout=60)
+        cache.set(cache_key, signature, default_value)
         return default_value
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
         for key, val_default in default_value.items():
             data.setdefault(key, val_default)
-        cache.set(cache_key, data)
+        if os.path.basename(file_path) in JOURNALED_COLLECTIONS:
+            replay_journal(data, file_path, JOURNALED_COLLECTIONS[os.path.basename(file_path)])
+        cache.set(cache_key, signature, data)
         return data
     except (json.JSONDecodeError, IOError) as e:
         logging.error(f"Error reading {file_path}: {e}. Returning default structure and caching.")
-        cache.set(cache_key, default_value, timeout=60)
+        cache.set(cache_key, signature, default_value)
         return default_value
 
 
 def write_json(file_path, data, cache_key):
     try:
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
+        atomic_write(file_path, json.dumps(data, indent=2))
+        if os.path.basename(file_path) in JOURNALED_COLLECTIONS:
+            truncate_journal(file_path)  # The full file supersedes any journaled changes
         if cache_key:
             cache.delete(cache_key)  # Invalidate cache on write
             logging.debug(f"Cache invalidated for {cache_key} after writing to {file_path}")
         return True
-    except (IOError, TypeError) as e:
+    except (IOError, OSError, TypeError, ValueError) as e:
         logging.error(f"Error writing to {file_path}: {e}")
         return False
 
 
-def get_next_id(items):
-    if not isinstance(items, list): return 1
-    return max([item.get('id', 0) for item in items if isinstance(item, dict)], default=0) + 1
+initialize_app_files()  # Ensure files and default audio directory exist
 
 
-initialize_app_files()  # Ensure files and default audio directory exist
+def _create_journaled_backend(file_name, cache_key):
+    file_path = os.path.join(DATA_DIR, file_name)
+    return JournaledJsonFile(file_path, JOURNALED_COLLECTIONS[file_name],
+                             load_func=lambda: read_json(file_path, cache_key),
+                             on_write=lambda: cache.delete(cache_key))
+
+
+def _create_library_backends(backend_name):
+    if backend_name == 'sqlite':
+        database = SqliteLibraryDatabase(os.path.join(DATA_DIR, LIBRARY_DB_FILE))
+        return database.songs_backend(), database.setlists_backend()
+    return _create_journaled_backend(SONGS_FILE, SONGS_CACHE_KEY), \
+        _create_journaled_backend(SETLISTS_FILE, SETLISTS_CACHE_KEY)
+
+
+def _create_startup_library_backends():
+    backend_name = read_json(os.path.join(DATA_DIR, SETTINGS_FILE), SETTINGS_CACHE_KEY).get(
+        'storage_backend', DEFAULT_STORAGE_BACKEND)
+    if backend_name not in STORAGE_BACKENDS:
+        logging.error(f"Unknown storage_backend '{backend_name}' in settings. Using '{DEFAULT_STORAGE_BACKEND}'.")
+        backend_name = DEFAULT_STORAGE_BACKEND
+    if backend_name == 'sqlite' and not os.path.exists(os.path.join(DATA_DIR, LIBRARY_DB_FILE)):
+        # First start on sqlite: carry over the existing songs.json/setlists.json
+        database = SqliteLibraryDatabase(os.path.join(DATA_DIR, LIBRARY_DB_FILE))
+        database.migrate_from(read_json(os.path.join(DATA_DIR, SONGS_FILE), SONGS_CACHE_KEY),
+                              read_json(os.path.join(DATA_DIR, SETLISTS_FILE), SETLISTS_CACHE_KEY))
+        database.close()
+    return _create_library_backends(backend_name)
+
+
+# Library store, the single owner of songs and setlists in memory
+_songs_backend, _setlists_backend = _create_startup_library_backends()
+library = LibraryStore(songs_backend=_songs_backend, setlists_backend=_setlists_backend)
+atexit.register(library.close)
 
 
 # Audio Player init
-def get_songs_data_for_player():
-    return read_json(os.path.join(DATA_DIR, SONGS_FILE), SONGS_CACHE_KEY)
+def get_song_for_player(song_id):
+    return library.get_song(song_id)
 
 
 def get_settings_data_for_player():
@@ -201,10 +262,11 @@ def get_settings_data_for_player():
 audio_player = AudioPlayer(
     root_path=app.root_path,  # Used for resolving relative paths
     initial_audio_upload_folder_config=get_current_audio_upload_folder_path_setting(),  # Pass the configured path
-    songs_data_provider_func=get_songs_data_for_player,
+    song_provider_func=get_song_for_player,
     settings_data_provider_func=get_settings_data_for_player,
     max_logical_channels_const=MAX_LOGICAL_CHANNELS,
-    default_sample_rate_const=DEFAULT_SAMPLE_RATE
+    default_sample_rate_const=DEFAULT_SAMPLE_RATE,
+    metadata_index_path=os.path.join(DATA_DIR, AUDIO_METADATA_FILE)
 )
 
 try:
@@ -216,6 +278,25 @@ except RuntimeError as e:
     raise
 
 atexit.register(audio_player.shutdown)
+atexit.register(audio_player.metadata_index.save)
+
+audio_files_index = AudioDirectoryIndex(allowed_file)  # Watched listing of the audio folder for /api/audio/files
+audio_files_index.set_folder(get_current_audio_upload_folder_abs())
+atexit.register(audio_files_index.stop)
+
+
+def sync_render_cache():
+    """Renders every audio file the library references at the current sample rate, in the background, when enabled."""
+    audio_player.sync_render_cache(library.referenced_files())
+
+
+sync_render_cache()
+
+
+@app.before_request
+def reload_library_if_changed():
+    library.reload_if_changed()
+
 # UI
 @app.route('/')
 def index():
@@ -224,14 +305,12 @@ def index():
 
 @app.route('/setlists')
 def setlists_page():
-    setlists_data_val = read_json(os.path.join(DATA_DIR, SETLISTS_FILE), SETLISTS_CACHE_KEY)
-    return render_template('setlists.html', setlists=setlists_data_val.get('setlists', []))
+    return render_template('setlists.html', setlists=library.setlists_data().get('setlists', []))
 
 
 @app.route('/songs')
 def songs_page():
-    songs_data_val = read_json(os.path.join(DATA_DIR, SONGS_FILE), SONGS_CACHE_KEY)
-    return render_template('songs.html', songs=songs_data_val.get('songs', []))
+    return render_template('songs.html', songs=library.songs_data().get('songs', []))
 
 
 @app.route('/settings')
@@ -240,18 +319,21 @@ def settings_page(): return render_template('settings.html')
 
 @app.route('/setlists/<int:setlist_id>/play')
 def play_setlist_page(setlist_id):
-    setlist_obj, songs_data_dict = _get_setlist_and_songs_data(setlist_id, fetch_songs=True)
+    setlist_obj = library.get_setlist(setlist_id)
     if not setlist_obj: abort(404)
-    song_map = {s['id']: s for s in songs_data_dict.get('songs', []) if isinstance(s, dict) and 'id' in s}
     songs_in_setlist_details = []
-    for s_id_in_list in setlist_obj.get('song_ids', []):
-        song_detail_item = song_map.get(s_id_in_list)
+    song_ids = setlist_obj.get('song_ids', [])
+    transitions = entry_transitions(song_ids, setlist_obj.get('transitions'))
+    for entry_idx, s_id_in_list in enumerate(song_ids):
+        song_detail_item = library.get_song(s_id_in_list)
         if song_detail_item:
             songs_in_setlist_details.append({
                 'id': s_id_in_list,
                 'name': song_detail_item.get('name'),
                 'tempo': song_detail_item.get('tempo'),
-                'duration': audio_player.calculate_song_duration(song_detail_item)
+                'duration': audio_player.calculate_song_duration(song_detail_item),
+                'transition': transitions[entry_idx],
+                'markers': song_detail_item.get('markers', [])
             })
     return render_template('setlist_player.html', setlist=setlist_obj, songs=songs_in_setlist_details)
 
@@ -288,6 +370,8 @@ def audio_directory_setting():
 
         if write_json(settings_path, current_settings, SETTINGS_CACHE_KEY):
             audio_player.update_audio_upload_folder_config(new_path_config)  # Inform AudioPlayer
+            audio_files_index.set_folder(get_current_audio_upload_folder_abs())
+            sync_render_cache()
             return jsonify(success=True, message=f"Audio directory path set to '{new_path_config}'.",
                            audio_directory_path=new_path_config)
         else:
@@ -317,6 +401,27 @@ def keyboard_settings():
             return jsonify(error="Keyboard settings update failed"), 500
     return jsonify(read_json(path, MIDI_SETTINGS_CACHE_KEY))
 
+@app.route('/api/settings/storage', methods=['GET', 'PUT'])
+def storage_settings():
+    settings_path = os.path.join(DATA_DIR, SETTINGS_FILE)
+    current_settings = read_json(settings_path, SETTINGS_CACHE_KEY)
+    current_backend = current_settings.get('storage_backend', DEFAULT_STORAGE_BACKEND)
+    if request.method == 'PUT':
+        data = request.get_json()
+        new_backend = data.get('storage_backend') if data else None
+        if new_backend not in STORAGE_BACKENDS:
+            return jsonify(error=f"Invalid storage_backend. Supported: {', '.join(STORAGE_BACKENDS)}"), 400
+        if new_backend != current_backend:
+            # The current library is migrated into the new backend before switching
+            if not library.switch_backends(*_create_library_backends(new_backend)):
+                return jsonify(error=f"Failed to migrate library into '{new_backend}' storage."), 500
+            current_settings['storage_backend'] = new_backend
+            if not write_json(settings_path, current_settings, SETTINGS_CACHE_KEY):
+                return jsonify(error="Failed to write storage setting"), 500
+            logging.info(f"Library storage switched from '{current_backend}' to '{new_backend}'.")
+        return jsonify(success=True, storage_backend=new_backend)
+    return jsonify(storage_backend=current_backend, supported_backends=STORAGE_BACKENDS)
+
 @app.route('/api/settings/audio_device', methods=['GET', 'PUT'])
 def audio_device_settings():
     settings_path = os.path.join(DATA_DIR, SETTINGS_FILE)
@@ -357,6 +462,17 @@ def audio_device_settings():
             current_settings_data = read_json(settings_path, SETTINGS_CACHE_KEY)
             # Preserve audio_directory_path, only update audio_outputs, volume, sample_rate
             current_settings_data.update({'audio_outputs': validated_outputs, 'volume': vol, 'sample_rate': sr})
+            for flag_key in ('ram_mode', 'premix_songs', 'pack_songs', 'synchronized_start', 'render_cache'):
+                if flag_key in data:
+                    if not isinstance(data[flag_key], bool): return jsonify(error=f'{flag_key} must be a boolean'), 400
+                    current_settings_data[flag_key] = data[flag_key]
+            for budget_key in ('prepared_cache_memory_mb', 'prepared_cache_max_handles', 'ram_budget_mb',
+                               'render_cache_mb'):
+                if budget_key in data:
+                    budget = data[budget_key]
+                    if not isinstance(budget, int) or isinstance(budget, bool) or budget < 0:
+                        return jsonify(error=f'{budget_key} must be a non-negative integer'), 400
+                    current_settings_data[budget_key] = budget
 
             if write_json(settings_path, current_settings_data, SETTINGS_CACHE_KEY):
                 audio_player.update_settings()  # This will make AudioPlayer re-read from settings_data
@@ -391,7 +507,14 @@ def audio_device_settings():
                    current_config=settings_data.get('audio_outputs', []),
                    volume=settings_data.get('volume', 1.0),
                    current_sample_rate=settings_data.get('sample_rate', DEFAULT_SAMPLE_RATE),
-                   supported_sample_rates=SUPPORTED_SAMPLE_RATES)
+                   supported_sample_rates=SUPPORTED_SAMPLE_RATES,
+                   ram_mode=settings_data.get('ram_mode', False),
+                   premix_songs=settings_data.get('premix_songs', False),
+                   pack_songs=settings_data.get('pack_songs', False),
+                   synchronized_start=settings_data.get('synchronized_start', True),
+                   ram_budget_mb=settings_data.get('ram_budget_mb', DEFAULT_RAM_BUDGET_MB),
+                   render_cache=settings_data.get('render_cache', False),
+                   render_cache_mb=settings_data.get('render_cache_mb', DEFAULT_RENDER_CACHE_MB))
 
 @app.route('/api/settings/open_directory', methods=['POST'])
 def open_directory():
@@ -414,9 +537,18 @@ def open_directory():
         logging.error(f"Failed to open directory {current_audio_folder_to_open}: {e}")
         return jsonify(success=False, error=f"Failed to open directory: {str(e)}"), 500
 
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(dict(cache.stats(), audio_metadata=audio_player.metadata_index.stats(),
+                        prepared_songs=audio_player.prepared_songs_stats(),
+                        render_cache=audio_player.render_cache.stats(), bounces=audio_player.bounces.stats(),
+                        packs=audio_player.packs.stats()))
+
 @app.route('/api/clear_cache', methods=['POST'])
 def clear_cache_route():
     cache.clear();
+    library.reload()
+    audio_player.clear_prepared_songs()
     return jsonify(success=True, message='Server cache cleared.')
 
 
@@ -425,7 +557,7 @@ def factory_reset():
     logging.warning("--- Initiating Factory Reset ---")
     try:
         audio_player.stop();
-        audio_player.clear_preload_state()
+        audio_player.clear_prepared_songs()
 
         # Get current audio folder BEFORE resetting settings
         current_audio_folder_before_reset = get_current_audio_upload_folder_abs()
@@ -433,6 +565,9 @@ def factory_reset():
         # Reset settings files to their initial default state (this will reset audio_directory_path)
         initialize_app_files()  # This re-initializes settings files with defaults
         cache.clear()  # Clear all cache
+        library.reload()
+        audio_player.render_cache.clear()
+        audio_player.packs.purge()  # Packs live in the audio folder being wiped
 
         # Delete files from the audio folder that was active BEFORE reset
         deleted_files_count, errors_list = 0, []
@@ -449,7 +584,9 @@ def factory_reset():
 
         # AudioPlayer needs to be updated with the new (default) settings
         audio_player.update_audio_upload_folder_config(DEFAULT_AUDIO_UPLOAD_FOLDER_NAME)  # Set to default
+        audio_files_index.set_folder(get_current_audio_upload_folder_abs())
         audio_player.update_settings()  # Reload all other settings (volume, sample rate, etc.)
+        sync_render_cache()
 
         message = f'Factory reset complete. {deleted_files_count} audio files deleted from "{current_audio_folder_before_reset}". Audio directory reset to default.'
         if errors_list: message += f" Errors during file deletion: {', '.join(errors_list)}"
@@ -523,35 +660,94 @@ def export_data(export_type):
     filename_map = {'songs': SONGS_FILE, 'setlists': SETLISTS_FILE}
     filename = filename_map.get(export_type)
     if not filename: return jsonify(error="Invalid export type"), 400
+    if read_json(os.path.join(DATA_DIR, SETTINGS_FILE), SETTINGS_CACHE_KEY).get(
+            'storage_backend', DEFAULT_STORAGE_BACKEND) != 'json':
+        with library.lock:
+            data = library.songs_data() if export_type == 'songs' else library.setlists_data()
+            body = json.dumps(data, indent=2)
+        return Response(body, mimetype='application/json',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
     file_path = os.path.join(DATA_DIR, filename)
+    library.flush(compact=True)  # Fold the journal into the file being sent
     if not os.path.exists(file_path): return jsonify(error=f"{filename} not found"), 404
     return send_file(file_path, as_attachment=True, download_name=filename)
 
 
+@app.route('/api/export/bundle/<int:setlist_id>', methods=['GET'])
+def export_show_bundle(setlist_id):
+    with library.lock:
+        setlist = library.get_setlist(setlist_id)
+        if not setlist: return jsonify(error='Setlist not found'), 404
+        songs = [library.get_song(sid) for sid in dict.fromkeys(setlist.get('song_ids', []))]
+        bundle = ShowBundleExport(setlist, [s for s in songs if s], get_current_audio_upload_folder_abs())
+    filename = secure_filename(f"{setlist.get('name') or 'setlist'}.showbundle.tar") or 'show.showbundle.tar'
+    return Response(iter(bundle), mimetype=BUNDLE_MIMETYPE, direct_passthrough=True,
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'Content-Length': str(bundle.size)})
+
+
+@app.route('/api/import/bundle', methods=['POST'])
+def import_show_bundle():
+    # The archive is sent as the raw request body so it can be read straight off the socket
+    if request.mimetype != BUNDLE_MIMETYPE: return jsonify(error=f"Expected a {BUNDLE_MIMETYPE} body"), 415
+    try:
+        manifest, renamed_files, stats = read_show_bundle(request.stream, get_current_audio_upload_folder_abs(),
+                                                          MAX_LOGICAL_CHANNELS)
+    except BundleFormatError as e:
+        return jsonify(error=str(e)), 400
+    except OSError as e:
+        logging.error(f"Error storing show bundle audio files: {e}")
+        return jsonify(error=f"Failed to store audio files: {e}"), 500
+
+    with library.lock:
+        setlist, song_id_map = library.import_show(manifest['setlist'], manifest['songs'])
+        if not (library.save_songs() and library.save_setlists()):
+            return jsonify(error="Failed to save imported show"), 500
+    library.flush()
+    sync_render_cache()
+    added_songs = sum(1 for old_id, new_id in song_id_map.items() if old_id != new_id)
+    logging.info(f"Imported show bundle '{setlist.get('name')}': {len(song_id_map)} songs ({added_songs} added), "
+                 f"{stats['audio_written']} audio files written, {stats['audio_skipped']} already present.")
+    return jsonify(success=True, setlist_id=setlist['id'], songs=len(song_id_map), songs_added=added_songs,
+                   renamed_files=renamed_files, missing_audio_files=manifest.get('missing_audio_files', []),
+                   **stats)
+
+
 @app.route('/api/import/<import_type>', methods=['POST'])
 def import_data(import_type):
-    target_info = {'songs': (SONGS_FILE, SONGS_CACHE_KEY), 'setlists': (SETLISTS_FILE, SETLISTS_CACHE_KEY)}
+    target_info = {'songs': SONGS_FILE, 'setlists': SETLISTS_FILE}
     if import_type not in target_info: return jsonify(error="Invalid import type"), 400
-    target_filename, cache_key_to_clear = target_info[import_type]
+    target_filename = target_info[import_type]
     if 'file' not in request.files: return jsonify(error="No file part"), 400
     file = request.files['file']
     if file.filename == '' or not file.filename.endswith('.json'): return jsonify(error="No file or invalid type"), 400
     try:
-        imported_data = json.load(file)
-        if (import_type == 'songs' and 'songs' not in imported_data) or \
-                (import_type == 'setlists' and 'setlists' not in imported_data):
-            return jsonify(error=f"Invalid {import_type}.json format"), 400
-
-        file_path = os.path.join(DATA_DIR, target_filename)
-        if write_json(file_path, imported_data, cache_key_to_clear):
-            cache.clear()  # Clear all cache for good measure after import
+        imported_data, errors, error_count = stream_import(file.stream, import_type, MAX_LOGICAL_CHANNELS)
+        imported_count = len(imported_data[import_type])
+        if error_count and not imported_count:
+            return jsonify(error=f"No valid {import_type} found in {file.filename}", errors=errors,
+                           skipped=error_count), 400
+
+        if import_type == 'songs':
+            changed_ids = library.replace_songs_data(imported_data)
+        else:
+            changed_ids = library.replace_setlists_data(imported_data)
+        if changed_ids is None:
+            return jsonify(error=f"Failed to write imported data to {target_filename}"), 500
+        library.flush()
+        # Only the audio state of a song that actually changed is stale
+        if import_type == 'songs' and any(audio_player.is_preloaded(song_id) for song_id in changed_ids):
             audio_player.stop()
-            audio_player.clear_preload_state()
-            audio_player.update_settings()  # Re-read all settings including potentially new audio path
-            return jsonify(success=True, message=f"{target_filename} imported. Cache and audio state reset.")
-        return jsonify(error=f"Failed to write imported data to {target_filename}"), 500
-    except json.JSONDecodeError:
-        return jsonify(error="Invalid JSON file."), 400
+        for changed_id in (changed_ids if import_type == 'songs' else ()):
+            audio_player.invalidate_song(changed_id)
+        if import_type == 'songs':
+            sync_render_cache()
+        response = jsonify(success=True, imported=imported_count, changed=len(changed_ids), skipped=error_count,
+                           errors=errors, message=f"{target_filename} imported ({imported_count} items, "
+                                                  f"{len(changed_ids)} changed, {error_count} skipped).")
+        return response, 207 if error_count else 200
+    except ImportFormatError as e:
+        return jsonify(error=f"Invalid JSON file: {e}"), 400
     except Exception as e:
         logging.error(f"Error importing {target_filename}: {e}");
         traceback.print_exc()
@@ -560,15 +756,38 @@ def import_data(import_type):
 #Audio and songs
 @app.route('/api/audio/files', methods=['GET'])
 def list_audio_files():
+    """
+    Lists the audio folder from the watched index, with size, duration (when already
+    known) and the songs using each file. Optional query args: q (name substring),
+    referenced (true/false), offset and limit.
+    """
+    query = request.args.get('q', '').lower()
+    referenced = request.args.get('referenced')
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    if offset < 0 or (limit is not None and limit < 0): return jsonify(error="offset and limit must be >= 0"), 400
+    if referenced not in (None, 'true', 'false'): return jsonify(error="referenced must be true or false"), 400
+    version, entries = audio_files_index.files()
     current_audio_folder = get_current_audio_upload_folder_abs()
-    try:
-        # The get_current_audio_upload_folder_abs ensures the folder exists
-        audio_files = sorted([f for f in os.listdir(current_audio_folder) if
-                              os.path.isfile(os.path.join(current_audio_folder, f)) and allowed_file(f)])
-        return jsonify(files=audio_files)
-    except Exception as e:
-        logging.error(f"Error listing audio files from {current_audio_folder}: {e}")
-        return jsonify(error=str(e)), 500
+
+    def build_payload():
+        matches = [e for e in entries if query in e[0].lower()] if query else entries
+        if referenced is not None:
+            matches = [e for e in matches if library.is_file_referenced(e[0]) == (referenced == 'true')]
+        page = matches[offset:offset + limit] if limit is not None else matches[offset:]
+        items = []
+        for name, size, mtime_ns in page:
+            metadata = audio_player.metadata_index.peek(os.path.join(current_audio_folder, name), size, mtime_ns)
+            song_ids = sorted({song_id for song_id, _ in library.tracks_for_file(name)})
+            items.append({'name': name, 'size': size, 'modified': mtime_ns / 1e9,
+                          'duration': metadata['duration'] if metadata else None,
+                          'channels': metadata['channels'] if metadata else None,
+                          'songs': [{'id': sid, 'name': library.get_song(sid).get('name')} for sid in song_ids]})
+        return {'files': [item['name'] for item in items], 'items': items, 'total': len(matches),
+                'offset': offset, 'limit': limit}
+
+    with library.lock:
+        return _conditional_json(f"files-{version}-{library.songs_etag()}", build_payload)
 
 
 @app.route('/api/audio/upload', methods=['POST'])
@@ -586,98 +805,95 @@ def general_audio_upload():
                 filename = secure_filename(file_obj.filename)
                 if not filename: errors.append(f"Invalid filename: '{file_obj.filename}'."); continue
                 file_obj.save(os.path.join(current_audio_folder, filename))
+                audio_player.metadata_index.get(os.path.join(current_audio_folder, filename))
                 uploaded.append(filename)
             except Exception as e:
                 errors.append(f"Error saving {file_obj.filename}: {e}")
         elif file_obj and file_obj.filename:
             errors.append(f"File type not allowed: {file_obj.filename}")
+    audio_player.metadata_index.save()
     status = 200 if not errors else (207 if uploaded else 400)
     return jsonify({'uploaded_files': uploaded, 'errors': errors} if errors else {'uploaded_files': uploaded}), status
 
 @app.route('/api/songs', methods=['GET', 'POST', 'DELETE'])
 def handle_songs():
-    path = os.path.join(DATA_DIR, SONGS_FILE)
-    songs_data = read_json(path, SONGS_CACHE_KEY)
     if request.method == 'POST':
         data = request.get_json()
-        new_song = {'id': get_next_id(songs_data.get('songs', [])), 'name': data.get('name', 'New Song'),
-                    'tempo': int(data.get('tempo', 120)), 'audio_tracks': []}
-        songs_data.setdefault('songs', []).append(new_song)
-        if write_json(path, songs_data, SONGS_CACHE_KEY): return jsonify(new_song), 201
+        with library.lock:
+            if _if_match_failed(library.songs_etag()): return _precondition_failed('The song library')
+            new_song = library.create_song(data.get('name', 'New Song'), int(data.get('tempo', 120)))
+            if library.save_songs(): return _with_etag(jsonify(new_song), library.song_etag(new_song['id'])), 201
         return jsonify(error="Failed to save new song"), 500
     elif request.method == 'DELETE':  # Delete ALL songs and their files
-        audio_player.stop();
-        audio_player.clear_preload_state()
-
-        current_audio_folder = get_current_audio_upload_folder_abs()
-        deleted_files_count = 0
-        if os.path.exists(current_audio_folder):
-            for track_file in os.listdir(current_audio_folder):
-                try:
-                    full_file_path = os.path.join(current_audio_folder, track_file)
-                    if os.path.isfile(full_file_path):
-                        os.unlink(full_file_path)
-                        deleted_files_count += 1
-                except Exception as e:
-                    logging.error(f"Error deleting file {track_file} during all songs deletion: {e}")
-
-        if not write_json(path, {'songs': []}, SONGS_CACHE_KEY):
-            return jsonify(error="Failed to clear songs data file"), 500
+        # Held throughout, so no PUT can change the library between the If-Match check and the delete
+        with library.lock:
+            if _if_match_failed(library.songs_etag()): return _precondition_failed('The song library')
+            audio_player.stop()
+            audio_player.clear_prepared_songs()
+            audio_player.packs.purge()
 
-        setlists_path = os.path.join(DATA_DIR, SETLISTS_FILE)
-        setlists_data = read_json(setlists_path, SETLISTS_CACHE_KEY)
-        for slist in setlists_data.get('setlists', []): slist['song_ids'] = []
-        write_json(setlists_path, setlists_data, SETLISTS_CACHE_KEY)
+            current_audio_folder = get_current_audio_upload_folder_abs()
+            deleted_files_count = 0
+            if os.path.exists(current_audio_folder):
+                for track_file in os.listdir(current_audio_folder):
+                    try:
+                        full_file_path = os.path.join(current_audio_folder, track_file)
+                        if os.path.isfile(full_file_path):
+                            os.unlink(full_file_path)
+                            deleted_files_count += 1
+                    except Exception as e:
+                        logging.error(f"Error deleting file {track_file} during all songs deletion: {e}")
+
+            library.delete_all_songs()
+            if not library.save_songs():
+                return jsonify(error="Failed to clear songs data file"), 500
+            sync_render_cache()
+            library.save_setlists()
 
-        return jsonify(success=True,
-                       message=f'All songs, setlist items, and {deleted_files_count} audio files from "{current_audio_folder}" deleted.')
-    return jsonify(songs_data)
+            return jsonify(success=True,
+                           message=f'All songs, setlist items, and {deleted_files_count} audio files from "{current_audio_folder}" deleted.')
+    with library.lock:
+        return _conditional_json(library.songs_etag(), library.songs_data)
 
 @app.route('/api/songs/<int:song_id>', methods=['GET', 'PUT', 'DELETE'])
 def handle_song(song_id):
-    songs_path = os.path.join(DATA_DIR, SONGS_FILE)
-    songs_data = read_json(songs_path, SONGS_CACHE_KEY)
-    song_list = songs_data.setdefault('songs', [])
-    song_idx = next((i for i, s in enumerate(song_list) if s.get('id') == song_id), -1)
-    if song_idx == -1: return jsonify(error='Song not found'), 404
-    current_song_obj = song_list[song_idx]
+    current_song_obj = library.get_song(song_id)
+    if not current_song_obj: return jsonify(error='Song not found'), 404
 
     if request.method == 'PUT':
         data = request.get_json()
-        current_song_obj['name'] = data.get('name', current_song_obj['name'])
-        current_song_obj['tempo'] = int(data.get('tempo', current_song_obj['tempo']))
-        if 'audio_tracks' in data: current_song_obj['audio_tracks'] = data['audio_tracks']
-        if audio_player._preloaded_song_id == song_id: audio_player.clear_preload_state()
-        if write_json(songs_path, songs_data, SONGS_CACHE_KEY): return jsonify(current_song_obj)
+        with library.lock:
+            if _if_match_failed(library.song_etag(song_id)): return _precondition_failed('This song')
+            library.update_song(song_id, name=data.get('name', current_song_obj['name']),
+                                tempo=int(data.get('tempo', current_song_obj['tempo'])),
+                                audio_tracks=data.get('audio_tracks'))
+            audio_player.song_tracks_changed(song_id)
+            if library.save_songs(): return _with_etag(jsonify(current_song_obj), library.song_etag(song_id))
         return jsonify(error="Failed to save updated song"), 500
     elif request.method == 'DELETE':
-        if audio_player._preloaded_song_id == song_id: audio_player.clear_preload_state()
-        files_from_deleted_song = {t.get('file_path') for t in current_song_obj.get('audio_tracks', []) if
-                                   t.get('file_path')}
-        del song_list[song_idx]
-
-        setlists_path = os.path.join(DATA_DIR, SETLISTS_FILE)
-        setlists_data = read_json(setlists_path, SETLISTS_CACHE_KEY)
-        for slist in setlists_data.get('setlists', []):
-            slist['song_ids'] = [sid for sid in slist.get('song_ids', []) if sid != song_id]
-        write_json(setlists_path, setlists_data, SETLISTS_CACHE_KEY)
-
-        all_remaining_files = {t_iter.get('file_path') for s_iter in song_list for t_iter in
-                               s_iter.get('audio_tracks', []) if t_iter.get('file_path')}
+        with library.lock:
+            if not library.get_song(song_id): return jsonify(error='Song not found'), 404  # Deleted meanwhile
+            if _if_match_failed(library.song_etag(song_id)): return _precondition_failed('This song')
+            orphaned_files = library.delete_song(song_id)
+            if orphaned_files is None: return jsonify(error='Song not found'), 404
+            audio_player.invalidate_song(song_id)
+            library.save_setlists()
+
         deleted_file_count = 0
         current_audio_folder = get_current_audio_upload_folder_abs()
-        for file_to_check in files_from_deleted_song:
-            if file_to_check not in all_remaining_files:
-                try:
-                    os.unlink(os.path.join(current_audio_folder, file_to_check))
-                    deleted_file_count += 1
-                except OSError as e:
-                    logging.error(f"Error deleting file {file_to_check} from {current_audio_folder}: {e}")
+        for file_to_check in orphaned_files:
+            try:
+                os.unlink(os.path.join(current_audio_folder, file_to_check))
+                deleted_file_count += 1
+            except OSError as e:
+                logging.error(f"Error deleting file {file_to_check} from {current_audio_folder}: {e}")
 
-        if write_json(songs_path, songs_data, SONGS_CACHE_KEY):
+        if library.save_songs():
+            sync_render_cache()
             return jsonify(success=True, message=f"Song deleted. {deleted_file_count} unused audio file(s) removed.")
         return jsonify(error="Failed to save song data after deletion"), 500
-    return jsonify(current_song_obj)
+    with library.lock:
+        return _conditional_json(library.song_etag(song_id), lambda: current_song_obj)
 
 @app.route('/api/songs/<int:song_id>/upload', methods=['POST'])
 def upload_song_tracks(song_id):
@@ -685,12 +901,8 @@ def upload_song_tracks(song_id):
     files = request.files.getlist('files[]')
     if not files or files[0].filename == '': return jsonify(error='No selected files'), 400
 
-    songs_path = os.path.join(DATA_DIR, SONGS_FILE)
-    songs_data = read_json(songs_path, SONGS_CACHE_KEY)
-    song = next((s for s in songs_data.get('songs', []) if s.get('id') == song_id), None)
-    if not song: return jsonify(error='Song not found'), 404
+    if not library.get_song(song_id): return jsonify(error='Song not found'), 404
 
-    song_tracks = song.setdefault('audio_tracks', [])
     current_audio_folder = get_current_audio_upload_folder_abs()  # Ensures directory exists
 
     newly_added_tracks_info, errors_info = [], []
@@ -699,119 +911,213 @@ def upload_song_tracks(song_id):
             try:
                 filename = secure_filename(file_obj.filename)
                 if not filename: errors_info.append(f"Invalid filename from '{file_obj.filename}'."); continue
-                if any(t.get('file_path') == filename for t in song_tracks):
+                if library.song_has_track_file(song_id, filename):
                     errors_info.append(f"Track '{filename}' already exists in this song.");
                     continue
                 file_obj.save(os.path.join(current_audio_folder, filename))
-                new_track = {'id': get_next_id(song_tracks), 'file_path': filename, 'output_channel': 1, 'volume': 1.0,
-                             'is_stereo': False}
-                song_tracks.append(new_track)
+                audio_player.metadata_index.get(os.path.join(current_audio_folder, filename))
+                new_track = library.add_track(song_id, filename)
                 newly_added_tracks_info.append(new_track)
             except Exception as e:
                 errors_info.append(f"Error saving file {file_obj.filename}: {str(e)}")
         elif file_obj and file_obj.filename:
             errors_info.append(f"File type not allowed: {file_obj.filename}")
+    audio_player.metadata_index.save()
 
     if newly_added_tracks_info:
-        if not write_json(songs_path, songs_data, SONGS_CACHE_KEY):
+        if not library.save_songs():
             return jsonify(error="Failed to save song data after track upload"), 500
-        if audio_player._preloaded_song_id == song_id: audio_player.clear_preload_state()
+        audio_player.invalidate_song(song_id)
+        sync_render_cache()
 
     status_code = 200 if not errors_info else (207 if newly_added_tracks_info else 400)
     return jsonify(tracks=newly_added_tracks_info, errors=errors_info), status_code
 
 @app.route('/api/songs/<int:song_id>/tracks/<int:track_id>', methods=['PUT', 'DELETE'])
 def update_or_delete_track(song_id, track_id):
-    songs_path = os.path.join(DATA_DIR, SONGS_FILE)
-    songs_data = read_json(songs_path, SONGS_CACHE_KEY)
-    song = next((s for s in songs_data.get('songs', []) if s.get('id') == song_id), None)
-    if not song: return jsonify(error='Song not found'), 404
-    tracks_list = song.setdefault('audio_tracks', [])
-    track_index = next((i for i, t in enumerate(tracks_list) if t.get('id') == track_id), -1)
-    if track_index == -1: return jsonify(error='Track not found'), 404
-
-    if request.method == 'PUT':
-        data = request.json
-        track_obj = tracks_list[track_index]
-        updated_flag = False
-        for key, new_val_type, default_val in [('output_channel', int, 1), ('volume', float, 1.0),
-                                               ('is_stereo', bool, False)]:
-            if key in data:
-                new_val = data[key]
+    with library.lock:
+        if not library.get_song(song_id): return jsonify(error='Song not found'), 404
+        track_obj = library.get_track(song_id, track_id)
+        if not track_obj: return jsonify(error='Track not found'), 404
+
+        if _if_match_failed(library.song_etag(song_id)): return _precondition_failed('This song')
+        if request.method == 'PUT':
+            data = request.json
+            track_changes = {}
+            for key, new_val_type, default_val in TRACK_FIELDS:
+                if key in data:
+                    new_val = data[key]
+                    try:
+                        typed_val = new_val_type(new_val)
+                    except ValueError:
+                        return jsonify(error=f"Invalid type for {key}"), 400
+                    if track_obj.get(key, default_val) != typed_val: track_changes[key] = typed_val
+            if track_changes and library.update_track(song_id, track_id, track_changes):
+                if not library.save_songs(): return jsonify(
+                    error="Failed to save track changes"), 500
+                audio_player.song_tracks_changed(song_id)
+            return _with_etag(jsonify(success=True, track=track_obj), library.song_etag(song_id))
+        elif request.method == 'DELETE':
+            file_path_of_deleted_track = library.remove_track(song_id, track_id)
+            is_file_still_used = bool(file_path_of_deleted_track) and \
+                library.is_file_referenced(file_path_of_deleted_track)
+
+            if not library.save_songs(): return jsonify(
+                error="Failed to save song data after track removal"), 500
+
+            if file_path_of_deleted_track and not is_file_still_used:
+                current_audio_folder = get_current_audio_upload_folder_abs()
                 try:
-                    typed_val = new_val_type(new_val)
-                except ValueError:
-                    return jsonify(error=f"Invalid type for {key}"), 400
-                if track_obj.get(key, default_val) != typed_val: track_obj[key] = typed_val; updated_flag = True
-        if updated_flag:
-            if not write_json(songs_path, songs_data, SONGS_CACHE_KEY): return jsonify(
-                error="Failed to save track changes"), 500
-            if audio_player._preloaded_song_id == song_id: audio_player.clear_preload_state()
-        return jsonify(success=True, track=track_obj)
-    elif request.method == 'DELETE':
-        file_path_of_deleted_track = tracks_list[track_index].get('file_path')
-        del tracks_list[track_index]
-        is_file_still_used = False
-        if file_path_of_deleted_track:
-            for s_iter in songs_data.get('songs', []):
-                for t_iter in s_iter.get('audio_tracks', []):
-                    if t_iter.get('file_path') == file_path_of_deleted_track: is_file_still_used = True; break
-                if is_file_still_used: break
-
-        if not write_json(songs_path, songs_data, SONGS_CACHE_KEY): return jsonify(
-            error="Failed to save song data after track removal"), 500
-
-        if file_path_of_deleted_track and not is_file_still_used:
-            current_audio_folder = get_current_audio_upload_folder_abs()
-            try:
-                os.unlink(os.path.join(current_audio_folder, file_path_of_deleted_track))
-            except OSError as e:
-                logging.error(f"Error deleting file {file_path_of_deleted_track} from {current_audio_folder}: {e}")
+                    os.unlink(os.path.join(current_audio_folder, file_path_of_deleted_track))
+                except OSError as e:
+                    logging.error(f"Error deleting file {file_path_of_deleted_track} from {current_audio_folder}: {e}")
+
+            audio_player.invalidate_song(song_id)
+            return _with_etag(jsonify(success=True, message="Track removed successfully."), library.song_etag(song_id))
+        return jsonify(error="Invalid HTTP method"), 405
 
-        if audio_player._preloaded_song_id == song_id: audio_player.clear_preload_state()
-        return jsonify(success=True, message="Track removed successfully.")
-    return jsonify(error="Invalid HTTP method"), 405
+# Markers only place seeks and loops, so changing them leaves the prepared song alone
+@app.route('/api/songs/<int:song_id>/markers', methods=['GET', 'POST', 'PUT'])
+def song_markers(song_id):
+    song = library.get_song(song_id)
+    if not song: return jsonify(error='Song not found'), 404
+    if request.method == 'GET':
+        with library.lock:
+            return _conditional_json(library.song_etag(song_id), lambda: {'markers': song.get('markers', [])})
+    data = request.get_json()
+    if not isinstance(data, dict): return jsonify(error="Request body must be an object"), 400
+    markers = data.get('markers') if request.method == 'PUT' else [data]
+    problem = validate_markers(markers)
+    if problem: return jsonify(error=f"Invalid markers: {problem}"), 400
+    with library.lock:
+        if _if_match_failed(library.song_etag(song_id)): return _precondition_failed('This song')
+        if request.method == 'PUT':
+            result, status = {'markers': library.set_markers(song_id, markers)}, 200
+        else:
+            result, status = library.add_marker(song_id, markers[0]), 201
+        if library.save_songs(): return _with_etag(jsonify(result), library.song_etag(song_id)), status
+    return jsonify(error="Failed to save markers"), 500
+
+@app.route('/api/songs/<int:song_id>/markers/<int:marker_id>', methods=['DELETE'])
+def delete_song_marker(song_id, marker_id):
+    with library.lock:
+        if not library.get_song(song_id): return jsonify(error='Song not found'), 404
+        if _if_match_failed(library.song_etag(song_id)): return _precondition_failed('This song')
+        if not library.remove_marker(song_id, marker_id): return jsonify(error='Marker not found'), 404
+        if library.save_songs():
+            return _with_etag(jsonify(success=True, message="Marker removed."), library.song_etag(song_id))
+    return jsonify(error="Failed to save markers"), 500
+
+# The live mix only rides the prepared song's track streams; a track PUT is what keeps a volume
+@app.route('/api/songs/<int:song_id>/mix', methods=['GET', 'POST'])
+def song_mix(song_id):
+    song = library.get_song(song_id)
+    if not song: return jsonify(error='Song not found'), 404
+    track_ids = {str(track['id']): track['id'] for track in song.get('audio_tracks', [])}
+    if request.method == 'POST':
+        data = request.get_json()
+        tracks = data.get('tracks') if isinstance(data, dict) else None
+        problem = validate_track_mix(tracks)
+        if problem: return jsonify(error=f"Invalid mix: {problem}"), 400
+        unknown = next((track_id for track_id in tracks if track_id not in track_ids), None)
+        if unknown is not None: return jsonify(error=f"Track {unknown} not found"), 404
+        changes = {track_ids[track_id]: dict(change) for track_id, change in tracks.items()}
+        for change in changes.values():
+            if 'volume' in change: change['volume'] = float(change['volume'])
+        if not audio_player.set_track_mix(song_id, changes):
+            return jsonify(error='The song plays from its pre-mixed bounce, which has no separate tracks'), 409
+    mix = audio_player.track_mix(song_id)
+    return jsonify(tracks={str(track['id']): dict({'volume': float(track.get('volume', 1.0)), 'muted': False,
+                                                   'solo': False}, **mix.get(track['id'], {}))
+                           for track in song.get('audio_tracks', [])})
+
+@app.route('/api/batch', methods=['POST'])
+def batch_update():
+    data = request.get_json()
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify(error="Request body must contain a non-empty 'operations' list"), 400
+    field_types = {key: value_type for key, value_type, _ in TRACK_FIELDS}
+    for i, operation in enumerate(operations):
+        if not isinstance(operation, dict): return jsonify(error=f"Operation {i} is not an object"), 400
+        fields = operation.get('fields', {})
+        if not isinstance(fields, dict): return jsonify(error=f"Operation {i}: 'fields' must be an object"), 400
+        try:
+            operation['fields'] = {key: field_types[key](value) for key, value in fields.items()}
+        except KeyError as e:
+            return jsonify(error=f"Operation {i}: unknown track field {e}"), 400
+        except (TypeError, ValueError):
+            return jsonify(error=f"Operation {i}: invalid field value"), 400
+
+    with library.lock:
+        try:
+            results, changed_song_ids, removed_file_paths = library.apply_batch(operations)
+        except BatchOperationError as e:
+            return jsonify(error=str(e), failed_operation=e.index), 400
+        except IOError as e:
+            logging.error(f"Batch update failed to persist: {e}")
+            return jsonify(error=str(e)), 500
+        response = jsonify(success=True, results=results,
+                           etags={'songs': library.songs_etag(), 'setlists': library.setlists_etag()})
+
+    for changed_song_id in changed_song_ids: audio_player.song_tracks_changed(changed_song_id)
+    current_audio_folder = get_current_audio_upload_folder_abs()
+    for file_path in removed_file_paths:
+        try:
+            os.unlink(os.path.join(current_audio_folder, file_path))
+        except OSError as e:
+            logging.error(f"Error deleting file {file_path} from {current_audio_folder}: {e}")
+    return response
 
 #Setlists and setlist_player
 @app.route('/api/setlists', methods=['GET', 'POST'])
 def handle_setlists():
-    path = os.path.join(DATA_DIR, SETLISTS_FILE)
-    setlists_data = read_json(path, SETLISTS_CACHE_KEY)
     if request.method == 'POST':
         data = request.get_json()
-        new_setlist = {'id': get_next_id(setlists_data.get('setlists', [])), 'name': data.get('name', 'New Setlist'),
-                       'song_ids': data.get('song_ids', [])}
-        setlists_data.setdefault('setlists', []).append(new_setlist)
-        if write_json(path, setlists_data, SETLISTS_CACHE_KEY): return jsonify(new_setlist), 201
+        song_ids = data.get('song_ids', [])
+        problem = validate_transitions(data.get('transitions', []), len(song_ids) if isinstance(song_ids, list) else None)
+        if problem: return jsonify(error=f"Invalid transitions: {problem}"), 400
+        with library.lock:
+            if _if_match_failed(library.setlists_etag()): return _precondition_failed('The setlists')
+            new_setlist = library.create_setlist(data.get('name', 'New Setlist'), data.get('song_ids', []),
+                                                 data.get('transitions'))
+            if library.save_setlists():
+                return _with_etag(jsonify(new_setlist), library.setlist_etag(new_setlist['id'])), 201
         return jsonify(error="Failed to save setlist"), 500
-    return jsonify(setlists_data)
+    with library.lock:
+        return _conditional_json(library.setlists_etag(), library.setlists_data)
 
 @app.route('/api/setlists/<int:setlist_id>', methods=['GET', 'PUT', 'DELETE'])
 def handle_setlist(setlist_id):
-    path = os.path.join(DATA_DIR, SETLISTS_FILE);
-    setlists_data = read_json(path, SETLISTS_CACHE_KEY)
-    s_list = setlists_data.setdefault('setlists', []);
-    idx = next((i for i, s in enumerate(s_list) if s.get('id') == setlist_id), -1)
-    if idx == -1: return jsonify(error='Setlist not found'), 404
-    current_setlist_obj = s_list[idx]
+    current_setlist_obj = library.get_setlist(setlist_id)
+    if not current_setlist_obj: return jsonify(error='Setlist not found'), 404
     if request.method == 'PUT':
         data = request.get_json()
-        current_setlist_obj['name'] = data.get('name', current_setlist_obj['name'])
-        if 'song_ids' in data: current_setlist_obj['song_ids'] = data['song_ids']
-        if write_json(path, setlists_data, SETLISTS_CACHE_KEY): return jsonify(current_setlist_obj)
+        song_ids = data.get('song_ids', current_setlist_obj.get('song_ids', []))
+        problem = validate_transitions(data.get('transitions', []), len(song_ids) if isinstance(song_ids, list) else None)
+        if problem: return jsonify(error=f"Invalid transitions: {problem}"), 400
+        with library.lock:
+            if _if_match_failed(library.setlist_etag(setlist_id)): return _precondition_failed('This setlist')
+            library.update_setlist(setlist_id, name=data.get('name', current_setlist_obj['name']),
+                                   song_ids=data.get('song_ids'), transitions=data.get('transitions'))
+            if library.save_setlists():
+                return _with_etag(jsonify(current_setlist_obj), library.setlist_etag(setlist_id))
         return jsonify(error="Failed to save setlist"), 500
     elif request.method == 'DELETE':
-        del s_list[idx]
-        if write_json(path, setlists_data, SETLISTS_CACHE_KEY): return jsonify(success=True)
+        with library.lock:
+            if _if_match_failed(library.setlist_etag(setlist_id)): return _precondition_failed('This setlist')
+            library.delete_setlist(setlist_id)
+            if library.save_setlists(): return jsonify(success=True)
         return jsonify(error="Failed to delete setlist"), 500
-    return jsonify(current_setlist_obj)
+    with library.lock:
+        return _conditional_json(library.setlist_etag(setlist_id), lambda: current_setlist_obj)
 
 @app.route('/api/setlists/<int:setlist_id>/control', methods=['POST'])
 def control_setlist(setlist_id):
     data = request.json;
     action = data.get('action');
     current_index = data.get('current_index', 0)
-    setlist_obj, _ = _get_setlist_and_songs_data(setlist_id, fetch_songs=False)  # song details not needed here
+    setlist_obj = library.get_setlist(setlist_id)
     if not setlist_obj: return jsonify(error='Setlist not found'), 404
     song_ids_in_setlist = setlist_obj.get('song_ids', []);
     num_songs = len(song_ids_in_setlist)
@@ -834,28 +1140,68 @@ def control_setlist(setlist_id):
                        current_song_id=song_ids_in_setlist[prev_song_index])
     return jsonify(error=f'Invalid action: {action}'), 400
 
+def _prefetch_setlist_neighbours(setlist_obj, song_index):
+    """Keeps the previous, current and next song of the setlist prepared in the background."""
+    song_ids = setlist_obj.get('song_ids', []) if setlist_obj else []
+    if 0 <= song_index < len(song_ids):
+        audio_player.prefetch_songs(song_ids[max(0, song_index - 1):song_index + 2])
+
+def _setlist_transition_plan(setlist_obj, song_index):
+    """(song_id, crossfade_seconds) of the songs that follow song_index without a stop, for queue_songs()."""
+    song_ids = setlist_obj.get('song_ids', [])
+    transitions = entry_transitions(song_ids, setlist_obj.get('transitions'))
+    plan = []
+    for idx in range(song_index, len(song_ids) - 1):
+        transition = transitions[idx]
+        if not transition: break
+        plan.append((song_ids[idx + 1], float(transition.get('duration', 0)) if transition['type'] == 'crossfade' else 0.0))
+    return plan
+
 @app.route('/api/setlists/<int:setlist_id>/song/<int:song_id_to_preload>/preload', methods=['POST'])
 def preload_setlist_song(setlist_id, song_id_to_preload):
-    # setlist_id is not strictly needed here if we only preload by song_id, but good for context
-    if audio_player.preload_song(song_id_to_preload):
-        return jsonify(success=True, message=f"Song ID {song_id_to_preload} preloaded.",
-                       preloaded_song_id=song_id_to_preload)
-    return jsonify(success=False, error=f"Failed to preload song ID {song_id_to_preload}."), 500
+    """Starts a background preload job, superseding older ones; its progress is at /api/preload/jobs/<id>."""
+    if not library.get_song(song_id_to_preload): return jsonify(error=f'Song ID {song_id_to_preload} not found'), 404
+    setlist_obj = library.get_setlist(setlist_id)
+
+    def prefetch_neighbours(job):
+        if setlist_obj and job.song_id in setlist_obj.get('song_ids', []):
+            _prefetch_setlist_neighbours(setlist_obj, setlist_obj['song_ids'].index(job.song_id))
+
+    job = audio_player.start_preload(song_id_to_preload, on_done=prefetch_neighbours)
+    return jsonify(success=True, job=job.status()), 202
+
+@app.route('/api/preload/jobs', methods=['GET'])
+def list_preload_jobs(): return jsonify(jobs=[job.status() for job in audio_player.preload_jobs.jobs()])
+
+@app.route('/api/preload/jobs/<int:job_id>', methods=['GET', 'DELETE'])
+def preload_job_status(job_id):
+    job = audio_player.preload_jobs.get(job_id)
+    if job is None: return jsonify(error=f'Preload job {job_id} not found'), 404
+    if request.method == 'DELETE':
+        job.cancel()
+    return jsonify(job.status())
 
 @app.route('/api/setlists/<int:setlist_id>/play', methods=['POST'])
 def play_setlist_song(setlist_id):
     data = request.get_json();
     current_song_idx = data.get('current_song_index', 0)
-    setlist_obj, songs_data_dict = _get_setlist_and_songs_data(setlist_id, fetch_songs=True)
+    setlist_obj = library.get_setlist(setlist_id)
     if not setlist_obj: return jsonify(error='Setlist not found'), 404
     song_ids_list = setlist_obj.get('song_ids', [])
     if not isinstance(song_ids_list, list) or current_song_idx >= len(song_ids_list): return jsonify(
         error='Invalid song index for this setlist'), 400
     song_id_to_play = song_ids_list[current_song_idx]
-    song_to_play_details = next((s for s in songs_data_dict.get('songs', []) if s.get('id') == song_id_to_play), None)
+    song_to_play_details = library.get_song(song_id_to_play)
     if not song_to_play_details: return jsonify(error=f'Song ID {song_id_to_play} not found in library'), 404
-
-    if audio_player.play_song_directly(song_id_to_play):
+    position = 0.0
+    if data.get('marker_id') is not None:  # Start from a marker, e.g. for a rehearsal
+        marker = library.get_marker(song_id_to_play, data['marker_id'])
+        if not marker: return jsonify(error=f"Marker {data['marker_id']} not found in this song"), 404
+        position = marker['position']
+
+    if audio_player.play_song_directly(song_id_to_play, position):
+        audio_player.queue_songs(_setlist_transition_plan(setlist_obj, current_song_idx))
+        _prefetch_setlist_neighbours(setlist_obj, current_song_idx)
         duration = audio_player.calculate_song_duration(song_to_play_details)
         return jsonify(success=True, current_song_index=current_song_idx, current_song_id=song_id_to_play,
                        song_name=song_to_play_details.get('name'), song_tempo=song_to_play_details.get('tempo'),
@@ -865,6 +1211,112 @@ def play_setlist_song(setlist_id):
 @app.route('/api/stop', methods=['POST'])
 def stop_player(): audio_player.stop(); return jsonify(success=True, message='Playback stopped.')
 
+@app.route('/api/playback', methods=['GET'])
+def playback_status(): return jsonify(audio_player.playback_status())
+
+def _playing_song_region(data, start_key='start'):
+    """(start, end) from a request naming a marker_id of the playing song or giving seconds, or an error response."""
+    song_id = audio_player.playback_status()['song_id']
+    if song_id is None: return None, (jsonify(error='Nothing is playing'), 409)
+    if data.get('marker_id') is not None:
+        marker = library.get_marker(song_id, data['marker_id'])
+        if not marker: return None, (jsonify(error=f"Marker {data['marker_id']} not found in song {song_id}"), 404)
+        return (marker['position'], marker.get('end')), None
+    try:
+        return (float(data[start_key]), float(data['end']) if data.get('end') is not None else None), None
+    except (KeyError, TypeError, ValueError):
+        return None, (jsonify(error=f"Give a 'marker_id' or a '{start_key}' in seconds"), 400)
+
+@app.route('/api/playback/seek', methods=['POST'])
+def seek_playback():
+    region, error = _playing_song_region(request.get_json() or {}, 'position')
+    if error: return error
+    position = audio_player.seek(region[0])
+    if position is None: return jsonify(error='Nothing is playing'), 409
+    return jsonify(success=True, position=round(position, 3))
+
+@app.route('/api/playback/loop', methods=['POST', 'DELETE'])
+def loop_playback():
+    if request.method == 'DELETE':
+        audio_player.clear_loop()
+        return jsonify(success=True, loop=None)
+    region, error = _playing_song_region(request.get_json() or {})
+    if error: return error
+    if region[1] is None: return jsonify(error='A loop needs an end: a marker with an end, or an end in seconds'), 400
+    loop = audio_player.set_loop(*region)
+    if loop is None: return jsonify(error='The loop could not be set on the playing song'), 409
+    return jsonify(success=True, loop={'start': round(loop[0], 3), 'end': round(loop[1], 3)})
+
+@app.route('/api/playback/pause', methods=['POST'])
+def pause_playback():
+    if not audio_player.pause(): return jsonify(error='Nothing is playing'), 409
+    return jsonify(success=True, paused=True)
+
+@app.route('/api/playback/resume', methods=['POST'])
+def resume_playback():
+    if not audio_player.resume(): return jsonify(error='Nothing is playing'), 409
+    return jsonify(success=True, paused=False)
+
+_playback_streams = threading.BoundedSemaphore(PLAYBACK_EVENT_STREAMS)
+
+@app.route('/api/playback/events', methods=['GET'])
+def playback_events():
+    """
+    Server-sent events: the current status first, then every playback event as it happens.
+    At most PLAYBACK_EVENT_STREAMS are open at once, more get a 503 with Retry-After. A
+    stream ends after PLAYBACK_STREAM_MAX_AGE and EventSource reconnects by itself. Meter
+    events go out at most every meter_interval seconds (query parameter), and only the
+    newest of those waiting.
+    """
+    try:
+        meter_interval = max(0.0, float(request.args.get('meter_interval', METER_INTERVAL)))
+    except ValueError:
+        return jsonify(error="'meter_interval' must be a number of seconds"), 400
+    if not _playback_streams.acquire(blocking=False):
+        response = jsonify(error=f"Too many playback event streams open (at most {PLAYBACK_EVENT_STREAMS})")
+        response.headers['Retry-After'] = str(PLAYBACK_EVENTS_RETRY)
+        return response, 503
+    listener = audio_player.events.listen()
+    slot = {'held': True}
+
+    def release():
+        if slot.pop('held', False):
+            audio_player.events.unlisten(listener)
+            _playback_streams.release()
+
+    def stream():
+        try:
+            yield f"retry: {PLAYBACK_EVENTS_RETRY * 1000}\n"
+            yield f"event: status\ndata: {json.dumps(audio_player.playback_status())}\n\n"
+            deadline, last_meter = time.monotonic() + PLAYBACK_STREAM_MAX_AGE, 0.0
+            while time.monotonic() < deadline:
+                try:
+                    events = [listener.get(timeout=PLAYBACK_EVENTS_KEEPALIVE)]
+                except queue.Empty:
+                    yield ": keepalive\n\n"  # Lets the server notice clients that went away
+                    continue
+                while True:  # Whatever else is waiting goes out in the same write
+                    try:
+                        events.append(listener.get_nowait())
+                    except queue.Empty:
+                        break
+                meter = next((event for event in reversed(events) if event['type'] == 'meter'), None)
+                now = time.monotonic()
+                if meter is not None and now - last_meter >= meter_interval - METER_INTERVAL / 2:  # Allow for jitter
+                    last_meter = now
+                else:
+                    meter = None
+                chunk = ''.join(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" for event in events
+                                if event['type'] != 'meter' or event is meter)
+                if chunk:
+                    yield chunk
+        finally:
+            release()
+
+    response = Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    response.call_on_close(release)  # Also when the client leaves before the stream started
+    return response
+
 @app.route('/data/audio/<path:filename>')
 def serve_audio(filename):
     default_static_audio_path = os.path.join(app.root_path, DEFAULT_AUDIO_UPLOAD_FOLDER_NAME)
@@ -885,6 +1337,26 @@ def serve_audio(filename):
             abort(404)
 
 #Helpers
+def _with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # Always revalidate, the ETag makes that cheap
+    return response
+
+
+def _conditional_json(etag, build_payload):
+    """Answers 304 Not Modified if the client already has this version, without serializing the payload."""
+    if request.if_none_match.contains(etag):
+        return _with_etag(app.response_class(status=304), etag)
+    return _with_etag(jsonify(build_payload()), etag)
+
+
+def _if_match_failed(current_etag):
+    return 'If-Match' in request.headers and not request.if_match.contains(current_etag)
+
+
+def _precondition_failed(what):
+    return jsonify(error=f"{what} was changed on another device. Reload and try again."), 412
+
 @app.template_filter('format_duration')
 def format_duration_filter(seconds):
     try:
@@ -893,19 +1365,5 @@ def format_duration_filter(seconds):
     except:
         return "0:00"
 
-def _get_setlist_and_songs_data(setlist_id, fetch_songs=False):
-    setlist_data_file = os.path.join(DATA_DIR, SETLISTS_FILE)
-    setlists_data = read_json(setlist_data_file, SETLISTS_CACHE_KEY)
-    setlist = next((s for s in setlists_data.get('setlists', []) if isinstance(s, dict) and s.get('id') == setlist_id),
-                   None)
-    if not setlist: return None, None
-    songs_data_content = None
-    if fetch_songs:
-        songs_data_file = os.path.join(DATA_DIR, SONGS_FILE)
-        songs_data_content = read_json(songs_data_file, SONGS_CACHE_KEY)
-        if not isinstance(songs_data_content, dict) or 'songs' not in songs_data_content: songs_data_content = {
-            'songs': []}
-    return setlist, songs_data_content
-
 
 
@@ -0,0 +1,209 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+
+DEFAULT_POLL_INTERVAL = 5.0  # Seconds between rescans when inotify is not available
+STOP_CHECK_INTERVAL = 1.0
+
+# inotify(7)
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_libc_inotify():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_libc_inotify()
+
+
+class AudioDirectoryIndex:
+    """
+    In-memory listing of the audio folder (name -> size, mtime_ns) kept current by a
+    background watcher, using inotify on Linux and periodic rescans elsewhere. Every
+    change bumps version, which callers can use as a cache validator.
+    is_audio_file(name) selects which directory entries are listed.
+    """
+
+    def __init__(self, is_audio_file, poll_interval=DEFAULT_POLL_INTERVAL):
+        self._is_audio_file = is_audio_file
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._folder = None
+        self._entries = {}
+        self._sorted_entries = []
+        self._dir_mtime_ns = None
+        self.version = 0
+        self._stop_event = None
+        self._thread = None
+
+    def set_folder(self, folder):
+        """Rebuilds the index for folder and (re)starts the watcher on it."""
+        folder = os.path.abspath(folder)
+        with self._lock:
+            if folder == self._folder and self._thread and self._thread.is_alive():
+                return
+            self._stop_watcher()
+            self._folder = folder
+            self._entries, self._sorted_entries, self._dir_mtime_ns = {}, [], None
+            self.version += 1
+        self._scan(folder)
+        with self._lock:
+            if folder != self._folder:
+                return
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(target=self._watch, args=(folder, self._stop_event),
+                                            daemon=True, name='AudioDirectoryWatcher')
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stop_watcher()
+
+    def _stop_watcher(self):
+        if self._stop_event:
+            self._stop_event.set()
+        self._stop_event = self._thread = None
+
+    def files(self):
+        """(version, [(name, size, mtime_ns)] sorted by name) for the current folder."""
+        folder = self._folder
+        if folder is None:
+            return self.version, []
+        # One stat catches creates/deletes the watcher hasn't delivered yet (or a slow poll interval)
+        try:
+            if os.stat(folder).st_mtime_ns != self._dir_mtime_ns:
+                self._scan(folder)
+        except OSError:
+            pass
+        with self._lock:
+            return self.version, self._sorted_entries
+
+    # Scanning
+    def _scan(self, folder):
+        entries = {}
+        try:
+            dir_mtime_ns = os.stat(folder).st_mtime_ns  # Taken first so a change during the scan triggers another
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if self._is_audio_file(entry.name) and entry.is_file():
+                        st = entry.stat()
+                        entries[entry.name] = (st.st_size, st.st_mtime_ns)
+        except OSError as e:
+            logging.error(f"AudioDirectoryIndex: Error scanning {folder}: {e}")
+            return
+        with self._lock:
+            if folder != self._folder:
+                return
+            self._dir_mtime_ns = dir_mtime_ns
+            if entries != self._entries:
+                self._entries = entries
+                self._changed()
+
+    def _update_entry(self, folder, name):
+        if not self._is_audio_file(name):
+            return
+        try:
+            st = os.stat(os.path.join(folder, name))
+            value = (st.st_size, st.st_mtime_ns) if os.path.isfile(os.path.join(folder, name)) else None
+        except OSError:
+            value = None
+        with self._lock:
+            if folder != self._folder or self._entries.get(name) == value:
+                return
+            if value is None:
+                self._entries.pop(name, None)
+            else:
+                self._entries[name] = value
+            self._changed()
+
+    def _changed(self):
+        self._sorted_entries = [(name, size, mtime_ns) for name, (size, mtime_ns) in sorted(self._entries.items())]
+        self.version += 1
+
+    # Watching
+    def _open_inotify(self, folder):
+        if _libc is None:
+            return None
+        fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            logging.warning(f"AudioDirectoryIndex: inotify_init1 failed (errno {ctypes.get_errno()}). Polling instead.")
+            return None
+        if _libc.inotify_add_watch(fd, os.fsencode(folder), WATCH_MASK) < 0:
+            logging.warning(f"AudioDirectoryIndex: Cannot watch {folder} (errno {ctypes.get_errno()}). Polling instead.")
+            os.close(fd)
+            return None
+        return fd
+
+    def _watch(self, folder, stop_event):
+        fd = self._open_inotify(folder)
+        if fd is not None:
+            self._scan(folder)  # Catch anything that changed between the first scan and the watch
+        logging.info(f"AudioDirectoryIndex: Watching {folder} ({'inotify' if fd is not None else 'polling'}).")
+        try:
+            while not stop_event.is_set():
+                if fd is None:
+                    if not stop_event.wait(self.poll_interval):
+                        self._scan(folder)
+                    continue
+                if not select.select([fd], [], [], STOP_CHECK_INTERVAL)[0]:
+                    continue
+                try:
+                    buf = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                names, rescan, watch_lost = self._parse_events(buf)
+                if rescan:
+                    self._scan(folder)
+                else:
+                    for name in names:
+                        self._update_entry(folder, name)
+                if watch_lost:  # Folder deleted or moved away; keep the listing honest by polling
+                    os.close(fd)
+                    fd = None
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    @staticmethod
+    def _parse_events(buf):
+        names, rescan, watch_lost, offset = set(), False, False, 0
+        while offset + _EVENT_HEADER.size <= len(buf):
+            _, mask, _, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(buf[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                rescan = True
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                rescan = watch_lost = True
+            elif name:
+                names.add(name)
+        return names, rescan, watch_lost
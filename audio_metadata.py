@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import threading
+
+from persistence import atomic_write
+
+INDEX_FORMAT_VERSION = 1
+
+
+class AudioMetadataIndex:
+    """
+    Persistent per-file audio metadata (duration, channels, native sample rate, codec)
+    keyed by absolute path and validated against the file's (size, mtime_ns), so a
+    song's duration or a stem's channel count never needs a decoder once known.
+    probe_func(file_path) returns a metadata dict or None and is only called for
+    files that are new or changed since they were last probed.
+    """
+
+    def __init__(self, index_path, probe_func):
+        self.index_path = index_path
+        self._probe = probe_func
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._dirty = False
+        self._hits = self._probes = 0
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read audio metadata index {self.index_path}: {e}. Starting empty.")
+            return {}
+        if not isinstance(data, dict) or data.get('version') != INDEX_FORMAT_VERSION:
+            return {}
+        # Files deleted since the last run are dropped so the index doesn't grow forever
+        return {path: entry for path, entry in data.get('files', {}).items() if os.path.exists(path)}
+
+    def get(self, file_path):
+        """Metadata for file_path, probing it only if it is unknown or changed. None if unreadable."""
+        file_path = os.path.abspath(file_path)
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+                self._hits += 1
+                return entry
+        metadata = self._probe(file_path)
+        if metadata is None:
+            return None
+        with self._lock:
+            self._probes += 1
+        return self._store(file_path, st, metadata)
+
+    def put(self, file_path, metadata):
+        """Records metadata read by someone who already had the file open."""
+        file_path = os.path.abspath(file_path)
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        return self._store(file_path, st, metadata)
+
+    def _store(self, file_path, st, metadata):
+        entry = dict(metadata, size=st.st_size, mtime_ns=st.st_mtime_ns)
+        with self._lock:
+            if self._entries.get(file_path) != entry:
+                self._entries[file_path] = entry
+                self._dirty = True
+        return entry
+
+    def peek(self, file_path, size=None, mtime_ns=None):
+        """
+        Metadata for file_path if it is already indexed and current, without probing.
+        Pass size and mtime_ns when they are already known to skip the stat.
+        """
+        if size is None or mtime_ns is None:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                return None
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(os.path.abspath(file_path))
+        if entry and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+            return entry
+        return None
+
+    def save(self):
+        """Writes the index if anything was probed since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return True
+            body = json.dumps({'version': INDEX_FORMAT_VERSION, 'files': self._entries})
+            self._dirty = False
+        try:
+            atomic_write(self.index_path, body)
+            return True
+        except OSError as e:
+            logging.error(f"Error writing audio metadata index {self.index_path}: {e}")
+            with self._lock:
+                self._dirty = True
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self._hits, 'probes': self._probes, 'entries': len(self._entries)}
@@ -1,43 +1,131 @@
 import os
-import gc
+import hashlib
+import stat
+import json
 import threading
 import logging
 import contextlib
+import math
 import time
+from array import array
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from operator import mul
 import traceback
-from ctypes import c_float, byref
+from ctypes import addressof, c_float, byref, create_string_buffer
 from pathlib import Path
 
 from modpybass.pybass import *
 from modpybass.pybassmix import *
 
-if not hasattr(sys.modules[__name__], 'BASS_DEVICE_LOOPBACK'): BASS_DEVICE_LOOPBACK = 8
+from audio_metadata import AudioMetadataIndex
+from playback_events import PlaybackEvents
+from preload_jobs import PreloadJobs
+from prepared_songs import DEFAULT_HANDLE_BUDGET, DEFAULT_MEMORY_BUDGET_MB, PreparedSongCache
+from ram_samples import DEFAULT_RAM_BUDGET_MB, RamSampleStore
+from render_cache import DEFAULT_RENDER_CACHE_MB, MAX_WAV_DATA_SIZE, RENDER_CACHE_DIR_NAME, RenderCache, wav_float_header
+from song_bounce import BOUNCE_DIR_NAME, PARTIAL_SUFFIX, BounceStore
+from song_pack import PARTIAL_SUFFIX as PACK_PARTIAL_SUFFIX, PackStore, interleave_into, silent_frames
 
-callback_lock = threading.Lock()
+if not hasattr(sys.modules[__name__], 'BASS_DEVICE_LOOPBACK'): BASS_DEVICE_LOOPBACK = 8
+if not hasattr(sys.modules[__name__], 'BASS_SYNC_DEV_FAIL'): BASS_SYNC_DEV_FAIL = 14
+if not hasattr(sys.modules[__name__], 'BASS_POS_MIXER_RESET'): BASS_POS_MIXER_RESET = 0x10000
+
+TRACK_LOADER_WORKERS = 8  # Stem files opened and probed in parallel while preparing a song
+# Rough memory held by a prepared song, used for the prepared-song cache budget
+SOURCE_STREAM_MEMORY_ESTIMATE = 256 * 1024
+MIXER_MEMORY_ESTIMATE = 1024 * 1024
+RENDER_CHUNK_SIZE = 256 * 1024
+PCM_CODECS = ('wav', 'wav_float')
+PACK_CHUNK_FRAMES = 16384
+OUTPUT_RELEASE_DELAY = 1.0  # Seconds the outputs keep running after the last song is heard ending
+TRANSITION_GRACE = 1.0  # Seconds a song that ended waits for the queued song's sync before playback stops
+METER_INTERVAL = 0.1  # Seconds between 'meter' events while playing
+METER_WINDOW = 0.05  # Seconds of each output's playback buffer the levels are measured over
+START_SKEW_MEASURE_DELAY = 0.25  # Seconds after a multi-device start at which the start skew is read
+MIN_LOOP_LENGTH = 0.05  # Seconds; shorter loop regions are refused
+MIX_RAMP = 0.05  # Seconds a live track volume change on a playing song is ramped over, so faders don't click
+# 16-bit like the output mixers they feed, so a hot mix clips the same way in a bounce as it does live
+DEVICE_MIXER_FLAGS = BASS_STREAM_DECODE | BASS_MIXER_END
+
+# Codec names by BASS_CHANNELINFO.ctype; the add-on constants live in plugin modules that aren't imported here
+CODEC_NAMES = {BASS_CTYPE_STREAM_OGG: 'ogg', BASS_CTYPE_STREAM_MP3: 'mp3', BASS_CTYPE_STREAM_AIFF: 'aiff',
+               BASS_CTYPE_STREAM_WAV_PCM: 'wav', BASS_CTYPE_STREAM_WAV_FLOAT: 'wav_float',
+               0x10900: 'flac', 0x10901: 'flac_ogg', 0x10b00: 'aac', 0x10b01: 'mp4'}
 
 
 class AudioPlayer:
     def __init__(self, root_path, initial_audio_upload_folder_config,
-                 songs_data_provider_func, settings_data_provider_func,
-                 max_logical_channels_const, default_sample_rate_const):
+                 song_provider_func, settings_data_provider_func,
+                 max_logical_channels_const, default_sample_rate_const, metadata_index_path):
         self.root_path = root_path
         self.current_audio_upload_folder_config_path = initial_audio_upload_folder_config
-        self.get_songs_data = songs_data_provider_func
+        self.get_song = song_provider_func
         self.get_settings_data = settings_data_provider_func
         self.MAX_LOGICAL_CHANNELS = max_logical_channels_const
         self.DEFAULT_SAMPLE_RATE = default_sample_rate_const
         self.initialized_devices = set()
+        # Guards the playback state and the prepared-song cache. Only held for quick BASS calls: files are
+        # opened, songs prepared and handles freed without it, so stop() never waits on a preparation.
+        self._state_lock = threading.Lock()
+        self._garbage = []  # (release, item) of prepared songs and output mixers dropped under the state lock
+        self._start_lock = threading.Lock()  # One play_preloaded_song at a time; never taken under the state lock
+        self._start_token = None  # The start in progress; _unarm() cancels it
+        self._starting_entry = None
+        self._cache_generation = 0  # Bumped when every prepared song becomes invalid
+        self._song_generations = defaultdict(int)  # Bumped when a song's prepared copies become invalid
+        self._jobs_lock = threading.Lock()
         current_settings = self.get_settings_data()
         self.audio_outputs = current_settings.get('audio_outputs', [])
         self._current_global_volume = float(current_settings.get('volume', 1.0))
         self.target_sample_rate = int(current_settings.get('sample_rate', self.DEFAULT_SAMPLE_RATE))
+        self.ram_mode = bool(current_settings.get('ram_mode', False))
+        self.premix_songs = bool(current_settings.get('premix_songs', False))
+        self.pack_songs = bool(current_settings.get('pack_songs', False))
+        self.synchronized_start = bool(current_settings.get('synchronized_start', True))
+        self.render_files = bool(current_settings.get('render_cache', False))
+        self._render_sources = []  # Audio files the library references, rendered while render_files is on
+        self.last_start_report = None
+        self._ram_samples = RamSampleStore(self._ram_budget(current_settings))
         self._preloaded_song_id = None
         self._preloaded_mixers = {}
         self._active_mixer_handles = []
         self._is_song_preloaded = False
         self._playback_active = False
-        self._playback_monitor_thread = None
+        self.metadata_index = AudioMetadataIndex(metadata_index_path, self._probe_audio_file)
+        self._track_loader = ThreadPoolExecutor(max_workers=TRACK_LOADER_WORKERS, thread_name_prefix='TrackLoader')
+        self.last_prepare_timings = {}
+        self._prepared = PreparedSongCache(self._free_prepared_entry, *self._prepared_cache_budget(current_settings))
+        self._preloaded_entry = None  # The armed entry of the prepared-song cache
+        self._playing_entry = None
+        self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='SongPrefetch')
+        self.render_cache = RenderCache(self._render_audio_file, self._needs_render,
+                                        self._render_cache_budget(current_settings))
+        self.render_cache.set_folder(self._render_cache_folder())
+        self.bounces = BounceStore()
+        self.bounces.set_folder(self._bounce_folder())
+        self.packs = PackStore()
+        self.packs.set_folder(self._get_resolved_audio_upload_folder_abs())
+        self._offline_jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix='OfflineMix')
+        self._offline_pending = set()
+        self._output_mixers = {}  # device_id -> playing mixer the songs' device mixers are plugged into
+        self._plugged_mixers = set()
+        self._queued = None  # The song set to start from a sync when the playing one ends
+        self._transition_plan = []
+        self._ending_entries = []  # Songs still fading out or ending under the next one
+        self._transition_sync_proc = SYNCPROC(self._on_transition_sync)  # Must outlive every sync using it
+        self._watched_mixers = {}  # Plugged song mixer -> (song_id, device_id, its sync handles)
+        self._end_sync_proc = SYNCPROC(self._on_mixer_end_sync)
+        self._stall_sync_proc = SYNCPROC(self._on_mixer_stall_sync)
+        self._device_fail_sync_proc = SYNCPROC(self._on_device_fail_sync)
+        self.events = PlaybackEvents()
+        self.events.subscribe(self._on_playback_event)
+        self.preload_jobs = PreloadJobs(self._run_preload_job)
+        self._meter_thread = None
+        self._paused = False
+        self._loop = None  # The loop region of the playing song and the syncs that jump back to its start
+        self._loop_sync_proc = SYNCPROC(self._on_loop_sync)
+        self._track_mix = {}  # song_id -> {track_id: live 'volume', 'muted' and 'solo'}, never persisted
 
     def _get_resolved_audio_upload_folder_abs(self):
         configured_path = self.current_audio_upload_folder_config_path
@@ -53,14 +141,16 @@ class AudioPlayer:
         return abs_path
 
     def update_audio_upload_folder_config(self, new_path_config_value):
-        with callback_lock:
+        with self._locked_state():
             old_path = self.current_audio_upload_folder_config_path
             self.current_audio_upload_folder_config_path = new_path_config_value
             logging.info(
                 f"AudioPlayer: Audio upload folder config updated from '{old_path}' to '{new_path_config_value}'.")
-            if self._is_song_preloaded or self._preloaded_mixers:
-                logging.info("AudioPlayer: Clearing preload state due to audio folder change.")
-                self.clear_preload_state(acquire_lock=False)  # Already under lock
+            logging.info("AudioPlayer: Clearing prepared songs due to audio folder change.")
+            self.clear_prepared_songs(acquire_lock=False)  # Already under lock
+        self.render_cache.set_folder(self._render_cache_folder())
+        self.bounces.set_folder(self._bounce_folder())
+        self.packs.set_folder(self._get_resolved_audio_upload_folder_abs())
 
     def initialize_bass(self):
         current_settings = self.get_settings_data()
@@ -113,7 +203,7 @@ class AudioPlayer:
             f"BASS context ready. Global Vol: {self._current_global_volume:.2f}. Initialized devices: {self.initialized_devices}. Audio folder config: {self.current_audio_upload_folder_config_path}")
 
     def update_settings(self):
-        with callback_lock:
+        with self._locked_state():
             current_settings = self.get_settings_data()
             old_sr, old_vol, old_outputs = self.target_sample_rate, self._current_global_volume, self.audio_outputs
             old_audio_path_config = self.current_audio_upload_folder_config_path
@@ -135,12 +225,34 @@ class AudioPlayer:
                 self.current_audio_upload_folder_config_path = new_audio_path_config
                 settings_changed_requiring_preload_clear = True
             if settings_changed_requiring_preload_clear:
-                logging.info("Audio settings affecting playback changed. Clearing preload state.")
-                self.clear_preload_state(acquire_lock=False)  # Already under lock
+                logging.info("Audio settings affecting playback changed. Clearing prepared songs.")
+                self.clear_prepared_songs(acquire_lock=False)  # Already under lock
+            self._prepared.set_budget(*self._prepared_cache_budget(current_settings), pinned=self._pinned_keys())
+            # Songs prepared in the other mode stay usable; new preparations follow the setting
+            self.ram_mode = bool(current_settings.get('ram_mode', False))
+            self.premix_songs = bool(current_settings.get('premix_songs', False))
+            self.pack_songs = bool(current_settings.get('pack_songs', False))
+            self.synchronized_start = bool(current_settings.get('synchronized_start', True))
+            old_render_files, self.render_files = self.render_files, bool(current_settings.get('render_cache', False))
+            self._ram_samples.set_budget(self._ram_budget(current_settings))
             if abs(old_vol - self._current_global_volume) > 1e-6:
                 BASS_SetConfig(BASS_CONFIG_GVOL_STREAM, int(self._current_global_volume * 10000))
             logging.debug(
                 f"AudioPlayer settings updated: {len(self.audio_outputs)} outputs, Vol:{self._current_global_volume:.2f}, SR:{self.target_sample_rate} Hz, AudioPath: {self.current_audio_upload_folder_config_path}")
+        self.render_cache.set_budget(self._render_cache_budget(current_settings))
+        if old_audio_path_config != new_audio_path_config:
+            self.render_cache.set_folder(self._render_cache_folder())
+            self.bounces.set_folder(self._bounce_folder())
+            self.packs.set_folder(self._get_resolved_audio_upload_folder_abs())
+        elif old_render_files != self.render_files:
+            self.sync_render_cache(self._render_sources)  # Turning it off deletes the renders
+        elif old_sr != self.target_sample_rate:
+            self.render_cache.sync(self.render_cache.wanted(), self.target_sample_rate)  # Renders at the old rate go
+        if old_audio_path_config == new_audio_path_config and (old_sr, old_outputs) != (self.target_sample_rate,
+                                                                                        self.audio_outputs):
+            self.bounces.purge()  # Every bounce was mixed for the old routing or rate
+        if old_audio_path_config == new_audio_path_config and old_sr != self.target_sample_rate:
+            self.packs.purge()  # Packs hold the stems resampled to the old rate
 
     def _build_logical_channel_map(self):
         logging.debug("Building logical channel map...")
@@ -168,78 +280,984 @@ class AudioPlayer:
         logging.debug(f"Finished building logical channel map: {logical_map}")
         return logical_map
 
-    def prepare_song(self, song_id):
+    def prepare_song(self, song_id, arm=True, job=None):
+        """
+        Makes song_id ready to play, from the prepared-song cache if possible. With arm
+        the song also becomes the preloaded one that play_preloaded_song starts. A
+        PreloadJob passed as job gets per-track progress; cancelling it stops the
+        preparation before its files are attached, or at least keeps it from arming.
+        """
         # Get song data and validate
-        songs_data = self.get_songs_data()
-        song = next((s for s in songs_data.get('songs', []) if s.get('id') == song_id), None)
+        song = self.get_song(song_id)
         if not song:
             logging.error(f"Song {song_id} not found for preparation.")
             return False
 
         # Get audio folder path
         audio_folder = self._get_resolved_audio_upload_folder_abs()
-        logging.info(f"Preparing song {song_id} ('{song.get('name', 'N/A')}') using audio folder: {audio_folder}")
 
         # Validate configuration for songs with audio tracks
         if song.get('audio_tracks') and not self.audio_outputs:
             logging.error("Cannot prepare song: No audio outputs configured in settings.")
             return False
 
-        # Clear any existing loaded song
-        with callback_lock:
-            self.clear_preload_state(acquire_lock=False)
+        # Build channel mapping for audio routing
+        logical_map = self._build_logical_channel_map()
+        if not logical_map and song.get('audio_tracks'):
+            logging.error("Cannot prepare song: Logical channel map is empty but song has audio tracks.")
+            return False
 
-            # Build channel mapping for audio routing
-            logical_map = self._build_logical_channel_map()
-            if not logical_map and song.get('audio_tracks'):
-                logging.error("Cannot prepare song: Logical channel map is empty but song has audio tracks.")
+        file_stats = self._song_file_stats(song, audio_folder)
+        volumes = self._track_volumes(song)
+        bounce_paths = pack = None
+        if self.premix_songs and song.get('audio_tracks'):
+            bounce_key = self._bounce_key(song, file_stats)
+            bounce_paths = self.bounces.lookup(song_id, bounce_key, self._output_devices(logical_map))
+            if bounce_paths is None:
+                self._schedule_offline_job(self._bounce_song, song_id)
+        if self.pack_songs and not bounce_paths and song.get('audio_tracks'):
+            pack = self.packs.lookup(song_id, self._pack_key(self._song_pack_files(song, audio_folder)))
+            if pack is None:
+                self._schedule_offline_job(self._pack_song, song_id)
+        fingerprint = self._song_fingerprint(song, audio_folder, file_stats, [bounce_paths, pack and pack[0]])
+        with self._locked_state():
+            cached = self._prepared.get(song_id, fingerprint)
+            if cached is not None and cached['played'] and not self._entry_in_use(cached) \
+                    and cached is not self._preloaded_entry:
+                self._prepared.detach(cached)  # Out of reach while it is rewound without the lock
+            elif self._use_prepared_entry(cached, arm, volumes):
+                logging.info(f"Song {song_id} ('{song.get('name', 'N/A')}') served from the prepared-song cache.")
+                if job is not None:
+                    job.settle_tracks('ready')
+                return True
+            else:
+                cached = None
+            generation = self._prepare_generation(song_id)
+        if cached is not None:
+            if not self._rewind_prepared_entry(cached):
+                logging.warning(f"Could not rewind prepared song {song_id}. Preparing it again.")
+                self._release_prepared_entry(cached)
+            else:
+                with self._locked_state():
+                    swapped = self._swap_in_prepared(cached, generation, arm, volumes)
+                if not swapped:
+                    return self.prepare_song(song_id, arm, job)
+                logging.info(f"Song {song_id} ('{song.get('name', 'N/A')}') served from the prepared-song cache.")
+                if job is not None:
+                    job.settle_tracks('ready')
+                return True
+        if job is not None and job.cancelled:
+            return False
+        logging.info(f"Preparing song {song_id} ('{song.get('name', 'N/A')}') using audio folder: {audio_folder}"
+                     f"{' from its pre-mixed bounce' if bounce_paths else ' from its pack' if pack else ''}")
+
+        # Open every track file once, concurrently and without the lock; playback keeps running meanwhile
+        timings = {'tracks': len(song.get('audio_tracks', [])), 'premixed': bool(bounce_paths), 'packed': bool(pack)}
+        prepare_start = phase_start = time.perf_counter()
+        if bounce_paths:
+            sources = self._open_bounce_sources(bounce_paths)
+        elif pack:
+            sources = self._open_packed_sources(song, pack, logical_map)
+        else:
+            sources = self._open_track_sources(song, audio_folder, logical_map, job)
+        timings['open_ms'] = (time.perf_counter() - phase_start) * 1000
+        if job is not None:
+            if bounce_paths or pack:
+                job.settle_tracks('ready' if any(sources) else 'failed')  # A bounce or pack opens all tracks at once
+            if job.cancelled:
+                logging.info(f"Preparation of song {song_id} cancelled.")
+                self._free_track_sources(sources)
+                return False
+
+        # The song's own mixers are built without the lock too; only swapping the result in is serialized
+        mixer_info = {}
+        try:
+            # Create output mixers for each audio device
+            phase_start = time.perf_counter()
+            mixer_info = self._create_device_mixers(logical_map)
+            timings['mixers_ms'] = (time.perf_counter() - phase_start) * 1000
+            if not mixer_info and song.get('audio_tracks'):
+                logging.error("Failed to create any device mixers.")
+                self._free_track_sources(sources)
                 return False
 
-            # Create mixers and load tracks
+            # Attach the opened tracks
+            phase_start = time.perf_counter()
+            streams = self._attach_track_sources(sources, logical_map, mixer_info)
+            timings['attach_ms'] = (time.perf_counter() - phase_start) * 1000
+            shared_sources = self._shared_sources(sources)
+            attached = set(streams)
+            device_streams, track_streams = defaultdict(list), {}
+            for source in sources:
+                if source is not None and source['stream'] in attached:
+                    device_streams[source['device_id']].append(source['stream'])
+                    track_id = None if source.get('premixed') else song['audio_tracks'][source['track_idx']].get('id')
+                    if track_id is not None:
+                        track_streams[track_id] = source['stream']
+            if song.get('audio_tracks') and not streams:
+                self._free_streams(shared_sources)
+                self._cleanup_mixers(mixer_info)
+                return False
+
+            decodes = streams + shared_sources
+            ram_bytes = sum(self._ram_samples.held(stream) for stream in decodes)
+            entry = {'song_id': song_id, 'fingerprint': fingerprint, 'mixers': mixer_info, 'streams': streams,
+                     'shared_sources': shared_sources, 'device_streams': dict(device_streams),
+                     'routing': self._track_routing(song), 'premixed': bool(bounce_paths),
+                     'track_streams': track_streams, 'track_volumes': volumes, 'track_gains': dict(volumes),
+                     'memory': ram_bytes + len(decodes) * SOURCE_STREAM_MEMORY_ESTIMATE +
+                               len(mixer_info) * MIXER_MEMORY_ESTIMATE,
+                     'ram_bytes': ram_bytes, 'handles': len(decodes) + len(mixer_info), 'played': False}
+        except Exception as e:
+            logging.error(f"Exception during song preparation for ID {song_id}: {e}")
+            traceback.print_exc()
+            self._free_track_sources(sources)
+            self._cleanup_mixers(mixer_info)
+            return False
+        finally:
+            timings['total_ms'] = (time.perf_counter() - prepare_start) * 1000
+            self.last_prepare_timings = timings
+            logging.info(f"Prepare timings for song {song_id}: " +
+                         ", ".join(f"{k}={v:.1f}" if type(v) is float else f"{k}={v}" for k, v in timings.items()))
+
+        with self._locked_state():
+            # A job cancelled by now still leaves the song cached, just not armed
+            swapped = self._swap_in_prepared(entry, generation, arm and not (job is not None and job.cancelled),
+                                             volumes)
+        if not swapped:
+            return self.prepare_song(song_id, arm, job)
+        logging.info(f"Song '{song.get('name')}' (ID: {song_id}) prepared successfully with "
+                     f"{len(streams)} of {len(sources)} track(s).")
+        return True
+
+    @contextlib.contextmanager
+    def _locked_state(self):
+        """
+        Holds the state lock. Prepared songs and output mixers dropped meanwhile are
+        freed after it is released, so no BASS_StreamFree runs under it.
+        """
+        garbage = []
+        try:
+            with self._state_lock:
+                try:
+                    yield
+                finally:
+                    garbage, self._garbage = self._garbage, []
+        finally:
+            for release, item in garbage:
+                release(item)
+
+    def _prepare_generation(self, song_id):
+        return self._cache_generation, self._song_generations[song_id]
+
+    def _swap_in_prepared(self, entry, generation, arm, volumes):
+        """
+        Caches (and with arm, arms) a song prepared or rewound without the lock. If the
+        song or the settings changed meanwhile, entry is freed and False returned so the
+        caller prepares it again. Caller holds the state lock.
+        """
+        if self._prepare_generation(entry['song_id']) != generation:
+            logging.info(f"Song {entry['song_id']} changed while it was being prepared. Preparing it again.")
+            self._free_prepared_entry(entry)
+            return False
+        current = self._prepared.peek(entry['song_id'], entry['fingerprint'])
+        if current is not None and current is not entry:
+            self._free_prepared_entry(entry)  # Someone else (e.g. the lookahead) finished the same song meanwhile
+            entry = current
+        else:
+            self._prepared.put(entry, pinned=self._pinned_keys())
+        self._use_prepared_entry(entry, arm, volumes)
+        return True
+
+    def _use_prepared_entry(self, entry, arm, volumes):
+        """
+        Brings entry, a cached prepared song, up to the song's track volumes and live mix
+        and arms it if requested. Caller holds the state lock.
+        """
+        if entry is None:
+            return False
+        self._apply_track_mix(entry, volumes)
+        if arm:
+            self._set_song_as_prepared(entry)
+        return True
+
+    @staticmethod
+    def _song_file_stats(song, audio_folder):
+        file_stats = []
+        for track in song.get('audio_tracks', []):
             try:
-                # Create output mixers for each audio device
-                mixer_info = self._create_device_mixers(logical_map)
-                if not mixer_info and song.get('audio_tracks'):
-                    logging.error("Failed to create any device mixers.")
-                    return False
+                st = os.stat(os.path.join(audio_folder, track.get('file_path') or ''))
+                file_stats.append((st.st_size, st.st_mtime_ns))
+            except OSError:
+                file_stats.append(None)
+        return file_stats
+
+    def _song_fingerprint(self, song, audio_folder, file_stats, offline_files):
+        """Everything a prepared song depends on: its tracks and files, routing, sample rate and folder."""
+        # A bounce that finished since the song was prepared makes it prepare anew. A render does not:
+        # it plays the same audio, so it is picked up the next time the song is prepared anyway.
+        payload = [self._track_routing(song), file_stats, self.audio_outputs, self.target_sample_rate,
+                   audio_folder, self.ram_mode, offline_files]
+        return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
 
-                # Handle songs with no audio (metadata only)
-                if not song.get('audio_tracks'):
-                    self._set_song_as_prepared(song_id, mixer_info)
-                    logging.info(f"Song {song_id} prepared successfully (no audio tracks).")
-                    return True
+    @staticmethod
+    def _track_routing(song):
+        """A song's tracks without their volumes, which _apply_track_mix changes on prepared songs."""
+        return [{key: value for key, value in track.items() if key != 'volume'}
+                for track in song.get('audio_tracks', [])]
 
-                # Load all audio tracks
-                if self._load_audio_tracks(song, audio_folder, logical_map, mixer_info):
-                    self._set_song_as_prepared(song_id, mixer_info)
-                    logging.info(
-                        f"Song '{song.get('name')}' (ID: {song_id}) prepared successfully with {len(song.get('audio_tracks', []))} track(s).")
-                    return True
-                else:
-                    self._cleanup_mixers(mixer_info)
-                    return False
+    @staticmethod
+    def _track_volumes(song):
+        return {track['id']: float(track.get('volume', 1.0)) for track in song.get('audio_tracks', [])
+                if track.get('id') is not None}
 
-            except Exception as e:
-                logging.error(f"Exception during song preparation for ID {song_id}: {e}")
-                traceback.print_exc()
-                if 'mixer_info' in locals():
-                    self._cleanup_mixers(mixer_info)
+    def _bounce_key(self, song, file_stats):
+        """Everything a bounce's mix depends on."""
+        payload = [song.get('audio_tracks', []), file_stats, self.audio_outputs, self.target_sample_rate,
+                   DEVICE_MIXER_FLAGS]
+        return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _ram_budget(settings):
+        return int(settings.get('ram_budget_mb', DEFAULT_RAM_BUDGET_MB)) * 1024 * 1024
+
+    @staticmethod
+    def _render_cache_budget(settings):
+        return int(settings.get('render_cache_mb', DEFAULT_RENDER_CACHE_MB)) * 1024 * 1024
+
+    @staticmethod
+    def _prepared_cache_budget(settings):
+        memory_mb = settings.get('prepared_cache_memory_mb', DEFAULT_MEMORY_BUDGET_MB)
+        return int(memory_mb) * 1024 * 1024, int(settings.get('prepared_cache_max_handles', DEFAULT_HANDLE_BUDGET))
+
+    def _pinned_keys(self):
+        queued_entry = self._queued['entry'] if self._queued is not None else None
+        return {PreparedSongCache.key(e) for e in (self._preloaded_entry, self._playing_entry, queued_entry,
+                                                   self._starting_entry, *self._ending_entries) if e is not None}
+
+    @classmethod
+    def _rewind_prepared_entry(cls, entry):
+        ok = cls._position_entry(entry, 0.0)
+        if ok:
+            entry['played'] = False
+        return ok
+
+    @classmethod
+    def _position_entry(cls, entry, seconds, plugged=()):
+        """
+        Sets every source stream and device mixer of a prepared song to seconds, a time
+        from _frame_time. Mixers in plugged also drop what their output mixer buffered.
+        """
+        ok = True
+        for dev_id, mixer in entry['mixers'].items():
+            if mixer:
+                ok = cls._position_mixer(mixer, entry['device_streams'].get(dev_id, ()), seconds,
+                                         reset_output=mixer in plugged) and ok
+        return ok
+
+    @staticmethod
+    def _position_mixer(mixer, streams, seconds, reset_output=False):
+        ok = True
+        for stream in streams:
+            ok = BASS_Mixer_ChannelSetPosition(stream, BASS_ChannelSeconds2Bytes(stream, seconds), BASS_POS_BYTE) and ok
+        pos = BASS_ChannelSeconds2Bytes(mixer, seconds)
+        if reset_output:
+            return BASS_Mixer_ChannelSetPosition(mixer, pos, BASS_POS_BYTE | BASS_POS_MIXER_RESET) and ok
+        return BASS_ChannelSetPosition(mixer, pos, BASS_POS_BYTE) and ok  # Also drops the mixer's buffered audio
+
+    def _frame_time(self, seconds):
+        """
+        seconds moved to the middle of its output frame, so every stream converts it to
+        the same frame however BASS_ChannelSeconds2Bytes rounds.
+        """
+        return (math.floor(seconds * self.target_sample_rate) + 0.5) / self.target_sample_rate
+
+    def _render_cache_folder(self):
+        return os.path.join(os.path.dirname(self._get_resolved_audio_upload_folder_abs()), RENDER_CACHE_DIR_NAME)
+
+    def sync_render_cache(self, file_paths):
+        """
+        Keeps the referenced audio files (relative to the audio folder) rendered at the current sample rate,
+        or deletes every render when the render cache is turned off.
+        """
+        self._render_sources = list(file_paths)
+        audio_folder = self._get_resolved_audio_upload_folder_abs()
+        wanted = [os.path.join(audio_folder, p) for p in self._render_sources] if self.render_files else []
+        self.render_cache.sync(wanted, self.target_sample_rate)
+
+    def _needs_render(self, file_path_abs, sample_rate):
+        metadata = self.metadata_index.get(file_path_abs)
+        if metadata is None:
+            return False
+        return not (metadata.get('codec') in PCM_CODECS and metadata.get('sample_rate') == sample_rate)
+
+    def _render_audio_file(self, source_path, target_path, sample_rate):
+        """Decodes source_path once and resamples it to sample_rate into a 32-bit float WAV. Runs on the render worker."""
+        source = BASS_StreamCreateFile(False, source_path.encode('utf-8'), 0, 0, BASS_STREAM_DECODE | BASS_SAMPLE_FLOAT)
+        if not source:
+            logging.warning(f"Could not open '{source_path}' for rendering. Error: {BASS_ErrorGetCode()}")
+            return False
+        mixer = 0
+        try:
+            info = BASS_CHANNELINFO()
+            if not BASS_ChannelGetInfo(source, byref(info)):
                 return False
+            # A decoding mixer at the target rate does the resampling, exactly as live playback would
+            mixer = BASS_Mixer_StreamCreate(sample_rate, info.chans,
+                                            BASS_STREAM_DECODE | BASS_SAMPLE_FLOAT | BASS_MIXER_END)
+            if not mixer or not BASS_Mixer_StreamAddChannel(mixer, source, BASS_MIXER_NORAMPIN):
+                logging.warning(f"Could not set up rendering for '{source_path}'. Error: {BASS_ErrorGetCode()}")
+                return False
+            return self._write_decoded_wav(mixer, info.chans, sample_rate, target_path)
+        finally:
+            if mixer:
+                BASS_StreamFree(mixer)
+            BASS_StreamFree(source)
 
-    def _create_device_mixers(self, logical_map):
-        mixers = {}
+    @staticmethod
+    def _write_decoded_wav(channel, channels, sample_rate, target_path):
+        """Drains a decoding channel into a 32-bit float WAV file. Returns whether anything was written."""
+        buffer, data_size = create_string_buffer(RENDER_CHUNK_SIZE), 0
+        with open(target_path, 'wb') as out:
+            out.write(wav_float_header(channels, sample_rate, 0))
+            while True:
+                got = BASS_ChannelGetData(channel, buffer, RENDER_CHUNK_SIZE | BASS_DATA_FLOAT)
+                if got in (0, -1, 0xFFFFFFFF):  # Ended
+                    break
+                data_size += got
+                if data_size > MAX_WAV_DATA_SIZE:
+                    logging.warning(f"'{target_path}' would be too long for a WAV file.")
+                    return False
+                out.write(memoryview(buffer)[:got])
+            out.seek(0)
+            out.write(wav_float_header(channels, sample_rate, data_size))
+        return data_size > 0
 
-        # Calculate how many channels each device needs
+    def _bounce_folder(self):
+        return os.path.join(os.path.dirname(self._get_resolved_audio_upload_folder_abs()), BOUNCE_DIR_NAME)
+
+    def _channels_per_device(self, logical_map):
+        """Output channels each initialized device needs for the current routing."""
         channels_per_device = defaultdict(int)
         for dev_id, physical_idx in logical_map.values():
             channels_per_device[dev_id] = max(channels_per_device[dev_id], physical_idx + 1)
+        return {dev_id: n for dev_id, n in channels_per_device.items() if dev_id in self.initialized_devices and n}
 
-        # Create a mixer for each device
-        for dev_id, num_channels in channels_per_device.items():
-            if dev_id not in self.initialized_devices or num_channels == 0:
+    def _output_devices(self, logical_map):
+        return sorted(self._channels_per_device(logical_map))
+
+    def _schedule_offline_job(self, job, song_id):
+        """Queues a bounce or pack of a song on the offline worker, once."""
+        with self._jobs_lock:
+            if (job, song_id) in self._offline_pending:
+                return
+            self._offline_pending.add((job, song_id))
+        self._offline_jobs.submit(self._run_offline_job, job, song_id)
+
+    def _run_offline_job(self, job, song_id):
+        try:
+            job(song_id)
+        finally:
+            with self._jobs_lock:
+                self._offline_pending.discard((job, song_id))
+
+    def _bounce_song(self, song_id):
+        """
+        Mixes a song offline through decoding copies of its device mixers, built with the
+        same matrices and volumes as live playback, into one multichannel file per device.
+        """
+        try:
+            song = self.get_song(song_id)
+            if not song or not song.get('audio_tracks'):
+                return
+            audio_folder = self._get_resolved_audio_upload_folder_abs()
+            logical_map = self._build_logical_channel_map()
+            channels_per_device = self._channels_per_device(logical_map)
+            key = self._bounce_key(song, self._song_file_stats(song, audio_folder))
+            if not channels_per_device or self.bounces.lookup(song_id, key, sorted(channels_per_device)):
+                return
+            sources = self._open_track_sources(song, audio_folder, logical_map)
+            mixers, streams = {}, []
+            try:
+                for dev_id, num_channels in channels_per_device.items():
+                    mixer = BASS_Mixer_StreamCreate(self.target_sample_rate, num_channels, DEVICE_MIXER_FLAGS)
+                    if not mixer:
+                        logging.error(f"Bounce of song {song_id}: mixer creation failed. Error: {BASS_ErrorGetCode()}")
+                        self.bounces.failed += 1
+                        self._free_track_sources(sources)
+                        return
+                    mixers[dev_id] = mixer
+                streams = self._attach_track_sources(sources, logical_map, mixers)
+                if not streams:
+                    return
+                for dev_id, mixer in mixers.items():
+                    target_path = self.bounces.path(song_id, key, dev_id)
+                    partial_path = target_path + PARTIAL_SUFFIX
+                    os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+                    if not self._write_decoded_wav(mixer, channels_per_device[dev_id], self.target_sample_rate,
+                                                   partial_path):
+                        logging.error(f"Bounce of song {song_id} for device {dev_id} failed.")
+                        self.bounces.failed += 1
+                        os.unlink(partial_path)
+                        return
+                    os.replace(partial_path, target_path)
+                self.bounces.purge(song_id, keep_key=key)
+                self.bounces.bounced += 1
+                logging.info(f"Song {song_id} bounced to {len(mixers)} pre-mixed device file(s).")
+            finally:
+                self._free_streams(streams + self._shared_sources(sources))
+                self._cleanup_mixers(mixers)
+        except Exception as e:
+            logging.error(f"Bounce of song {song_id} failed: {e}")
+            self.bounces.failed += 1
+
+    def _open_bounce_sources(self, bounce_paths):
+        """Opens a song's per-device bounces as sources that feed their device mixer one to one."""
+        sources = []
+        for dev_id, path in bounce_paths.items():
+            stream = self._create_source_stream(path)
+            if not stream:
+                logging.error(f"Failed to open bounce '{path}'. Error: {BASS_ErrorGetCode()}")
+                self._free_track_sources(sources)
+                return []
+            sources.append({'track_idx': f"bounce:{dev_id}", 'file_path': os.path.basename(path), 'stream': stream,
+                            'device_id': dev_id, 'premixed': True})
+        return sources
+
+    @staticmethod
+    def _song_pack_files(song, audio_folder):
+        """
+        Distinct existing files of a song in track order, the channel layout of its pack, each
+        with its (size, mtime_ns). A file that can't be stat'ed is left out like a missing one.
+        """
+        files = {}
+        for file_path in dict.fromkeys(t.get('file_path') for t in song.get('audio_tracks', []) if t.get('file_path')):
+            try:
+                st = os.stat(os.path.join(audio_folder, file_path))
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                files[file_path] = (st.st_size, st.st_mtime_ns)
+        return files
+
+    def _pack_key(self, files):
+        """Everything a pack depends on: the song's files and the sample rate, not its routing or volumes."""
+        payload = [list(files), list(files.values()), self.target_sample_rate]
+        return hashlib.sha1(json.dumps(payload).encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _read_decoded(channel, buffer, length):
+        """Reads up to length bytes from a decoding channel, fewer only at its end."""
+        got = 0
+        while got < length:
+            n = BASS_ChannelGetData(channel, addressof(buffer) + got, (length - got) | BASS_DATA_FLOAT)
+            if n in (0, -1, 0xFFFFFFFF):
+                break
+            got += n
+        return got
+
+    def _pack_song(self, song_id):
+        """
+        Interleaves a song's distinct stems, resampled to the target rate, into one multichannel
+        float WAV and records which channels hold which file.
+        """
+        song = self.get_song(song_id)
+        if not song:
+            return
+        audio_folder = self._get_resolved_audio_upload_folder_abs()
+        files = self._song_pack_files(song, audio_folder)
+        key = self._pack_key(files)
+        if not files or self.packs.lookup(song_id, key):
+            return
+        rate, decoders, partial_path = self.target_sample_rate, [], None
+        try:
+            for file_path in files:
+                file_path_abs = os.path.join(audio_folder, file_path)
+                open_path = self.render_cache.lookup(file_path_abs, rate) or file_path_abs
+                source = BASS_StreamCreateFile(False, open_path.encode('utf-8'), 0, 0,
+                                               BASS_STREAM_DECODE | BASS_SAMPLE_FLOAT)
+                info = BASS_CHANNELINFO()
+                if not source or not BASS_ChannelGetInfo(source, byref(info)):
+                    raise IOError(f"cannot open '{file_path}' (error {BASS_ErrorGetCode()})")
+                mixer = BASS_Mixer_StreamCreate(rate, info.chans, BASS_STREAM_DECODE | BASS_SAMPLE_FLOAT | BASS_MIXER_END)
+                decoders.append({'file_path': file_path, 'source': source, 'mixer': mixer, 'channels': info.chans})
+                if not mixer or not BASS_Mixer_StreamAddChannel(mixer, source, BASS_MIXER_NORAMPIN):
+                    raise IOError(f"cannot resample '{file_path}' (error {BASS_ErrorGetCode()})")
+
+            layout, total = {}, 0
+            for decoder in decoders:
+                decoder['offset'], decoder['active'] = total, True
+                decoder['buffer'] = create_string_buffer(PACK_CHUNK_FRAMES * decoder['channels'] * 4)
+                layout[decoder['file_path']] = [total, decoder['channels']]
+                total += decoder['channels']
+
+            partial_path = self.packs.path(song_id, key) + PACK_PARTIAL_SUFFIX
+            os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+            data_size = 0
+            with open(partial_path, 'wb') as out:
+                out.write(wav_float_header(total, rate, 0))
+                while any(decoder['active'] for decoder in decoders):
+                    block, frames = silent_frames(PACK_CHUNK_FRAMES, total), 0
+                    for decoder in decoders:
+                        if not decoder['active']:
+                            continue
+                        want = len(decoder['buffer'])
+                        got = self._read_decoded(decoder['mixer'], decoder['buffer'], want)
+                        decoder['active'] = got == want
+                        samples = array('f', memoryview(decoder['buffer'])[:got].tobytes())
+                        interleave_into(block, total, decoder['offset'], samples, decoder['channels'])
+                        frames = max(frames, got // (decoder['channels'] * 4))
+                    data_size += frames * total * 4
+                    if data_size > MAX_WAV_DATA_SIZE:
+                        raise IOError("pack would be too long for a WAV file")
+                    out.write(memoryview(block)[:frames * total].cast('B'))
+                out.seek(0)
+                out.write(wav_float_header(total, rate, data_size))
+            self.packs.store(song_id, key, partial_path, {'channels': total, 'sample_rate': rate, 'files': layout})
+            logging.info(f"Song {song_id} packed: {len(files)} file(s) into one {total}-channel file.")
+        except Exception as e:
+            logging.error(f"Packing song {song_id} failed: {e}")
+            self.packs.failed += 1
+            if partial_path and os.path.exists(partial_path):
+                os.unlink(partial_path)
+        finally:
+            for decoder in decoders:
+                if decoder['mixer']:
+                    BASS_StreamFree(decoder['mixer'])
+                BASS_StreamFree(decoder['source'])
+
+    def _open_packed_sources(self, song, pack, logical_map):
+        """Opens a song's pack once; every track gets a splitter routed from its channels of the pack."""
+        pack_path, index = pack
+        decode = self._create_source_stream(pack_path)
+        if not decode:
+            logging.error(f"Failed to open pack '{pack_path}'. Error: {BASS_ErrorGetCode()}")
+            return []
+        sources = []
+        for idx, track in enumerate(song.get('audio_tracks', [])):
+            layout = index['files'].get(track.get('file_path'))
+            logical_channel = track.get('output_channel', 1)
+            if layout is None or logical_channel not in logical_map:
+                logging.warning(f"Track {idx} ('{track.get('file_path')}') can't be played from the pack. Skipping.")
+                sources.append(None)
+                continue
+            target_device_id, physical_idx = logical_map[logical_channel]
+            sources.append({'track_idx': idx, 'file_path': track.get('file_path'), 'stream': decode,
+                            'channels': layout[1], 'pack_offset': layout[0], 'pack_channels': index['channels'],
+                            'logical_channel': logical_channel, 'device_id': target_device_id,
+                            'physical_idx': physical_idx, 'is_stereo': track.get('is_stereo', False),
+                            'volume': float(track.get('volume', 1.0))})
+        users = [source for source in sources if source is not None]
+        if users:
+            self._split_shared_decode(decode, users)
+        else:
+            self._free_source_stream(decode)
+        return sources
+
+    # Transitions between songs
+
+    def queue_songs(self, plan):
+        """
+        Sets the songs that follow the playing one without a stop. plan is a list of
+        (song_id, crossfade_seconds), 0 meaning a gapless segue. Each song is prepared in
+        the background and started from a mixtime sync on the mixers of the song before
+        it, so it begins at the exact sample that song ends or its crossfade starts.
+        """
+        with self._locked_state():
+            self._cancel_queued_song()
+            self._transition_plan = list(plan)
+            self._queue_next_planned()
+
+    def _queue_next_planned(self):
+        """Caller holds the state lock."""
+        if self._transition_plan:
+            self._prefetcher.submit(self._queue_song, *self._transition_plan[0])
+
+    def _queue_song(self, song_id, crossfade):
+        if not self.prepare_song(song_id, arm=False):
+            logging.warning(f"Transition: song {song_id} could not be prepared. Playback stops after the current song.")
+            return
+        with self._locked_state():
+            if not self._transition_plan or self._transition_plan[0] != (song_id, crossfade):
+                return  # The plan changed meanwhile
+            entry, current = self._prepared.latest(song_id), self._playing_entry
+            if not self._playback_active or current is None or self._queued is not None or self._loop is not None:
+                return  # A loop holds the plan until it is cleared
+            if entry is None or self._entry_in_use(entry):
+                logging.warning(f"Transition: song {song_id} is still playing, it can't follow itself.")
+                return
+            if entry['played'] and not self._rewind_prepared_entry(entry):
+                logging.error(f"Transition: could not rewind prepared song {song_id}.")
+                return
+            self._transition_plan.pop(0)
+            self._install_transition(current, entry, crossfade)
+
+    def _install_transition(self, current, entry, crossfade):
+        """
+        Sets the syncs that plug entry's mixers into the outputs. A segue starts when the
+        last of the playing song's device mixers ends, a crossfade when the first reaches
+        the fade; either way every device switches at once. Caller holds the state lock.
+        """
+        length = self._entry_length(current)
+        if crossfade and not length:
+            logging.warning(f"Transition: length of song {current['song_id']} unknown. Using a segue instead.")
+            crossfade = 0.0
+        for dev_id, mixer in entry['mixers'].items():
+            if mixer and not self._output_mixer(dev_id, mixer, start=True):
+                return False
+        queued = {'entry': entry, 'crossfade': crossfade, 'syncs': [], 'fired': set(), 'starting': False, 'started': False,
+                  'previous_song_id': current['song_id'],
+                  'devices': {mixer: dev_id for dev_id, mixer in current['mixers'].items() if mixer},
+                  'fade_bytes': {dev_id: BASS_ChannelSeconds2Bytes(output, crossfade) if crossfade else 0
+                                 for dev_id, output in self._output_mixers.items()}}
+        fade_start, late = max(0.0, length - crossfade), False
+        for mixer in queued['devices']:
+            if BASS_ChannelIsActive(mixer) != BASS_ACTIVE_PLAYING:
+                queued['fired'].add(mixer)  # Already ended, nothing to wait for
+            elif crossfade:
+                start = BASS_ChannelSeconds2Bytes(mixer, fade_start)
+                if BASS_ChannelGetPosition(mixer, BASS_POS_BYTE) >= start:
+                    late = True
+                    continue
+                sync = BASS_Mixer_ChannelSetSync(mixer, BASS_SYNC_POS | BASS_SYNC_MIXTIME | BASS_SYNC_ONETIME, start,
+                                                 self._transition_sync_proc, None)
+            else:
+                sync = BASS_Mixer_ChannelSetSync(mixer, BASS_SYNC_END | BASS_SYNC_MIXTIME | BASS_SYNC_ONETIME, 0,
+                                                 self._transition_sync_proc, None)
+            if mixer in queued['fired'] or late:
+                continue
+            if not sync:
+                logging.error(f"Transition: failed to set sync on mixer {mixer}. Error: {BASS_ErrorGetCode()}")
+                self._remove_transition_syncs(queued)
+                return False
+            queued['syncs'].append((mixer, sync))
+        self._queued = queued
+        logging.info(f"Transition: song {entry['song_id']} queued after song {current['song_id']}"
+                     f"{f' with a {crossfade:g} s crossfade' if crossfade else ' as a segue'}.")
+        self.events.post('queued', song_id=entry['song_id'], after_song_id=current['song_id'], crossfade=crossfade)
+        if late or len(queued['fired']) == len(queued['devices']):
+            self._start_queued_song(queued)  # Queued too late for the syncs; start right away
+        return True
+
+    def _on_transition_sync(self, handle, channel, data, user):
+        """
+        Runs in the mixing thread at the sample the queued song must start. Only calls
+        BASS: taking the state lock here could deadlock with a thread waiting on the mixer.
+        """
+        queued = self._queued
+        if queued is None or queued['starting']:
+            return
+        queued['fired'].add(channel)
+        if queued['crossfade'] or len(queued['fired']) == len(queued['devices']):
+            self._start_queued_song(queued)
+
+    def _start_queued_song(self, queued):
+        """
+        Plugs the queued song in, usually from the mixing thread. The mixers it plugged are
+        only recorded in queued; _adopt_started_queued moves them into _plugged_mixers
+        under the state lock.
+        """
+        queued['starting'] = True
+        plugged = []
+        for dev_id, mixer in queued['entry']['mixers'].items():
+            output = self._output_mixers.get(dev_id)
+            if mixer and output and BASS_Mixer_StreamAddChannel(output, mixer, BASS_MIXER_NORAMPIN):
+                plugged.append(mixer)
+                if queued['fade_bytes'].get(dev_id):
+                    self._set_volume_ramp(mixer, 0.0, 1.0, queued['fade_bytes'][dev_id])
+        for mixer, dev_id in queued['devices'].items():
+            if queued['fade_bytes'].get(dev_id):
+                self._set_volume_ramp(mixer, 1.0, 0.0, queued['fade_bytes'][dev_id])
+        queued['entry']['played'] = True
+        queued['plugged'] = plugged
+        queued['started'] = True
+        self.events.post('transition', song_id=queued['entry']['song_id'], previous_song_id=queued['previous_song_id'],
+                         crossfade=queued['crossfade'])
+
+    @staticmethod
+    def _set_volume_ramp(source, start, end, length):
+        """A volume envelope on a mixer source from start to end over length bytes from its current position."""
+        nodes = (BASS_MIXER_NODE * 2)(BASS_MIXER_NODE(0, start), BASS_MIXER_NODE(length, end))
+        BASS_Mixer_ChannelSetEnvelope(source, BASS_MIXER_ENV_VOL, nodes, 2)
+        BASS_Mixer_ChannelSetEnvelopePos(source, BASS_MIXER_ENV_VOL, 0)
+
+    def _adopt_started_queued(self):
+        """Takes the mixers a started queued song plugged in into _plugged_mixers. Caller holds the state lock."""
+        if self._queued is not None and self._queued['started']:
+            self._plugged_mixers.update(self._queued['plugged'])
+
+    def _advance_to_queued(self):
+        """Makes the started queued song the playing one. Caller holds the state lock."""
+        self._adopt_started_queued()
+        queued, self._queued = self._queued, None
+        self._remove_transition_syncs(queued)
+        previous, entry = self._playing_entry, queued['entry']
+        self._clear_loop()
+        if previous is not None:
+            self._ending_entries.append(previous)
+            self._retire_ending_entries()  # A segued song has ended already
+        entry['played'] = True
+        self._playing_entry = entry
+        self._set_song_as_prepared(entry)
+        self._active_mixer_handles = [mixer for mixer in entry['mixers'].values() if mixer in self._plugged_mixers]
+        self._watch_song_mixers(entry)
+        logging.info(f"Transition: now playing song {entry['song_id']}.")
+        self._queue_next_planned()
+
+    def _requeue_queued_song(self):
+        """
+        Puts a queued song that hasn't started back at the front of the plan, e.g. after its
+        syncs were set for a position that changed. Caller holds the state lock.
+        """
+        queued = self._queued
+        if queued is None or queued['started']:
+            return False
+        self._cancel_queued_song()
+        self._transition_plan.insert(0, (queued['entry']['song_id'], queued['crossfade']))
+        return True
+
+    def _cancel_queued_song(self):
+        """Drops a queued song that hasn't started. Caller holds the state lock."""
+        queued = self._queued
+        if queued is None or queued['started']:
+            return
+        self._queued = None
+        self._remove_transition_syncs(queued)
+        logging.info(f"Transition: song {queued['entry']['song_id']} unqueued.")
+
+    @staticmethod
+    def _remove_transition_syncs(queued):
+        for mixer, sync in queued['syncs']:
+            BASS_Mixer_ChannelRemoveSync(mixer, sync)
+
+    def _retire_ending_entries(self, force=False):
+        """Unplugs songs that faded out or ended under the next one. Caller holds the state lock."""
+        for entry in list(self._ending_entries):
+            mixers = [mixer for mixer in entry['mixers'].values() if mixer]
+            if not force and any(BASS_ChannelIsActive(mixer) == BASS_ACTIVE_PLAYING for mixer in mixers):
+                continue
+            self._ending_entries.remove(entry)
+            self._unplug_mixers(mixers)
+            if entry.get('stale') and not self._entry_in_use(entry) and entry is not self._preloaded_entry:
+                self._free_prepared_entry(entry)
+
+    def _entry_in_use(self, entry):
+        return entry is self._playing_entry or entry is self._starting_entry or \
+            any(entry is e for e in self._ending_entries) or (self._queued is not None and entry is self._queued['entry'])
+
+    @staticmethod
+    def _entry_length(entry):
+        """Seconds until a prepared song's longest stream ends, or 0 if unknown."""
+        length = 0.0
+        for stream in entry['streams'] + entry.get('shared_sources', []):
+            byte_length = BASS_ChannelGetLength(stream, BASS_POS_BYTE)
+            if byte_length not in (-1, 0xFFFFFFFFFFFFFFFF):
+                length = max(length, BASS_ChannelBytes2Seconds(stream, byte_length))
+        return length
+
+    # Output mixers
+
+    def _output_mixer(self, dev_id, song_mixer, start=False):
+        """
+        The playing mixer of a device that song mixers are plugged into, created with the
+        song mixer's channel count on first use. A new one only starts playing when asked
+        to, so a song plugged in before that plays from its first sample without latency.
+        """
+        output = self._output_mixers.get(dev_id)
+        if output:
+            return output
+        output = self._create_output_mixer(dev_id, song_mixer, self._free_output)
+        if output and start and not BASS_ChannelPlay(output, False):
+            logging.error(f"Failed to start output mixer on device {dev_id}: Error {BASS_ErrorGetCode()}")
+            self._free_output(output)
+            return 0
+        if output:
+            self._output_mixers[dev_id] = output
+        return output
+
+    def _create_output_mixer(self, dev_id, song_mixer, free=BASS_StreamFree):
+        """A stopped output mixer on the device with the song mixer's channel count, or 0."""
+        if dev_id not in self.initialized_devices:
+            logging.error(f"Device {dev_id} not initialized for mixer {song_mixer}")
+            return 0
+        info = BASS_CHANNELINFO()
+        if not BASS_ChannelGetInfo(song_mixer, byref(info)):
+            return 0
+        output = BASS_Mixer_StreamCreate(self.target_sample_rate, info.chans, BASS_MIXER_NONSTOP)
+        if not output:
+            logging.error(f"Failed to create output mixer for device {dev_id}: Error {BASS_ErrorGetCode()}")
+            return 0
+        if not BASS_ChannelSetDevice(output, dev_id):
+            logging.error(f"Failed to set output mixer to device {dev_id}: Error {BASS_ErrorGetCode()}")
+            free(output)
+            return 0
+        if not BASS_ChannelSetSync(output, BASS_SYNC_DEV_FAIL, 0, self._device_fail_sync_proc, None):
+            logging.warning(f"Could not watch device {dev_id} for failures: Error {BASS_ErrorGetCode()}")
+        return output
+
+    @staticmethod
+    def _prime_outputs(outputs):
+        """Fills the playback buffers of the output mixers, so starting them decodes nothing."""
+        for output in outputs.values():
+            if not BASS_ChannelUpdate(output, 0):
+                logging.warning(f"Could not prime output mixer {output}: Error {BASS_ErrorGetCode()}")
+
+    def _start_outputs(self, outputs, primed=False):
+        """
+        Starts the {device_id: output mixer} given and returns the devices that started.
+        A synchronized start fills every output's playback buffer first, unless they are
+        primed already, and links the others to one of them, so a single BASS_ChannelPlay
+        starts all devices in the same update instead of one after another. Outputs that
+        can't be linked start on their own.
+        """
+        pending = dict(outputs)
+        started = []
+        if self.synchronized_start and len(pending) > 1:
+            if not primed:
+                self._prime_outputs(pending)
+            lead_dev, lead = next(iter(pending.items()))
+            group = [lead_dev]
+            for dev_id, output in pending.items():
+                if output == lead:
+                    continue
+                if BASS_ChannelSetLink(lead, output):
+                    group.append(dev_id)
+                else:
+                    logging.warning(f"Could not link output of device {dev_id} for a synchronized start: "
+                                    f"Error {BASS_ErrorGetCode()}")
+            if BASS_ChannelPlay(lead, False):
+                logging.info(f"Output mixers started together on devices {group}")
+                started.extend(group)
+                for dev_id in group:
+                    del pending[dev_id]
+            else:
+                logging.error(f"Synchronized start failed: Error {BASS_ErrorGetCode()}. Starting devices one by one.")
+            for dev_id in group[1:]:
+                BASS_ChannelRemoveLink(lead, outputs[dev_id])  # Later plays and stops stay per device
+        for dev_id, output in pending.items():
+            if not BASS_ChannelPlay(output, False):
+                logging.error(f"Failed to start output mixer on device {dev_id}: Error {BASS_ErrorGetCode()}")
+            else:
+                logging.info(f"Output mixer {output} started on device {dev_id}")
+                started.append(dev_id)
+        return started
+
+    def _measure_start_skew(self, outputs):
+        """
+        Reads the playback position of each output back to back, corrected for the time
+        between the reads. All outputs started from their first sample, so the spread of
+        the positions is how far apart the devices started.
+        """
+        positions = {}
+        first_read = time.perf_counter()
+        for dev_id, output in outputs.items():
+            pos = BASS_ChannelGetPosition(output, BASS_POS_BYTE)
+            read_at = time.perf_counter()
+            if pos in (-1, 0xFFFFFFFFFFFFFFFF):
                 continue
+            positions[dev_id] = BASS_ChannelBytes2Seconds(output, pos) * 1000 - (read_at - first_read) * 1000
+        skew = max(positions.values()) - min(positions.values()) if len(positions) > 1 else 0.0
+        return {'devices': len(positions), 'synchronized': self.synchronized_start, 'skew_ms': round(skew, 3),
+                'positions_ms': {str(dev_id): round(ms, 3) for dev_id, ms in positions.items()}}
+
+    def _unplug_mixers(self, mixers):
+        for mixer in mixers:
+            _, _, syncs = self._watched_mixers.pop(mixer, (None, None, ()))
+            for sync in syncs:
+                BASS_Mixer_ChannelRemoveSync(mixer, sync)
+            if mixer in self._plugged_mixers:
+                self._plugged_mixers.discard(mixer)
+                BASS_Mixer_ChannelSetEnvelope(mixer, BASS_MIXER_ENV_VOL, None, 0)
+                BASS_Mixer_ChannelRemove(mixer)
+
+    def _free_output_mixers(self):
+        """Stops the devices. Every song mixer is unplugged first so it can be played again. Caller holds the state lock."""
+        self._adopt_started_queued()
+        self._unplug_mixers(list(self._plugged_mixers))
+        for output in self._output_mixers.values():
+            BASS_ChannelStop(output)
+            self._free_output(output)
+        self._output_mixers = {}
+
+    def _free_output(self, output):
+        """Caller holds the state lock; the output mixer is freed once it is released."""
+        self._garbage.append((BASS_StreamFree, output))
+
+    def _release_outputs(self, outputs):
+        """Frees the outputs once the last song played out on them, unless playback went on."""
+        with self._locked_state():
+            if not self._playback_active and self._output_mixers == outputs:
+                self._free_output_mixers()
+
+    def _free_prepared_entry(self, entry):
+        """Caller holds the state lock; entry is freed once it is released."""
+        self._garbage.append((self._release_prepared_entry, entry))
+
+    def _release_prepared_entry(self, entry):
+        logging.debug(f"Freeing prepared song {entry['song_id']}.")
+        self._free_streams(entry['streams'] + entry.get('shared_sources', []))
+        self._cleanup_mixers(entry['mixers'])
+
+    def prefetch_songs(self, song_ids):
+        """
+        Setlist lookahead: keeps song_ids (e.g. previous, current and next) prepared,
+        preparing missing ones in the background without arming them.
+        """
+        song_ids = [sid for sid in dict.fromkeys(song_ids) if sid is not None]
+        with self._locked_state():
+            self._prepared.set_lookahead(song_ids)
+        for song_id in song_ids:
+            self._prefetcher.submit(self._prefetch_song, song_id)
+
+    def _prefetch_song(self, song_id):
+        with self._locked_state():
+            if not self._prepared.is_lookahead(song_id):
+                return  # Navigation moved on before this got its turn
+        try:
+            self.prepare_song(song_id, arm=False)
+        except Exception as e:
+            logging.error(f"Lookahead preparation of song {song_id} failed: {e}")
+
+    def invalidate_song(self, song_id):
+        """Drops prepared copies of a song whose data changed. A copy that is playing is freed once it stops."""
+        with self._locked_state():
+            self._song_generations[song_id] += 1
+            queued = self._queued
+            if queued is not None and queued['entry']['song_id'] == song_id and self._requeue_queued_song():
+                self._queue_next_planned()  # Queued again once re-prepared
+            if self._preloaded_entry is not None and self._preloaded_entry['song_id'] == song_id:
+                self.clear_preload_state(acquire_lock=False)
+            self._prepared.invalidate_song(song_id, pinned=self._pinned_keys())
+        if self.get_song(song_id) is None:
+            # Changed songs get new bounce and pack keys, deleted ones nothing else cleans up
+            self.bounces.purge(song_id)
+            self.packs.purge(song_id)
+            self._track_mix.pop(song_id, None)
+        elif self.pack_songs:
+            self._schedule_offline_job(self._pack_song, song_id)  # Repacks only if the song's files changed
+
+    def clear_prepared_songs(self, acquire_lock=True):
+        """Frees every prepared song except the one playing right now."""
+        lock = self._locked_state() if acquire_lock else contextlib.nullcontext()
+        with lock:
+            self._cache_generation += 1  # Preparations running now must not swap their songs in
+            self.clear_preload_state(acquire_lock=False)
+            if self._playing_entry is not None:
+                self._prepared.detach(self._playing_entry)  # Freed when its playback ends
+            self._prepared.clear(pinned=self._pinned_keys())
 
-            mixer = BASS_Mixer_StreamCreate(self.target_sample_rate, num_channels, BASS_MIXER_END)
+    def prepared_songs_stats(self):
+        with self._locked_state():
+            return dict(self._prepared.stats(), armed_song_id=self._preloaded_song_id, ram_mode=self.ram_mode,
+                        ram_samples=self._ram_samples.stats(),
+                        lookahead=sorted(sid for sid in self._prepared.song_ids() if self._prepared.is_lookahead(sid)))
+
+    def _create_device_mixers(self, logical_map):
+        mixers = {}
+
+        # Create a mixer for each device
+        for dev_id, num_channels in self._channels_per_device(logical_map).items():
+            mixer = BASS_Mixer_StreamCreate(self.target_sample_rate, num_channels, DEVICE_MIXER_FLAGS)
             if mixer:
                 mixers[dev_id] = mixer
                 logging.debug(f"Created mixer {mixer} for device {dev_id} with {num_channels} channels")
@@ -248,38 +1266,110 @@ class AudioPlayer:
 
         return mixers
 
-    def _load_audio_tracks(self, song, audio_folder, logical_map, mixers):
-        streams = []
-        try:
-            for idx, track in enumerate(song.get('audio_tracks', [])):
-                success = self._load_track(track, idx, audio_folder, logical_map, mixers, streams)
-                if not success:
-                    logging.warning(f"Failed to load track {idx} - continuing with others")
+    def _open_track_sources(self, song, audio_folder, logical_map, job=None):
+        """
+        Opens the decode stream of every distinct track file on the loader pool. Tracks that
+        share a file get splitter streams of that one decode. Skipped tracks come back as None,
+        as do tracks not yet opened when job gets cancelled.
+        """
+        tracks = song.get('audio_tracks', [])
+        opener_for_file = {}  # file_path -> index of the track that opens it
+        for idx, track in enumerate(tracks):
+            if track.get('output_channel', 1) in logical_map:
+                opener_for_file.setdefault(track.get('file_path'), idx)
+        openers = list(opener_for_file.values())
+
+        def open_source(track, track_idx):
+            if job is None:
+                return self._open_track_source(track, track_idx, audio_folder, logical_map)
+            if job.cancelled:
+                return None
+            job.set_track(track_idx, 'opening')
+            source = self._open_track_source(track, track_idx, audio_folder, logical_map)
+            job.set_track(track_idx, 'ready' if source else 'failed')
+            return source
+
+        opened = dict(zip(openers, self._track_loader.map(open_source, [tracks[i] for i in openers], openers)))
+
+        sources, users = [], defaultdict(list)
+        for idx, track in enumerate(tracks):
+            first = opened.get(opener_for_file.get(track.get('file_path')))
+            if first is None or idx == first['track_idx']:
+                source = first
+            elif track.get('output_channel', 1) not in logical_map:
+                logging.warning(f"Logical channel {track.get('output_channel', 1)} not found in mapping for track "
+                                f"'{track.get('file_path')}'. Skipping.")
+                source = None
+            else:
+                source = self._shared_track_source(first, track, idx, logical_map)
+            sources.append(source)
+            if job is not None and idx not in opened:
+                job.set_track(idx, 'ready' if source is not None else 'skipped')
+            if source is not None:
+                users[first['stream']].append(source)
+        for decode, group in users.items():
+            if len(group) > 1:
+                self._split_shared_decode(decode, group)
+        return sources
 
-            return bool(streams)  # Return True if we loaded at least one track
+    @staticmethod
+    def _shared_track_source(first, track, track_idx, logical_map):
+        """Routing of another track that plays the file first already opened."""
+        logical_channel = track.get('output_channel', 1)
+        target_device_id, physical_idx = logical_map[logical_channel]
+        return dict(first, track_idx=track_idx, logical_channel=logical_channel, device_id=target_device_id,
+                    physical_idx=physical_idx, is_stereo=track.get('is_stereo', False),
+                    volume=float(track.get('volume', 1.0)))
 
-        except Exception as e:
-            logging.error(f"Error loading audio tracks: {e}")
-            self._cleanup_resources(mixers, streams)
-            return False
+    @staticmethod
+    def _split_shared_decode(decode, group):
+        """Feeds every track of a shared file from its own splitter of the single decode stream."""
+        for source in group:
+            source['stream'] = BASS_Split_StreamCreate(decode, BASS_STREAM_DECODE, 0)
+            source['shared_source'] = decode
+            if not source['stream']:
+                logging.error(f"Failed to create splitter for '{source['file_path']}'. Error: {BASS_ErrorGetCode()}")
+        logging.debug(f"'{group[0]['file_path']}' is decoded once for {len(group)} tracks.")
+
+    @staticmethod
+    def _shared_sources(sources):
+        return list(dict.fromkeys(s['shared_source'] for s in sources if s is not None and s.get('shared_source')))
+
+    def _attach_track_sources(self, sources, logical_map, mixers):
+        """Adds the opened streams to their device mixers. Returns the attached streams."""
+        attached = []
+        for source in sources:
+            if source is None:
+                continue
+            if source['stream'] and self._attach_track_source(source, logical_map, mixers):
+                attached.append(source['stream'])
+            else:
+                if source['stream']:
+                    self._free_source_stream(source['stream'])
+                logging.warning(f"Failed to load track {source['track_idx']} - continuing with others")
+        return attached
+
+    def _free_track_sources(self, sources):
+        self._free_streams([s['stream'] for s in sources if s is not None and s['stream']] +
+                           self._shared_sources(sources))
+
+    def _free_streams(self, streams):
+        for stream in streams:
+            self._free_source_stream(stream)
+
+    def _free_source_stream(self, stream):
+        BASS_StreamFree(stream)
+        self._ram_samples.release(stream)  # Only after BASS no longer reads from the buffer
 
     def _cleanup_mixers(self, mixers):
         for mixer in mixers.values():
             if mixer:
                 BASS_StreamFree(mixer)
 
-    def _cleanup_resources(self, mixers, streams=None):
-        """Free all resources including mixers and streams."""
-        self._cleanup_mixers(mixers)
-
-        if streams:
-            for stream in streams:
-                if stream:
-                    BASS_StreamFree(stream)
-
-    def _set_song_as_prepared(self, song_id, mixers):
-        self._preloaded_song_id = song_id
-        self._preloaded_mixers = mixers
+    def _set_song_as_prepared(self, entry):
+        self._preloaded_entry = entry
+        self._preloaded_song_id = entry['song_id']
+        self._preloaded_mixers = entry['mixers']
         self._is_song_preloaded = True
 
     def preload_song(self, song_id):
@@ -289,13 +1379,30 @@ class AudioPlayer:
         # Prepare the song and its resources
         return self.prepare_song(song_id)
 
-    def play_song_directly(self, song_id):
+    def start_preload(self, song_id, on_done=None):
+        """
+        Preloads song_id as a background job and returns the PreloadJob. A newer job for
+        another song cancels this one; see PreloadJobs. on_done(job) runs once it's armed.
+        """
+        song = self.get_song(song_id)
+        return self.preload_jobs.submit(song_id, song.get('audio_tracks', []) if song else [], on_done)
+
+    def _run_preload_job(self, job):
+        self.update_settings()
+        return self.prepare_song(job.song_id, job=job)
+
+    def play_song_directly(self, song_id, position=0.0):
+        # A preload of this song still running is waited for rather than done twice; others give way
+        job = self.preload_jobs.supersede(song_id)
+        if job is not None:
+            job.wait()
+
         # Update settings first
         self.update_settings()
 
         # Check if we need to prepare the song
         needs_preparation = True
-        with callback_lock:
+        with self._locked_state():
             if self._is_song_preloaded and self._preloaded_song_id == song_id:
                 needs_preparation = False
 
@@ -307,92 +1414,183 @@ class AudioPlayer:
                 return False
 
         # Start playback of the prepared song
-        return self.play_preloaded_song()
-
-    def play_preloaded_song(self):
-        with callback_lock:
-            # Verify we have a preloaded song
-            if not self._is_song_preloaded or not self._preloaded_mixers:
-                logging.warning("Cannot play: No song is preloaded or no mixers available")
-                self._playback_active = False
-                return False
-
-            # If already playing, nothing to do
-            if self._playback_active:
-                logging.info("Playback already active")
-                return True
-
-            # Reset active mixer list
-            self._active_mixer_handles = []
+        return self.play_preloaded_song(position)
 
-            # Start all mixers
-            all_started = True
-            for dev_id, mixer_handle in self._preloaded_mixers.items():
-                if not mixer_handle:
-                    continue
+    def play_preloaded_song(self, position=0.0):
+        """
+        Plays the armed song from position seconds, e.g. a marker. The state lock is only
+        held to claim the armed song and to swap it in: positioning its streams and
+        creating and priming its output mixers read and decode audio, so they run without
+        it and stop() never waits on them. A stop() meanwhile cancels the start.
+        """
+        with self._start_lock:
+            with self._locked_state():
+                # Verify we have a preloaded song
+                if not self._is_song_preloaded or not self._preloaded_mixers:
+                    logging.warning("Cannot play: No song is preloaded or no mixers available")
+                    self._playback_active = False
+                    return False
 
-                # Ensure device is initialized
-                if dev_id not in self.initialized_devices:
-                    logging.error(f"Device {dev_id} not initialized for mixer {mixer_handle}")
-                    all_started = False
-                    continue
+                # If already playing, nothing to do
+                if self._playback_active:
+                    logging.info("Playback already active")
+                    return True
 
-                # Set the device for this mixer
-                if not BASS_ChannelSetDevice(mixer_handle, dev_id):
-                    logging.error(
-                        f"Failed to set device {dev_id} for mixer {mixer_handle}: Error {BASS_ErrorGetCode()}")
-                    all_started = False
-                    continue
+                entry = self._preloaded_entry
+                token = self._start_token = object()
+                self._starting_entry = entry  # Pinned and in use until it is swapped in
 
-                # Start playback for this mixer
-                if not BASS_ChannelPlay(mixer_handle, False):
-                    logging.error(f"Failed to start playback for mixer {mixer_handle}: Error {BASS_ErrorGetCode()}")
-                    all_started = False
+                # Reset active mixer list; whatever still plays out from the last song is cut
+                self._active_mixer_handles = []
+                self._clear_loop()
+                self._paused = False
+                self._retire_ending_entries(force=True)
+                self._free_output_mixers()
+
+                # A cached song that played before starts again from the top, or from position
+                seconds = self._frame_time(self._clamp_position(entry, position)) \
+                    if entry['played'] or position else None
+
+            outputs, plugged = {}, []
+            positioned = seconds is None or self._position_entry(entry, seconds)
+            if positioned:
+                # Plug every device mixer into a new output mixer of its device
+                for dev_id, mixer_handle in entry['mixers'].items():
+                    if not mixer_handle:
+                        continue
+                    output = self._create_output_mixer(dev_id, mixer_handle)
+                    if not output:
+                        continue
+                    outputs[dev_id] = output
+                    if not BASS_Mixer_StreamAddChannel(output, mixer_handle, BASS_MIXER_NORAMPIN):
+                        logging.error(f"Failed to start playback for mixer {mixer_handle}: Error {BASS_ErrorGetCode()}")
+                    else:
+                        plugged.append(mixer_handle)
+                # Fill the outputs' buffers with the song now, so starting them below is quick
+                self._prime_outputs(outputs)
+
+            with self._locked_state():
+                self._starting_entry = None
+                entry['played'] = True  # Positioned or primed either way; rewound before its next play
+                if self._start_token is not token or not positioned:
+                    if not positioned:
+                        logging.error(f"Cannot play: Failed to position prepared song {entry['song_id']}")
+                    else:
+                        logging.info(f"Start of song {entry['song_id']} cancelled before it was heard.")
+                    for mixer_handle in plugged:
+                        BASS_Mixer_ChannelRemove(mixer_handle)
+                    for output in outputs.values():
+                        self._free_output(output)
+                    if entry.get('stale') and not self._entry_in_use(entry) and entry is not self._preloaded_entry:
+                        self._free_prepared_entry(entry)
+                    self._start_token = None
+                    return False
+                self._start_token = None
+
+                self._free_output_mixers()  # Nothing should have started meanwhile; never leak one that did
+                self._output_mixers = outputs
+                self._plugged_mixers.update(plugged)
+                self._active_mixer_handles = list(plugged)
+                self._watch_song_mixers(entry)
+
+                # Start the outputs only now, so their buffers hold the song rather than silence
+                started = self._start_outputs(self._output_mixers, primed=True)
+                self.last_start_report = None
+                if len(started) > 1:
+                    self.events.call_later(START_SKEW_MEASURE_DELAY, self._report_start_skew,
+                                           dict(self._output_mixers))
+
+                # If we successfully started at least one mixer
+                if self._active_mixer_handles:
+                    self._playback_active = True
+                    self._playing_entry = entry
+                    self.events.post('playing', song_id=entry['song_id'], devices=started)
+                    self._start_meter()
+                    logging.info(
+                        f"Playback started for song {entry['song_id']} with {len(self._active_mixer_handles)} mixer(s)")
+                    return True
                 else:
-                    logging.info(f"Mixer {mixer_handle} started on device {dev_id}")
-                    self._active_mixer_handles.append(mixer_handle)
-
-            # If we successfully started at least one mixer
-            if self._active_mixer_handles:
-                self._playback_active = True
-                self._start_playback_monitor()
-                logging.info(
-                    f"Playback started for song {self._preloaded_song_id} with {len(self._active_mixer_handles)} mixer(s)")
-                return True
-            else:
-                logging.error(f"Playback failed to start for song {self._preloaded_song_id}")
-                return False
-
-    def _start_playback_monitor(self):
-        if self._playback_monitor_thread is None or not self._playback_monitor_thread.is_alive():
-            self._playback_monitor_thread = threading.Thread(target=self._playback_monitor, daemon=True)
-            self._playback_monitor_thread.start()
-
-    def _load_track(self, track, track_idx, audio_folder, logical_map, mixers_by_device, all_streams):
-        # Get track file path
-        file_path_rel = track.get('file_path')
-        if not file_path_rel:
-            logging.warning(f"Track {track_idx} has no file_path specified. Skipping.")
-            return False
+                    logging.error(f"Playback failed to start for song {entry['song_id']}")
+                    return False
 
-        # Check if file exists
-        file_path_abs = os.path.join(audio_folder, file_path_rel)
-        if not os.path.exists(file_path_abs):
-            logging.warning(f"Audio file not found for track {track_idx} ('{file_path_rel}'). Skipping.")
-            return False
+    def _open_track_source(self, track, track_idx, audio_folder, logical_map):
+        """Opens a track's file once and reads its channel layout. Runs on the loader pool."""
+        try:
+            # Get track file path
+            file_path_rel = track.get('file_path')
+            if not file_path_rel:
+                logging.warning(f"Track {track_idx} has no file_path specified. Skipping.")
+                return None
+
+            # Check if file exists
+            file_path_abs = os.path.join(audio_folder, file_path_rel)
+            if not os.path.exists(file_path_abs):
+                logging.warning(f"Audio file not found for track {track_idx} ('{file_path_rel}'). Skipping.")
+                return None
+
+            # Find target device and channel
+            logical_channel = track.get('output_channel', 1)
+            if logical_channel not in logical_map:
+                logging.warning(
+                    f"Logical channel {logical_channel} not found in mapping for track '{file_path_rel}'. Skipping.")
+                return None
+
+            # Create the source stream. Mono playback of multichannel files is done in the mixer matrix,
+            # so the channel count isn't needed up front and the file is opened only this once.
+            open_path = self.render_cache.lookup(file_path_abs, self.target_sample_rate) or file_path_abs
+            source_stream = self._create_source_stream(open_path)
+            if not source_stream:
+                logging.error(f"Failed to create stream for '{file_path_rel}'. Error: {BASS_ErrorGetCode()}. Skipping.")
+                return None
+
+            source_info = BASS_CHANNELINFO()
+            if not BASS_ChannelGetInfo(source_stream, byref(source_info)):
+                logging.error(f"Failed to get channel info for '{file_path_rel}'. Error: {BASS_ErrorGetCode()}. Skipping.")
+                self._free_source_stream(source_stream)
+                return None
+
+            # Get stream channels and add a robust validation check for all cases
+            stream_channels = source_info.chans
+            if not (1 <= stream_channels <= 8):  # Allow up to 8 channels, but catch garbage values
+                logging.warning(
+                    f"Unusual stream channel count {stream_channels} detected for '{file_path_rel}'. Assuming 2.")
+                stream_channels = 2
 
-        # Get track settings
-        logical_channel = track.get('output_channel', 1)
-        is_stereo = track.get('is_stereo', False)
-        track_volume = float(track.get('volume', 1.0))
+            # Keep the metadata index current while the file is open anyway
+            if open_path == file_path_abs and self.metadata_index.peek(file_path_abs) is None:
+                self.metadata_index.put(file_path_abs, self._read_stream_metadata(source_stream, source_info,
+                                                                                  file_path_rel))
+
+            target_device_id, physical_idx = logical_map[logical_channel]
+            if open_path != file_path_abs:
+                logging.debug(f"Track '{file_path_rel}' plays from its render at {self.target_sample_rate} Hz.")
+            return {'track_idx': track_idx, 'file_path': file_path_rel, 'stream': source_stream,
+                    'channels': stream_channels, 'logical_channel': logical_channel,
+                    'device_id': target_device_id, 'physical_idx': physical_idx,
+                    'is_stereo': track.get('is_stereo', False), 'volume': float(track.get('volume', 1.0))}
+        except Exception as e:
+            logging.error(f"Exception opening track {track_idx}: {e}")
+            return None
 
-        # Find target device and channel
-        if logical_channel not in logical_map:
-            logging.warning(
-                f"Logical channel {logical_channel} not found in mapping for track '{file_path_rel}'. Skipping.")
-            return False
+    def _create_source_stream(self, file_path_abs):
+        """
+        A decode stream for the file. In RAM mode the whole file is read into memory first so
+        playback never waits on slow storage, unless that would exceed the RAM budget.
+        """
+        flags = BASS_STREAM_DECODE | BASS_SAMPLE_FLOAT
+        buffer = self._ram_samples.load(file_path_abs) if self.ram_mode else None
+        if buffer is None:
+            return BASS_StreamCreateFile(False, file_path_abs.encode('utf-8'), 0, 0, flags)
+        stream = BASS_StreamCreateFile(True, addressof(buffer), 0, len(buffer), flags)
+        if stream:
+            self._ram_samples.attach(stream, buffer)
+        else:
+            self._ram_samples.discard(buffer)
+        return stream
 
-        target_device_id, physical_idx = logical_map[logical_channel]
+    def _attach_track_source(self, source, logical_map, mixers_by_device):
+        file_path_rel = source['file_path']
+        target_device_id = source['device_id']
 
         # Find the mixer for this device
         if target_device_id not in mixers_by_device:
@@ -400,56 +1598,31 @@ class AudioPlayer:
             return False
 
         device_mixer = mixers_by_device[target_device_id]
-
-        # Determine file channels and stream flags
-        actual_file_channels = self._get_file_channel_count(file_path_abs, file_path_rel)
-
-        # Create flags for stream creation
-        source_flags = BASS_STREAM_DECODE | BASS_SAMPLE_FLOAT
-        if actual_file_channels > 1 and not is_stereo:
-            source_flags |= BASS_SAMPLE_MONO
-            logging.info(f"Track '{file_path_rel}' set to play mono. Using BASS_SAMPLE_MONO.")
-
-        # Create the source stream
-        source_stream = BASS_StreamCreateFile(False, file_path_abs.encode('utf-8'), 0, 0, source_flags)
-        if not source_stream:
-            logging.error(f"Failed to create stream for '{file_path_rel}'. Error: {BASS_ErrorGetCode()}. Skipping.")
-            return False
-
-        # Add to streams list for cleanup
-        all_streams.append(source_stream)
-
-        # Get stream info
-        source_info = BASS_CHANNELINFO()
-        if not BASS_ChannelGetInfo(source_stream, byref(source_info)):
-            logging.error(f"Failed to get channel info for '{file_path_rel}'. Error: {BASS_ErrorGetCode()}. Skipping.")
-            return False
-
-        # Get stream channels and add a robust validation check for all cases
-        stream_channels = source_info.chans
-        if not (1 <= stream_channels <= 8):  # Allow up to 8 channels, but catch garbage values
-            logging.warning(
-                f"Unusual stream channel count {stream_channels} detected for '{file_path_rel}'. Clamping value.")
-            # Clamp to 1 for mono streams, otherwise default to 2
-            if source_flags & BASS_SAMPLE_MONO:
-                stream_channels = 1
-            else:
-                stream_channels = 2
-
-        # The original check can be kept as a fallback
-        if source_flags & BASS_SAMPLE_MONO and stream_channels != 1:
-            logging.warning(f"Stream was supposed to be mono, but reports {stream_channels} channels. Forcing to 1.")
-            stream_channels = 1
+        source_stream = source['stream']
+        if source.get('premixed'):  # A bounce already has the device mixer's layout, volumes and routing
+            if not BASS_Mixer_StreamAddChannel(device_mixer, source_stream, BASS_MIXER_NORAMPIN):
+                logging.error(f"Failed to add bounce '{file_path_rel}' to mixer. Error: {BASS_ErrorGetCode()}")
+                return False
+            return True
+        if source['channels'] > 1 and not source['is_stereo']:
+            logging.info(f"Track '{file_path_rel}' set to play mono. Downmixing in the channel matrix.")
 
         # Get mixer channel count
         mixer_channels = self._get_mixer_channel_count(target_device_id, mixers_by_device)
 
         # Create and set up mixer matrix for channel routing
-        matrix = self._create_channel_matrix(stream_channels, mixer_channels, physical_idx, is_stereo, logical_channel,
-                                             logical_map)
+        matrix = self._create_channel_matrix(source['channels'], mixer_channels, source['physical_idx'],
+                                             source['is_stereo'], source['logical_channel'], logical_map)
         if not matrix:
             logging.error(f"Failed to create channel matrix for '{file_path_rel}'. Skipping.")
             return False
+        if 'pack_offset' in source:  # The track's columns of the pack's wider matrix; every other channel stays silent
+            pack_channels, offset, channels = source['pack_channels'], source['pack_offset'], source['channels']
+            pack_matrix = (c_float * (pack_channels * mixer_channels))()
+            for out in range(mixer_channels):
+                for c in range(channels):
+                    pack_matrix[out * pack_channels + offset + c] = matrix[out * channels + c]
+            matrix = pack_matrix
 
         # Add stream to mixer
         if not BASS_Mixer_StreamAddChannel(device_mixer, source_stream, BASS_MIXER_NORAMPIN | BASS_MIXER_MATRIX):
@@ -458,38 +1631,46 @@ class AudioPlayer:
             return False
 
         # Set volume
-        if not BASS_ChannelSetAttribute(source_stream, BASS_ATTRIB_VOL, track_volume):
+        if not BASS_ChannelSetAttribute(source_stream, BASS_ATTRIB_VOL, source['volume']):
             logging.warning(f"Failed to set volume for '{file_path_rel}'. Error: {BASS_ErrorGetCode()}")
 
         # Set matrix
         if not BASS_Mixer_ChannelSetMatrix(source_stream, matrix):
             logging.error(f"Failed to set channel matrix for '{file_path_rel}'. Error: {BASS_ErrorGetCode()}")
 
-        logging.debug(f"Successfully loaded track '{file_path_rel}' to channel {logical_channel}")
+        logging.debug(f"Successfully loaded track '{file_path_rel}' to channel {source['logical_channel']}")
         return True
 
-    @staticmethod
-    def _get_file_channel_count(file_path_abs, file_path_rel):
-        temp_stream = BASS_StreamCreateFile(False, file_path_abs.encode('utf-8'), 0, 0, BASS_STREAM_DECODE)
+    @classmethod
+    def _probe_audio_file(cls, file_path_abs):
+        """Opens a decode stream once to read duration, channels, native sample rate and codec."""
+        temp_stream = BASS_StreamCreateFile(False, file_path_abs.encode('utf-8'), 0, 0,
+                                            BASS_STREAM_DECODE | BASS_SAMPLE_FLOAT)
         if not temp_stream:
-            logging.warning(
-                f"Could not create temp stream for '{file_path_rel}'. Error: {BASS_ErrorGetCode()}. Assuming 2 channels.")
-            return 2
-
-        channel_info = BASS_CHANNELINFO()
-        channel_count = 2
+            logging.warning(f"Could not open '{file_path_abs}' for probing. Error: {BASS_ErrorGetCode()}")
+            return None
+        try:
+            channel_info = BASS_CHANNELINFO()
+            if not BASS_ChannelGetInfo(temp_stream, byref(channel_info)):
+                logging.warning(f"Could not get channel info for '{file_path_abs}'. Error: {BASS_ErrorGetCode()}")
+                return None
+            return cls._read_stream_metadata(temp_stream, channel_info, file_path_abs)
+        finally:
+            BASS_StreamFree(temp_stream)
 
-        if BASS_ChannelGetInfo(temp_stream, byref(channel_info)):
-            channel_count = channel_info.chans
-            if not (1 <= channel_count <= 2):
-                logging.warning(f"Unusual channel count {channel_count} for '{file_path_rel}'. Assuming 2 for safety.")
-                channel_count = 2
+    @staticmethod
+    def _read_stream_metadata(stream, channel_info, file_path):
+        duration = 0.0
+        length_bytes = BASS_ChannelGetLength(stream, BASS_POS_BYTE)
+        if length_bytes != 0xFFFFFFFFFFFFFFFF:
+            duration = BASS_ChannelBytes2Seconds(stream, length_bytes)
         else:
-            logging.warning(
-                f"Could not get channel info for '{file_path_rel}'. Error: {BASS_ErrorGetCode()}. Assuming 2 channels.")
-
-        BASS_StreamFree(temp_stream)
-        return channel_count
+            logging.warning(f"BASS_ChannelGetLength failed for '{file_path}'. Error: {BASS_ErrorGetCode()}")
+        codec = CODEC_NAMES.get(channel_info.ctype)
+        if codec is None:
+            codec = 'wav' if channel_info.ctype & BASS_CTYPE_STREAM_WAV else format(channel_info.ctype, '#x')
+        return {'duration': duration, 'channels': channel_info.chans, 'sample_rate': channel_info.freq,
+                'codec': codec}
 
     def _get_mixer_channel_count(self, device_id, mixers_by_device):
         for output_config in self.audio_outputs:
@@ -500,12 +1681,13 @@ class AudioPlayer:
     @staticmethod
     def _create_channel_matrix(source_channels, mixer_channels, physical_idx, is_stereo, logical_channel,
                                logical_map):
+        """BASSmix matrices hold a row per output: input i on output o is at o * source_channels + i."""
         # Validate parameters
         if source_channels <= 0 or mixer_channels <= 0:
             logging.error(f"Invalid channel counts: source={source_channels}, mixer={mixer_channels}")
             return None
 
-        # Create matrix buffer (source_channels × mixer_channels)
+        # Create matrix buffer: a row of source_channels gains for each of the mixer_channels outputs
         matrix = (c_float * (source_channels * mixer_channels))()
 
         # Initialize all values to 0
@@ -527,131 +1709,513 @@ class AudioPlayer:
                 # Stereo source to stereo output
                 if source_channels >= 2:
                     # Left channel to first output
-                    matrix[0 * mixer_channels + physical_idx] = 1.0
+                    matrix[physical_idx * source_channels + 0] = 1.0
                     # Right channel to second output
-                    matrix[1 * mixer_channels + second_physical_idx] = 1.0
+                    matrix[second_physical_idx * source_channels + 1] = 1.0
                     logging.debug(f"Stereo source to stereo output: L->{physical_idx}, R->{second_physical_idx}")
                 # Mono source to stereo output
                 elif source_channels == 1:
                     # Mono to both outputs
-                    matrix[0 * mixer_channels + physical_idx] = 1.0
-                    matrix[0 * mixer_channels + second_physical_idx] = 1.0
+                    matrix[physical_idx * source_channels + 0] = 1.0
+                    matrix[second_physical_idx * source_channels + 0] = 1.0
                     logging.debug(f"Mono source to stereo output: Mono->{physical_idx}/{second_physical_idx}")
             else:
                 # Stereo requested but second channel invalid, fallback to mono on single channel
                 if source_channels >= 1 and physical_idx < mixer_channels:
-                    matrix[0 * mixer_channels + physical_idx] = 1.0
+                    matrix[physical_idx * source_channels + 0] = 1.0
                     logging.warning(f"Stereo requested but second channel invalid. Using mono output->{physical_idx}")
         else:
             # Mono output (from any source) - always route to single specified channel
             if physical_idx < mixer_channels:
-                # Route first channel (or only channel for mono source) to output
-                matrix[0 * mixer_channels + physical_idx] = 1.0
-                logging.debug(f"Mono output: First source channel -> {physical_idx}")
+                # Every source channel is mixed down equally into the output
+                for source_idx in range(source_channels):
+                    matrix[physical_idx * source_channels + source_idx] = 1.0 / source_channels
+                logging.debug(f"Mono output: {source_channels} source channel(s) -> {physical_idx}")
             else:
                 logging.warning(f"Physical index {physical_idx} invalid for mixer with {mixer_channels} channels")
 
         return matrix
 
-    def _playback_monitor(self):
-        logging.debug(f"Playback monitor started for {len(self._active_mixer_handles)} BASS mixer(s).")
-        while True:
-            with callback_lock:
-                if not self._playback_active or not self._active_mixer_handles:
-                    logging.debug("Monitor: Playback no longer active or no active handles. Exiting.")
-                    break
-                still_active_count = 0
-                for mixer_h in self._active_mixer_handles:
-                    if BASS_ChannelIsActive(mixer_h) in [BASS_ACTIVE_PLAYING, BASS_ACTIVE_STALLED]:
-                        still_active_count += 1
-                if still_active_count == 0:
-                    logging.info("Monitor: All BASS mixers appear to have finished or stopped.")
-                    self._playback_active = False
-                    break
-            time.sleep(0.1)
+    # Playback events
+
+    def _watch_song_mixers(self, entry):
+        """
+        Sets end and stall syncs on the plugged device mixers of entry. Through the output
+        mixer they fire when the end is heard rather than mixed. Caller holds the state lock.
+        """
+        for dev_id, mixer in entry['mixers'].items():
+            if not mixer or mixer not in self._plugged_mixers or mixer in self._watched_mixers:
+                continue
+            end_sync = BASS_Mixer_ChannelSetSync(mixer, BASS_SYNC_END, 0, self._end_sync_proc, None)
+            stall_sync = BASS_Mixer_ChannelSetSync(mixer, BASS_SYNC_STALL, 0, self._stall_sync_proc, None)
+            if not end_sync:
+                logging.error(f"Failed to set end sync on mixer {mixer}: Error {BASS_ErrorGetCode()}")
+            self._watched_mixers[mixer] = (entry['song_id'], dev_id, [sync for sync in (end_sync, stall_sync) if sync])
+            if BASS_ChannelIsActive(mixer) == BASS_ACTIVE_STOPPED:  # Ended before the sync was set
+                self.events.post('mixer_ended', song_id=entry['song_id'], device_id=dev_id, mixer=mixer)
+
+    # The sync callbacks run in BASS threads and only post events; _on_playback_event handles them
+
+    def _on_mixer_end_sync(self, handle, channel, data, user):
+        song_id, dev_id, _ = self._watched_mixers.get(channel, (None, None, None))
+        self.events.post('mixer_ended', song_id=song_id, device_id=dev_id, mixer=channel)
+
+    def _on_mixer_stall_sync(self, handle, channel, data, user):
+        song_id, dev_id, _ = self._watched_mixers.get(channel, (None, None, None))
+        self.events.post('resumed' if data else 'stalled', song_id=song_id, device_id=dev_id)
+
+    def _on_device_fail_sync(self, handle, channel, data, user):
+        dev_id = next((d for d, output in list(self._output_mixers.items()) if output == channel), None)
+        self.events.post('device_failed', device_id=dev_id)
+
+    def _on_playback_event(self, event):
+        """Advances the player's state on the dispatcher thread."""
+        if event['type'] == 'mixer_ended':
+            with self._locked_state():
+                self._retire_ending_entries()
+                self._check_playback_ended()
+        elif event['type'] == 'transition':
+            with self._locked_state():
+                if self._queued is not None and self._queued['started']:
+                    self._advance_to_queued()
+        elif event['type'] == 'stalled':
+            logging.warning(f"Song {event['song_id']} stalled on device {event['device_id']}: "
+                            f"its files can't be read fast enough.")
+        elif event['type'] == 'device_failed':
+            logging.error(f"Output device {event['device_id']} failed. Stopping playback.")
+            self.stop(reason='device_failed')
+
+    def _check_playback_ended(self, grace=True):
+        """Ends playback once every mixer of the playing song ended. Caller holds the state lock."""
+        if not self._playback_active:
+            return
+        if any(BASS_ChannelIsActive(mixer) in [BASS_ACTIVE_PLAYING, BASS_ACTIVE_STALLED]
+               for mixer in self._active_mixer_handles):
+            return
+        if self._queued is not None and grace:
+            # The queued song's sync fires in the mixing thread right as these end; give it a moment
+            self.events.call_later(TRANSITION_GRACE, self._recheck_playback_ended)
+            return
+        logging.info("All BASS mixers of the playing song have finished.")
+        self._finish_playback('ended')
+
+    def _recheck_playback_ended(self):
+        with self._locked_state():
+            self._check_playback_ended(grace=False)
+
+    def _finish_playback(self, reason):
+        """Caller holds the state lock."""
+        song_id = self._playing_entry['song_id'] if self._playing_entry else None
+        self._playback_active = False
+        self._active_mixer_handles = []
+        self._clear_loop()
+        self._paused = False
+        self._cancel_queued_song()
+        self._adopt_started_queued()
+        self._queued, self._transition_plan = None, []
+        self._retire_ending_entries(force=True)
+        self._end_playing_entry()
+        self.events.post('stopped', song_id=song_id, reason=reason)
+        if self._output_mixers:
+            self.events.call_later(OUTPUT_RELEASE_DELAY, self._release_outputs, dict(self._output_mixers))
+
+    def _report_start_skew(self, outputs):
+        with self._locked_state():
+            if not self._playback_active or self._output_mixers != outputs:
+                return
+            report = self.last_start_report = self._measure_start_skew(outputs)
+        logging.info(f"Start skew across {report['devices']} devices: {report['skew_ms']} ms "
+                     f"({'synchronized' if report['synchronized'] else 'sequential'} start)")
+        self.events.post('start_skew', **report)
+
+    # Seek, loop and pause
+
+    def seek(self, position):
+        """
+        Moves the playing song to position seconds. Every source stream and device mixer is
+        set to the same frame while the outputs are locked, and what they buffered is
+        dropped, so all devices jump together. Returns the position, or None if nothing plays.
+        """
+        with self._locked_state():
+            if not self._playback_active or self._playing_entry is None:
+                return None
+            return self._seek_playing(position)
+
+    def _seek_playing(self, position):
+        """Caller holds the state lock."""
+        entry = self._playing_entry
+        position = self._frame_time(self._clamp_position(entry, position))
+        outputs = list(self._output_mixers.values())
+        for output in outputs:
+            BASS_ChannelLock(output, True)  # No device mixes until every one of them moved
+        try:
+            ok = self._position_entry(entry, position, self._plugged_mixers)
+        finally:
+            for output in outputs:
+                BASS_ChannelLock(output, False)
+        if not ok:
+            logging.warning(f"Seek: not every stream of song {entry['song_id']} moved. Error: {BASS_ErrorGetCode()}")
+        if self._requeue_queued_song():
+            self._queue_next_planned()  # Its syncs were set for the old position
+        logging.info(f"Seek: song {entry['song_id']} to {position:.3f} s.")
+        self.events.post('seeked', song_id=entry['song_id'], position=round(position, 3))
+        return position
+
+    def set_loop(self, start, end):
+        """
+        Loops the playing song between start and end seconds until clear_loop(). A mixtime
+        sync on every device mixer moves its sources back to start at the frame end is
+        mixed, so the boundary is seamless. The song queued to follow waits for the loop to
+        be cleared. Returns the loop as (start, end), or None if it can't be set.
+        """
+        with self._locked_state():
+            entry = self._playing_entry
+            if not self._playback_active or entry is None or (self._queued is not None and self._queued['started']):
+                return None
+            start = self._frame_time(self._clamp_position(entry, start))
+            end = self._frame_time(self._clamp_position(entry, end))
+            if end - start < MIN_LOOP_LENGTH:
+                return None
+            self._clear_loop()
+            loop = {'song_id': entry['song_id'], 'start': start, 'end': end, 'syncs': [], 'streams': {}}
+            for dev_id, mixer in entry['mixers'].items():
+                if not mixer or mixer not in self._plugged_mixers:
+                    continue
+                loop['streams'][mixer] = entry['device_streams'].get(dev_id, [])
+                sync = BASS_Mixer_ChannelSetSync(mixer, BASS_SYNC_POS | BASS_SYNC_MIXTIME,
+                                                 BASS_ChannelSeconds2Bytes(mixer, end), self._loop_sync_proc, None)
+                if not sync:
+                    logging.error(f"Loop: failed to set sync on mixer {mixer}. Error: {BASS_ErrorGetCode()}")
+                    self._remove_loop_syncs(loop)
+                    return None
+                loop['syncs'].append((mixer, sync))
+            self._loop = loop
+            self._requeue_queued_song()
+            logging.info(f"Loop: song {entry['song_id']} between {start:.3f} s and {end:.3f} s.")
+            self.events.post('loop', song_id=entry['song_id'], start=round(start, 3), end=round(end, 3))
+            mixer = next(iter(loop['streams']), None)
+            if mixer and BASS_ChannelGetPosition(mixer, BASS_POS_BYTE) >= BASS_ChannelSeconds2Bytes(mixer, end):
+                self._seek_playing(start)  # Already mixed past the end, the sync would never fire
+            return start, end
+
+    def clear_loop(self):
+        """Lets the playing song run on past its loop; a song queued to follow is queued again."""
+        with self._locked_state():
+            loop = self._loop
+            if loop is None:
+                return False
+            self._clear_loop()
+            self.events.post('loop', song_id=loop['song_id'], start=None, end=None)
+            if self._playback_active:
+                self._queue_next_planned()
+            return True
+
+    def _clear_loop(self):
+        """Caller holds the state lock."""
+        loop, self._loop = self._loop, None
+        if loop is not None:
+            self._remove_loop_syncs(loop)
 
-        with callback_lock:
+    @staticmethod
+    def _remove_loop_syncs(loop):
+        for mixer, sync in loop['syncs']:
+            BASS_Mixer_ChannelRemoveSync(mixer, sync)
+
+    def _on_loop_sync(self, handle, channel, data, user):
+        """Runs in the mixing thread at the loop's end on one device mixer; like _on_transition_sync, it only calls BASS."""
+        loop = self._loop
+        streams = loop['streams'].get(channel) if loop is not None else None
+        if streams is not None:
+            self._position_mixer(channel, streams, loop['start'])
+
+    def pause(self):
+        """Pauses every output device. What they buffered is kept, so resume() continues at the same frame."""
+        with self._locked_state():
             if not self._playback_active:
-                logging.debug("Monitor: Cleaning up active mixer handles as playback is no longer active.")
-                self._active_mixer_handles = []
-        logging.debug("Playback monitor thread finished.")
+                return False
+            if not self._paused:
+                for dev_id, output in self._output_mixers.items():
+                    if not BASS_ChannelPause(output):
+                        logging.warning(f"Failed to pause output mixer on device {dev_id}: Error {BASS_ErrorGetCode()}")
+                self._paused = True
+                self.events.post('paused', song_id=self._playing_entry['song_id'] if self._playing_entry else None)
+            return True
+
+    def resume(self):
+        with self._locked_state():
+            if not self._playback_active:
+                return False
+            if self._paused:
+                started = self._start_outputs(self._output_mixers)
+                self._paused = False
+                self.events.post('unpaused', song_id=self._playing_entry['song_id'] if self._playing_entry else None,
+                                 devices=started)
+            return True
+
+    def _clamp_position(self, entry, seconds):
+        length = self._song_length(entry)
+        return min(max(0.0, float(seconds)), length) if length else max(0.0, float(seconds))
+
+    def _song_length(self, entry):
+        if 'length' not in entry:
+            entry['length'] = self._entry_length(entry)
+        return entry['length']
+
+    # Live track mix
+
+    def set_track_mix(self, song_id, changes):
+        """
+        Applies changes, {track_id: {'volume', 'muted', 'solo'}}, to the track streams
+        of every prepared copy of song_id, ramped on the ones playing. They hold for
+        later preparations of the song too but are never persisted. Returns False,
+        changing nothing, while a copy plays from its pre-mixed bounce.
+        """
+        with self._locked_state():
+            entries = self._song_entries(song_id)
+            if any(entry['premixed'] for entry in entries):
+                return False
+            mix = self._track_mix.setdefault(song_id, {})
+            for track_id, change in changes.items():
+                mix.setdefault(track_id, {}).update(change)
+            for entry in entries:
+                self._apply_track_mix(entry)
+            tracks = {track_id: dict(state) for track_id, state in mix.items()}
+        self.events.post('mix', song_id=song_id, tracks=tracks)
+        return True
+
+    def track_mix(self, song_id):
+        """The live mix of song_id, {track_id: {'volume', 'muted', 'solo'}} with only what was set."""
+        with self._locked_state():
+            return {track_id: dict(state) for track_id, state in self._track_mix.get(song_id, {}).items()}
+
+    def song_tracks_changed(self, song_id):
+        """
+        For a song whose tracks were edited. New volumes go to its prepared copies like a
+        live mix change; any other change prepares it anew through invalidate_song.
+        """
+        song = self.get_song(song_id)
+        if song is None:
+            self.invalidate_song(song_id)
+            return
+        routing, volumes = self._track_routing(song), self._track_volumes(song)
+        with self._locked_state():
+            entries = self._song_entries(song_id)
+            live = all(entry['routing'] == routing and not (entry['premixed'] and entry['track_volumes'] != volumes)
+                       for entry in entries)
+            if live:
+                self._song_generations[song_id] += 1  # Preparations still running read the old volumes
+                for track_id, state in self._track_mix.get(song_id, {}).items():
+                    if state.get('volume') == volumes.get(track_id):
+                        del state['volume']  # Persisted now
+                for entry in entries:
+                    self._apply_track_mix(entry, volumes)
+        if not live:
+            self.invalidate_song(song_id)
+
+    def _song_entries(self, song_id):
+        """Every prepared copy of song_id, cached or not. Caller holds the state lock."""
+        queued_entry = self._queued['entry'] if self._queued is not None else None
+        entries = [*self._prepared.entries(song_id), self._preloaded_entry, self._playing_entry, queued_entry,
+                   *self._ending_entries]
+        return list({id(entry): entry for entry in entries if entry is not None and entry['song_id'] == song_id}
+                    .values())
+
+    def _apply_track_mix(self, entry, volumes=None):
+        """
+        Sets every track stream of entry to its gain: silent if muted or another track
+        is soloed, else its live volume or persisted volume. volumes replaces the
+        persisted ones. Caller holds the state lock.
+        """
+        if volumes is not None:
+            entry['track_volumes'] = volumes
+        mix = self._track_mix.get(entry['song_id'], {})
+        soloed = {track_id for track_id in entry['track_volumes'] if mix.get(track_id, {}).get('solo')}
+        plugged = any(mixer in self._plugged_mixers for mixer in entry['mixers'].values())
+        for track_id, stream in entry['track_streams'].items():
+            state = mix.get(track_id, {})
+            if state.get('muted') or (soloed and track_id not in soloed):
+                gain = 0.0
+            else:
+                gain = state.get('volume', entry['track_volumes'].get(track_id, 1.0))
+            if entry['track_gains'].get(track_id) == gain:
+                continue
+            if plugged:
+                ok = BASS_ChannelSlideAttribute(stream, BASS_ATTRIB_VOL, gain, int(MIX_RAMP * 1000))
+            else:
+                ok = BASS_ChannelSetAttribute(stream, BASS_ATTRIB_VOL, gain)
+            if ok:
+                entry['track_gains'][track_id] = gain
+            else:
+                logging.warning(f"Failed to set volume of track {track_id} of song {entry['song_id']}: "
+                                f"Error {BASS_ErrorGetCode()}")
+
+    # Position and level meters
+
+    def _start_meter(self):
+        """Caller holds the state lock."""
+        if self._meter_thread is None:
+            self._meter_thread = threading.Thread(target=self._meter_loop, name='PlaybackMeter', daemon=True)
+            self._meter_thread.start()
+
+    def _meter_loop(self):
+        """
+        Posts a 'meter' event every METER_INTERVAL while playing. Each is measured once,
+        whatever the number of listeners, and only the snapshot of what to measure is
+        taken under the state lock.
+        """
+        next_tick = time.monotonic()
+        while True:
+            with self._locked_state():
+                if not self._playback_active:
+                    self._meter_thread = None
+                    return
+                # A paused output still holds the audio it stopped at, which would show as a frozen level
+                entry, paused = self._playing_entry, self._paused
+                outputs = {} if paused else dict(self._output_mixers)
+                mixer = next(iter(self._active_mixer_handles), None)
+            try:
+                self.events.post('meter', paused=paused, **self._meter_reading(entry, mixer, outputs))
+            except Exception as e:
+                logging.error(f"Meter reading failed: {e}")
+            next_tick = max(next_tick + METER_INTERVAL, time.monotonic())
+            time.sleep(next_tick - time.monotonic())
+
+    def _meter_reading(self, entry, mixer, outputs):
+        """The heard position of the playing song and the levels of every output channel."""
+        position = None
+        if mixer:
+            pos = BASS_Mixer_ChannelGetPosition(mixer, BASS_POS_BYTE)
+            if pos not in (-1, 0xFFFFFFFFFFFFFFFF):
+                position = round(BASS_ChannelBytes2Seconds(mixer, pos), 3)
+        return {'song_id': entry['song_id'] if entry else None, 'position': position,
+                'duration': round(self._song_length(entry), 3) if entry else None,
+                'outputs': {str(dev_id): self._output_levels(output) for dev_id, output in outputs.items()}}
+
+    @staticmethod
+    def _output_levels(output):
+        """Per-channel peak and RMS (linear, 0-1) of the audio about to be heard on an output."""
+        info = BASS_CHANNELINFO()
+        if not BASS_ChannelGetInfo(output, byref(info)) or not info.chans:
+            return None
+        length = int(info.freq * METER_WINDOW) * info.chans * 4
+        buffer = create_string_buffer(length)
+        got = BASS_ChannelGetData(output, buffer, length | BASS_DATA_FLOAT)  # Doesn't consume a playing channel's data
+        if got in (-1, 0xFFFFFFFF) or got < info.chans * 4:
+            return None
+        samples = array('f', buffer.raw[:got - got % (info.chans * 4)])
+        peak, rms = [], []
+        for c in range(info.chans):
+            channel = samples[c::info.chans]
+            peak.append(round(max(max(channel), -min(channel)), 4))
+            rms.append(round(math.sqrt(sum(map(mul, channel, channel)) / len(channel)), 4))
+        return {'peak': peak, 'rms': rms}
 
     def clear_preload_state(self, acquire_lock=True):
         """
-        Clears only the preloaded song state (mixers and flags),
-        does not stop active playback.
+        Un-arms the preloaded song and frees it, unless it is the song playing right
+        now, which is freed once playback ends. Does not stop active playback.
         """
-        lock = callback_lock if acquire_lock else contextlib.nullcontext()
+        lock = self._locked_state() if acquire_lock else contextlib.nullcontext()
         with lock:
-            if self._is_song_preloaded or self._preloaded_mixers:
-                logging.debug("Clearing preload state (resources and flags)...")
-                for mixer_handle_to_free in self._preloaded_mixers.values():
-                    if mixer_handle_to_free:
-                        # If this mixer is somehow in _active_mixer_handles, it means stop() wasn't called properly before.
-                        # BASS_StreamFree will stop it anyway.
-                        if mixer_handle_to_free in self._active_mixer_handles:
-                            logging.warning(
-                                f"Preloaded mixer {mixer_handle_to_free} was found in active handles during clear_preload_state. This might indicate an issue if playback wasn't explicitly stopped first.")
-                        BASS_StreamFree(mixer_handle_to_free)
-
-                self._preloaded_song_id = None
-                self._preloaded_mixers = {}
-                self._is_song_preloaded = False
-                # Do NOT clear _active_mixer_handles here, as they might be playing something else,
-                # or stop() is responsible for them.
-                gc.collect()  # Optional
-                logging.debug("Preload state (resources and flags) cleared.")
-            # else:
-            #     logging.debug("Clear preload state called, but nothing was preloaded or mixers already cleared.")
-
-    def stop(self, acquire_lock=True):
-        """
-        Stops all current playback and clears the preloaded song state,
-        ensuring the next play action will start fresh.
-        """
-        lock = callback_lock if acquire_lock else contextlib.nullcontext()
+            entry = self._preloaded_entry
+            if entry is None:
+                return
+            logging.debug("Clearing preload state (resources and flags)...")
+            self._unarm()
+            self._drop_prepared_entry(entry)
+            logging.debug("Preload state (resources and flags) cleared.")
+
+    def _unarm(self):
+        self._start_token = None  # A start in progress doesn't swap its song in
+        self._preloaded_entry = None
+        self._preloaded_song_id = None
+        self._preloaded_mixers = {}
+        self._is_song_preloaded = False
+
+    def _drop_prepared_entry(self, entry):
+        if self._entry_in_use(entry):
+            self._prepared.detach(entry)
+            entry['stale'] = True  # Freed once it stops playing
+        elif self._prepared.detach(entry) or entry.get('stale'):
+            self._free_prepared_entry(entry)
+
+    def _end_playing_entry(self):
+        entry, self._playing_entry = self._playing_entry, None
+        if entry is not None and entry.get('stale') and entry is not self._preloaded_entry:
+            self._free_prepared_entry(entry)
+
+    def stop(self, acquire_lock=True, reason='stop'):
+        """
+        Stops all current playback and un-arms the preloaded song. Prepared songs stay
+        cached and are rewound when played again, so the next play starts fresh.
+        """
+        lock = self._locked_state() if acquire_lock else contextlib.nullcontext()
         with lock:
             # Check if there's anything to do (active playback or preloaded song)
-            if not self._playback_active and not self._active_mixer_handles and not self._is_song_preloaded:
+            if not self._playback_active and not self._active_mixer_handles and not self._is_song_preloaded \
+                    and not self._output_mixers:
                 logging.debug("Stop called, but nothing is playing and no song is preloaded.")
                 return
 
-            logging.info("AudioPlayer: Stop Requested. Halting playback and clearing preload.")
+            logging.info("AudioPlayer: Stop Requested. Halting playback and un-arming preload.")
 
             # 1. Stop any currently active playback
             if self._playback_active or self._active_mixer_handles:  # Check both flags
-                self._playback_active = False  # Signal playback to stop for monitor thread
-                if acquire_lock and self._playback_monitor_thread and self._playback_monitor_thread.is_alive():
-                    self._playback_monitor_thread.join(timeout=0.2)  # Give monitor a chance to exit
+                if self._playback_active:
+                    self.events.post('stopped', song_id=self._playing_entry['song_id'] if self._playing_entry else None,
+                                     reason=reason)
+                self._playback_active = False
 
                 handles_to_stop = list(self._active_mixer_handles)  # Iterate over a copy
                 self._active_mixer_handles = []  # Clear immediately
-
-                for mixer_h in handles_to_stop:
-                    if mixer_h:
-                        BASS_ChannelStop(mixer_h)
                 logging.debug(f"Stopped {len(handles_to_stop)} active mixer handles.")
 
-            # 2. Clear the preloaded song state (frees _preloaded_mixers and resets flags)
-            # This is crucial to ensure the next play starts fresh.
-            self.clear_preload_state(acquire_lock=False)  # We already hold the lock
+            # Nothing follows any more; unplugging the songs and freeing the outputs silences the devices
+            self._clear_loop()
+            self._paused = False
+            self._cancel_queued_song()
+            self._adopt_started_queued()
+            self._queued, self._transition_plan = None, []
+            self._free_output_mixers()
+            self._retire_ending_entries(force=True)
+
+            # 2. Un-arm the preloaded song; its entry stays in the prepared-song cache
+            self._unarm()
+            self._end_playing_entry()
 
             # Ensure playback_active is definitely false after all operations
             self._playback_active = False
 
-            logging.info("AudioPlayer: Stop complete. Playback halted and all preloads cleared.")
+            logging.info("AudioPlayer: Stop complete. Playback halted.")
 
     def is_playing(self):
-        with callback_lock:
-            if not self._playback_active or not self._active_mixer_handles: return False
-            for mixer_h in self._active_mixer_handles:
-                if BASS_ChannelIsActive(mixer_h) in [BASS_ACTIVE_PLAYING, BASS_ACTIVE_STALLED]: return True
-            self._playback_active = False
-            return False
+        """Kept current by the end syncs, so this asks neither BASS nor the state lock."""
+        return self._playback_active
+
+    def is_preloaded(self, song_id):
+        """Whether song_id is the armed song. Like is_playing(), this doesn't take the state lock."""
+        return self._is_song_preloaded and self._preloaded_song_id == song_id
+
+    def playback_status(self):
+        with self._locked_state():
+            playing = self._playing_entry if self._playback_active else None
+            return {'playing': playing is not None, 'song_id': playing['song_id'] if playing else None,
+                    'queued_song_id': self._queued['entry']['song_id'] if self._queued is not None else None,
+                    'paused': playing is not None and self._paused,
+                    'loop': {'start': round(self._loop['start'], 3), 'end': round(self._loop['end'], 3)}
+                    if self._loop is not None else None,
+                    'start': self.last_start_report}
 
     def shutdown(self):
         logging.info("AudioPlayer shutting down BASS...")
         self.stop()
+        self.events.shutdown()
+        self.preload_jobs.shutdown()
+        self._prefetcher.shutdown(wait=True, cancel_futures=True)
+        self._offline_jobs.shutdown(wait=True, cancel_futures=True)
+        self.clear_prepared_songs()
+        self._track_loader.shutdown(wait=True)
+        self.render_cache.save()
 
         current_device_before_free = BASS_GetDevice()
         initialized_devices_copy = list(self.initialized_devices)
@@ -677,25 +2241,7 @@ class AudioPlayer:
         for track in song_data_item['audio_tracks']:
             file_path_rel = track.get('file_path')
             if not file_path_rel: continue
-            file_path_abs = os.path.join(current_audio_folder, file_path_rel)
-            if not os.path.exists(file_path_abs): continue
-            flags = BASS_STREAM_DECODE | BASS_SAMPLE_FLOAT
-            temp_stream = 0
-            try:
-                temp_stream = BASS_StreamCreateFile(False, file_path_abs.encode('utf-8'), 0, 0, flags)
-                if temp_stream:
-                    length_bytes = BASS_ChannelGetLength(temp_stream, BASS_POS_BYTE)
-                    if length_bytes != 0xFFFFFFFFFFFFFFFF:
-                        duration_sec = BASS_ChannelBytes2Seconds(temp_stream, length_bytes)
-                        if duration_sec > max_duration: max_duration = duration_sec
-                    else:
-                        logging.warning(
-                            f"BASS_ChannelGetLength failed for {file_path_rel} (duration calc). Error: {BASS_ErrorGetCode()}")
-                else:
-                    logging.warning(
-                        f"BASS_StreamCreateFile failed for {file_path_rel} (duration calc). Error: {BASS_ErrorGetCode()}")
-            except Exception as e:
-                logging.error(f"Exception in duration calc for {file_path_rel}: {e}")
-            finally:
-                if temp_stream: BASS_StreamFree(temp_stream)
-        return max_duration
\ No newline at end of file
+            metadata = self.metadata_index.get(os.path.join(current_audio_folder, file_path_rel))
+            if metadata and metadata['duration'] > max_duration: max_duration = metadata['duration']
+        self.metadata_index.save()
+        return max_duration
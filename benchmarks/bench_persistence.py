@@ -0,0 +1,78 @@
+"""
+Compares the cost of persisting a single track edit with a full songs.json rewrite
+against the journaled backend, for growing library sizes.
+
+    python benchmarks/bench_persistence.py
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from persistence import JournaledJsonFile, atomic_write, replay_journal  # noqa: E402
+
+LIBRARY_SIZES = [100, 1000, 5000]
+EDITS = 50
+TRACKS_PER_SONG = 16
+
+
+def make_library(num_songs):
+    return {'songs': [{'id': i, 'name': f"Song {i}", 'tempo': 120,
+                       'audio_tracks': [{'id': t, 'file_path': f"song{i}_stem{t}.wav", 'output_channel': t + 1,
+                                         'volume': 1.0, 'is_stereo': False} for t in range(1, TRACKS_PER_SONG + 1)]}
+                      for i in range(1, num_songs + 1)]}
+
+
+def bench_full_rewrite(dir_path, data):
+    file_path = os.path.join(dir_path, 'songs_full.json')
+    start = time.perf_counter()
+    for n in range(EDITS):
+        song = data['songs'][n % len(data['songs'])]
+        song['audio_tracks'][0]['volume'] = (n % 100) / 100
+        atomic_write(file_path, json.dumps(data, indent=2))
+    return (time.perf_counter() - start) / EDITS
+
+
+def bench_journaled(dir_path, data, group_commit):
+    file_path = os.path.join(dir_path, f"songs_journal_{int(group_commit)}.json")
+    atomic_write(file_path, json.dumps(data, indent=2))
+
+    def load():
+        with open(file_path, 'r', encoding='utf-8') as f:
+            loaded = json.load(f)
+        replay_journal(loaded, file_path, 'songs')
+        return loaded
+
+    # EDITS stays below the compaction threshold; a compaction costs one full rewrite per threshold edits
+    backend = JournaledJsonFile(file_path, 'songs', load, commit_delay=0.0)
+    start = time.perf_counter()
+    for n in range(EDITS):
+        song = data['songs'][n % len(data['songs'])]
+        song['audio_tracks'][0]['volume'] = (n % 100) / 100
+        backend.commit(data, upserts=[song])
+        if not group_commit:
+            backend.flush()
+    backend.flush()
+    elapsed = (time.perf_counter() - start) / EDITS
+    backend.close()
+    assert load()['songs'][EDITS % len(data['songs']) - 1]['audio_tracks'][0]['volume'] == \
+        data['songs'][EDITS % len(data['songs']) - 1]['audio_tracks'][0]['volume']
+    return elapsed
+
+
+def main():
+    print(f"Per-edit persist cost over {EDITS} track edits ({TRACKS_PER_SONG} tracks per song)")
+    print(f"{'songs':>8} {'full rewrite':>14} {'journal+fsync':>14} {'group commit':>14}")
+    for num_songs in LIBRARY_SIZES:
+        with tempfile.TemporaryDirectory() as dir_path:
+            full = bench_full_rewrite(dir_path, make_library(num_songs))
+            journaled = bench_journaled(dir_path, make_library(num_songs), group_commit=False)
+            grouped = bench_journaled(dir_path, make_library(num_songs), group_commit=True)
+        print(f"{num_songs:>8} {full * 1000:>12.2f}ms {journaled * 1000:>12.2f}ms {grouped * 1000:>12.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
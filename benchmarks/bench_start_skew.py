@@ -0,0 +1,105 @@
+"""
+Measures the start skew of a song routed to several output devices, started through
+prepare_song and play_preloaded_song with and without a synchronized start. It uses
+every enabled output device BASS lists, the "no sound" device included, and needs at
+least two. Fails if a synchronized start ever drifts past SKEW_BOUND_MS.
+
+On a machine with no audio hardware only the no-sound device exists, so the skew
+between real devices (each with its own clock and buffer) can't be shown there; run
+it where the show's interfaces are connected.
+
+    python benchmarks/bench_start_skew.py
+"""
+import os
+import sys
+import tempfile
+import time
+import wave
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modpybass.pybass import *  # noqa: E402,F403
+
+from audioplayer_module import BASS_DEVICE_LOOPBACK, START_SKEW_MEASURE_DELAY, AudioPlayer  # noqa: E402
+
+SAMPLE_RATE = 48000
+MAX_DEVICES = 4
+CHANNELS_PER_DEVICE = 2
+STEM_SECONDS = 5
+TRIALS = 20
+SKEW_BOUND_MS = 2.0
+SONG_ID = 1
+
+
+def output_devices():
+    devices, info, idx = [], BASS_DEVICEINFO(), 0
+    while len(devices) < MAX_DEVICES and BASS_GetDeviceInfo(idx, info):
+        if info.flags & BASS_DEVICE_ENABLED and not info.flags & BASS_DEVICE_LOOPBACK:
+            devices.append(idx)
+        idx += 1
+    return devices
+
+
+def write_stem(file_path):
+    with wave.open(file_path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(array('h', bytes(SAMPLE_RATE * STEM_SECONDS * 2)).tobytes())
+
+
+def make_player(tmp, devices, synchronized):
+    """A player whose one song has a track on the first channel of every device."""
+    song = {'id': SONG_ID, 'name': 'Skew', 'tempo': 120,
+            'audio_tracks': [{'id': n, 'file_path': 'stem.wav', 'output_channel': 1 + n * CHANNELS_PER_DEVICE,
+                              'volume': 1.0, 'is_stereo': False} for n in range(len(devices))]}
+    settings = {'audio_outputs': [{'device_id': dev_id, 'channels': [1 + n * CHANNELS_PER_DEVICE + c
+                                                                     for c in range(CHANNELS_PER_DEVICE)]}
+                                  for n, dev_id in enumerate(devices)],
+                'volume': 1.0, 'sample_rate': SAMPLE_RATE, 'synchronized_start': synchronized}
+    player = AudioPlayer(tmp, os.path.join(tmp, 'audio'), {SONG_ID: song}.get, lambda: settings, 64,
+                         SAMPLE_RATE, os.path.join(tmp, 'metadata.json'))
+    player.initialize_bass()
+    return player
+
+
+def measure(player, devices):
+    assert player.prepare_song(SONG_ID), "the song could not be prepared"
+    assert player.play_preloaded_song(), "the song did not start"
+    try:
+        time.sleep(START_SKEW_MEASURE_DELAY + 0.2)  # The player measures the skew itself after this delay
+        report = player.last_start_report
+        assert report is not None, "the player reported no start skew"
+        assert report['devices'] == len(devices), f"only {report['devices']} of {len(devices)} devices started"
+        return report['skew_ms']
+    finally:
+        player.stop()
+
+
+def main():
+    devices = output_devices()
+    if len(devices) < 2:
+        sys.exit(f"Needs at least two output devices, found {devices}.")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, 'audio'))
+        write_stem(os.path.join(tmp, 'audio', 'stem.wav'))
+        for synchronized in (False, True):
+            player = make_player(tmp, devices, synchronized)
+            try:
+                results[synchronized] = [measure(player, devices) for _ in range(TRIALS)]
+            finally:
+                player.shutdown()
+
+    print(f"Devices {devices}, {TRIALS} starts each")
+    for synchronized, skews in results.items():
+        label = 'synchronized' if synchronized else 'sequential'
+        print(f"  {label:>12}: mean {sum(skews) / len(skews):7.3f} ms   max {max(skews):7.3f} ms")
+    worst = max(results[True])
+    assert worst <= SKEW_BOUND_MS, f"synchronized start skew {worst:.3f} ms exceeds {SKEW_BOUND_MS} ms"
+    print(f"Synchronized start stayed within {SKEW_BOUND_MS} ms.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Stress test of the player's locking: many threads prepare, preload, play, stop and
+invalidate songs at once on the BASS "no sound" device while stop() and is_playing()
+latencies are recorded. Fails if their p99 isn't sub-millisecond or a single call
+took longer than its bound, i.e. if they end up waiting on a preparation.
+
+    python benchmarks/bench_stop_latency.py
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import wave
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audioplayer_module import AudioPlayer  # noqa: E402
+
+NO_SOUND_DEVICE = 0
+SAMPLE_RATE = 48000
+SONGS = 6
+TRACKS_PER_SONG = 16
+STEM_SECONDS = 20
+THREADS = 16
+DURATION = 15.0
+P99_BOUND_MS = 1.0
+# Any single call may wait out the interpreter's 5 ms thread switch interval under this much contention
+STOP_BOUND_MS = 20.0
+IS_PLAYING_BOUND_MS = 5.0
+
+
+def write_stems(audio_folder):
+    silence = array('h', bytes(SAMPLE_RATE * STEM_SECONDS * 2)).tobytes()
+    for song_id in range(SONGS):
+        for track in range(TRACKS_PER_SONG):
+            with wave.open(os.path.join(audio_folder, f"song{song_id}_stem{track}.wav"), 'wb') as f:
+                f.setnchannels(1)
+                f.setsampwidth(2)
+                f.setframerate(SAMPLE_RATE)
+                f.writeframes(silence)
+
+
+def make_songs():
+    return {song_id: {'id': song_id, 'name': f"Song {song_id}", 'tempo': 120,
+                      'audio_tracks': [{'id': t, 'file_path': f"song{song_id}_stem{t}.wav", 'output_channel': 1 + t % 2,
+                                        'volume': 1.0, 'is_stereo': False} for t in range(TRACKS_PER_SONG)]}
+            for song_id in range(SONGS)}
+
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_folder = os.path.join(tmp, 'audio')
+        os.makedirs(audio_folder)
+        write_stems(audio_folder)
+        songs = make_songs()
+        settings = {'audio_outputs': [{'device_id': NO_SOUND_DEVICE, 'channels': [1, 2]}], 'volume': 1.0,
+                    'sample_rate': SAMPLE_RATE}
+        player = AudioPlayer(tmp, audio_folder, songs.get, lambda: settings, 64, SAMPLE_RATE,
+                             os.path.join(tmp, 'metadata.json'))
+        player.initialize_bass()
+
+        stop_times, is_playing_times, errors = [], [], []
+        deadline = time.monotonic() + DURATION
+
+        def worker(n):
+            rng = random.Random(n)
+            while time.monotonic() < deadline:
+                song_id = rng.randrange(SONGS)
+                try:
+                    if n % 4 == 0:
+                        player.prepare_song(song_id, arm=False)
+                    elif n % 4 == 1:
+                        player.preload_song(song_id)
+                        player.play_preloaded_song()
+                    elif n % 4 == 2:
+                        start = time.perf_counter()
+                        player.stop()
+                        stop_times.append(time.perf_counter() - start)
+                        time.sleep(0.01)
+                    else:
+                        start = time.perf_counter()
+                        player.is_playing()
+                        is_playing_times.append(time.perf_counter() - start)
+                        if rng.random() < 0.02:
+                            player.invalidate_song(song_id)
+                        time.sleep(0.001)
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = player.prepared_songs_stats()
+        player.shutdown()
+
+    print(f"{THREADS} threads for {DURATION:g} s, {SONGS} songs of {TRACKS_PER_SONG} stems")
+    for name, times in (('stop()', stop_times), ('is_playing()', is_playing_times)):
+        print(f"  {name:>13}: {len(times):6d} calls   p50 {percentile(times, 0.5):8.3f} ms   "
+              f"p99 {percentile(times, 0.99):8.3f} ms   max {max(times) * 1000:8.3f} ms")
+    print(f"  prepared-song cache: {stats['hits']} hits, {stats['misses']} misses")
+    assert not errors, f"{len(errors)} calls raised, first: {errors[0]!r}"
+    for name, times in (('stop()', stop_times), ('is_playing()', is_playing_times)):
+        assert percentile(times, 0.99) <= P99_BOUND_MS, f"{name} p99 is {percentile(times, 0.99):.3f} ms"
+    assert max(stop_times) * 1000 <= STOP_BOUND_MS, f"stop() took up to {max(stop_times) * 1000:.3f} ms"
+    assert max(is_playing_times) * 1000 <= IS_PLAYING_BOUND_MS, \
+        f"is_playing() took up to {max(is_playing_times) * 1000:.3f} ms"
+    print("stop() and is_playing() stayed within their bounds.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares the json (journaled) and sqlite storage backends for a 10k song library:
+initial migration/full write, startup load and the cost of single-song edits.
+
+    python benchmarks/bench_storage_backends.py
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from library_store import LibraryStore  # noqa: E402
+from persistence import JournaledJsonFile, atomic_write, replay_journal  # noqa: E402
+from sqlite_backend import SqliteLibraryDatabase  # noqa: E402
+
+NUM_SONGS = 10000
+TRACKS_PER_SONG = 16
+EDITS = 200
+
+
+def make_library():
+    songs = [{'id': i, 'name': f"Song {i}", 'tempo': 120,
+              'audio_tracks': [{'id': t, 'file_path': f"song{i}_stem{t}.wav", 'output_channel': t + 1,
+                                'volume': 1.0, 'is_stereo': False} for t in range(1, TRACKS_PER_SONG + 1)]}
+             for i in range(1, NUM_SONGS + 1)]
+    setlists = [{'id': i, 'name': f"Setlist {i}", 'song_ids': list(range(i * 20, i * 20 + 20))} for i in range(1, 50)]
+    return {'songs': songs}, {'setlists': setlists}
+
+
+def json_backends(dir_path, songs_data, setlists_data):
+    backends = []
+    for file_name, key, data in (('songs.json', 'songs', songs_data), ('setlists.json', 'setlists', setlists_data)):
+        file_path = os.path.join(dir_path, file_name)
+        atomic_write(file_path, json.dumps(data, indent=2))
+
+        def load(file_path=file_path, key=key):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            replay_journal(loaded, file_path, key)
+            return loaded
+        backends.append(JournaledJsonFile(file_path, key, load, commit_delay=0.0))
+    return backends
+
+
+def sqlite_backends(dir_path, songs_data, setlists_data):
+    database = SqliteLibraryDatabase(os.path.join(dir_path, 'library.db'))
+    database.migrate_from(songs_data, setlists_data)
+    return [database.songs_backend(), database.setlists_backend()]
+
+
+def run(name, create_backends):
+    with tempfile.TemporaryDirectory() as dir_path:
+        songs_data, setlists_data = make_library()
+        start = time.perf_counter()
+        backends = create_backends(dir_path, songs_data, setlists_data)
+        initial_write = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store = LibraryStore(*backends)
+        load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for n in range(EDITS):
+            song_id = (n * 37) % NUM_SONGS + 1
+            store.update_track(song_id, 1, {'volume': (n % 100) / 100})
+            store.save_songs()
+            store.flush()
+        edit = (time.perf_counter() - start) / EDITS
+        store.close()
+    print(f"{name:>8} {initial_write * 1000:>12.1f}ms {load * 1000:>10.1f}ms {edit * 1000:>10.3f}ms")
+
+
+def main():
+    print(f"{NUM_SONGS} songs x {TRACKS_PER_SONG} tracks, {EDITS} durable single-track edits")
+    print(f"{'backend':>8} {'full write':>14} {'load':>12} {'per edit':>12}")
+    run('json', json_backends)
+    run('sqlite', sqlite_backends)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Checks that the journaled backend survives the two ways a write can go wrong: a last
+journal line torn by a power cut, which must not swallow the changes committed after
+the restart, and a failed write, whose changes must stay queued until they are on disk.
+
+    python benchmarks/check_journal_recovery.py
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from persistence import JournaledJsonFile, atomic_write, journal_path_for, replay_journal  # noqa: E402
+
+
+def make_backend(file_path):
+    def load():
+        with open(file_path, 'r', encoding='utf-8') as f:
+            loaded = json.load(f)
+        replay_journal(loaded, file_path, 'songs')
+        return loaded
+    return JournaledJsonFile(file_path, 'songs', load, commit_delay=0.0)
+
+
+def song_ids(file_path):
+    backend = make_backend(file_path)
+    try:
+        return sorted(song['id'] for song in backend.load()['songs'])
+    finally:
+        backend.close()
+
+
+def check_torn_tail(dir_path):
+    file_path = os.path.join(dir_path, 'songs_torn.json')
+    atomic_write(file_path, json.dumps({'songs': [{'id': 1}]}))
+    with open(journal_path_for(file_path), 'w', encoding='utf-8') as f:
+        f.write('{"op":"put","item":{"id":2')  # Power cut mid-append
+
+    backend = make_backend(file_path)
+    data = backend.load()
+    data['songs'].append({'id': 3})
+    assert backend.commit(data, upserts=[{'id': 3}])
+    backend.close()
+
+    ids = song_ids(file_path)  # The restart
+    assert ids == [1, 3], f"after a torn journal line and a commit, songs {ids} survived a restart"
+    print("Torn journal line: the commit after it survived the restart.")
+
+
+def check_failed_write(dir_path):
+    file_path = os.path.join(dir_path, 'songs_failed.json')
+    atomic_write(file_path, json.dumps({'songs': [{'id': 1}]}))
+    journal_path = journal_path_for(file_path)
+
+    backend = make_backend(file_path)
+    data = backend.load()
+    os.makedirs(journal_path)  # Appending to a directory fails like a full or read-only disk
+    data['songs'].append({'id': 2})
+    assert backend.commit(data, upserts=[{'id': 2}])
+    assert not backend.flush(), "flush() reported a failed write as done"
+    shutil.rmtree(journal_path)
+    assert backend.flush(), "the failed change was not written once the disk recovered"
+    backend.close()
+
+    ids = song_ids(file_path)
+    assert ids == [1, 2], f"after a failed write and a retry, songs {ids} survived a restart"
+    print("Failed write: the change stayed queued and was written on retry.")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        check_torn_tail(tmp)
+        check_failed_write(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Checks that a packed song plays each stem on its own outputs: three stems of one and
+two channels are packed into one 4-channel file, routed out of order onto a 4-channel
+device, and the decoded device mixer must carry every stem channel at its own level on
+its own output. Runs on the BASS "no sound" device, so no audio hardware is needed.
+
+    python benchmarks/check_packed_song.py
+"""
+import math
+import os
+import sys
+import tempfile
+import wave
+from array import array
+from ctypes import c_float
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modpybass.pybass import *  # noqa: E402,F403
+from modpybass.pybassmix import *  # noqa: E402,F403
+
+from audioplayer_module import AudioPlayer  # noqa: E402
+
+NO_SOUND_DEVICE = 0
+SAMPLE_RATE = 48000
+OUTPUT_CHANNELS = [1, 2, 3, 4]
+STEM_SECONDS = 2
+READ_SECONDS = 0.5
+# file, channel amplitudes, first output channel, is_stereo. Packed as channels 0 | 1-2 | 3.
+STEMS = [('pad.wav', [0.2], 3, False),
+         ('keys.wav', [0.4, 0.6], 1, True),
+         ('click.wav', [0.8], 4, False)]
+EXPECTED_PEAKS = {1: 0.4, 2: 0.6, 3: 0.2, 4: 0.8}
+
+
+def write_tone(file_path, amplitudes):
+    channels = len(amplitudes)
+    tone = array('h', (int(amplitudes[ch] * 32767 * math.sin(2 * math.pi * 440 * n / SAMPLE_RATE))
+                       for n in range(SAMPLE_RATE * STEM_SECONDS) for ch in range(channels)))
+    with wave.open(file_path, 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(tone.tobytes())
+
+
+def channel_peaks(mixer, channels):
+    samples = (c_float * (int(SAMPLE_RATE * READ_SECONDS) * channels))()
+    got = BASS_ChannelGetData(mixer, samples, len(samples) * 4 | BASS_DATA_FLOAT)
+    assert got not in (0, 0xFFFFFFFF), f"the device mixer gave no data: Error {BASS_ErrorGetCode()}"
+    frames = got // 4 // channels
+    return [max(abs(samples[n * channels + ch]) for n in range(frames)) for ch in range(channels)]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_folder = os.path.join(tmp, 'audio')
+        os.makedirs(audio_folder)
+        for file_path, amplitudes, _, _ in STEMS:
+            write_tone(os.path.join(audio_folder, file_path), amplitudes)
+        song = {'id': 1, 'name': 'Packed', 'tempo': 120,
+                'audio_tracks': [{'id': n, 'file_path': file_path, 'output_channel': ch, 'volume': 1.0,
+                                  'is_stereo': is_stereo} for n, (file_path, _, ch, is_stereo) in enumerate(STEMS, 1)]}
+        settings = {'audio_outputs': [{'device_id': NO_SOUND_DEVICE, 'channels': OUTPUT_CHANNELS}], 'volume': 1.0,
+                    'sample_rate': SAMPLE_RATE, 'pack_songs': True}
+        player = AudioPlayer(tmp, audio_folder, {1: song}.get, lambda: settings, 64, SAMPLE_RATE,
+                             os.path.join(tmp, 'metadata.json'))
+        player.initialize_bass()
+        try:
+            player._pack_song(1)
+            assert player.packs.stats()['packed'] == 1, f"the song was not packed: {player.packs.stats()}"
+            assert player.prepare_song(1, arm=False), "the song could not be prepared"
+            assert player.last_prepare_timings['packed'], "the song was not prepared from its pack"
+            with player._locked_state():
+                entry = player._prepared.latest(1)
+
+            peaks = channel_peaks(entry['mixers'][NO_SOUND_DEVICE], len(OUTPUT_CHANNELS))
+            print("  channel peaks: " + "  ".join(f"{ch}: {peak:.3f}" for ch, peak in zip(OUTPUT_CHANNELS, peaks)))
+            for ch, peak in zip(OUTPUT_CHANNELS, peaks):
+                assert abs(peak - EXPECTED_PEAKS[ch]) < 0.05, \
+                    f"channel {ch} peaks at {peak:.3f}, not {EXPECTED_PEAKS[ch]}"
+        finally:
+            player.shutdown()
+    print("Every packed stem played on its own outputs at its own level.")
+
+
+if __name__ == '__main__':
+    main()
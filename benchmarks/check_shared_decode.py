@@ -0,0 +1,99 @@
+"""
+Checks that a stem routed to three outputs is decoded once: preparing the song opens
+the file a single time, each track plays from its own splitter of that decode, and the
+decoded device mixer carries the stem on all three channels. Runs on the BASS "no
+sound" device, so no audio hardware is needed.
+
+    python benchmarks/check_shared_decode.py
+"""
+import math
+import os
+import sys
+import tempfile
+import wave
+from array import array
+from ctypes import byref, c_float
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modpybass.pybass import *  # noqa: E402,F403
+from modpybass.pybassmix import *  # noqa: E402,F403
+
+from audioplayer_module import AudioPlayer  # noqa: E402
+
+NO_SOUND_DEVICE = 0
+SAMPLE_RATE = 48000
+OUTPUT_CHANNELS = [1, 2, 3, 4]
+CLICK_CHANNELS = [1, 2, 3]  # Channel 4 gets nothing and must stay silent
+STEM_SECONDS = 2
+AMPLITUDE = 0.5
+READ_SECONDS = 0.5
+
+
+def write_click(file_path):
+    tone = array('h', (int(AMPLITUDE * 32767 * math.sin(2 * math.pi * 440 * n / SAMPLE_RATE))
+                       for n in range(SAMPLE_RATE * STEM_SECONDS)))
+    with wave.open(file_path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(tone.tobytes())
+
+
+def channel_peaks(mixer, channels):
+    samples = (c_float * (int(SAMPLE_RATE * READ_SECONDS) * channels))()
+    got = BASS_ChannelGetData(mixer, samples, len(samples) * 4 | BASS_DATA_FLOAT)
+    assert got not in (0, 0xFFFFFFFF), f"the device mixer gave no data: Error {BASS_ErrorGetCode()}"
+    frames = got // 4 // channels
+    return [max(abs(samples[n * channels + ch]) for n in range(frames)) for ch in range(channels)]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_folder = os.path.join(tmp, 'audio')
+        os.makedirs(audio_folder)
+        write_click(os.path.join(audio_folder, 'click.wav'))
+        song = {'id': 1, 'name': 'Click', 'tempo': 120,
+                'audio_tracks': [{'id': n, 'file_path': 'click.wav', 'output_channel': ch, 'volume': 1.0,
+                                  'is_stereo': False} for n, ch in enumerate(CLICK_CHANNELS, 1)]}
+        settings = {'audio_outputs': [{'device_id': NO_SOUND_DEVICE, 'channels': OUTPUT_CHANNELS}], 'volume': 1.0,
+                    'sample_rate': SAMPLE_RATE}
+        player = AudioPlayer(tmp, audio_folder, {1: song}.get, lambda: settings, 64, SAMPLE_RATE,
+                             os.path.join(tmp, 'metadata.json'))
+        player.initialize_bass()
+
+        opened = []
+        create_source_stream = player._create_source_stream
+        player._create_source_stream = lambda path: opened.append(path) or create_source_stream(path)
+        try:
+            assert player.prepare_song(1, arm=False), "the song could not be prepared"
+            with player._locked_state():
+                entry = player._prepared.latest(1)
+            assert len(opened) == 1, f"click.wav was opened {len(opened)} times for {len(CLICK_CHANNELS)} tracks"
+            assert len(entry['shared_sources']) == 1, f"expected one shared decode, got {entry['shared_sources']}"
+            decode = entry['shared_sources'][0]
+            splitters = entry['streams']
+            assert len(set(splitters)) == len(CLICK_CHANNELS), f"expected a splitter per track, got {splitters}"
+            for splitter in splitters:
+                assert BASS_Split_StreamGetSource(splitter) == decode, f"stream {splitter} isn't a splitter of the decode"
+            print(f"click.wav opened once, {len(splitters)} splitters of decode {decode}")
+
+            peaks = channel_peaks(entry['mixers'][NO_SOUND_DEVICE], len(OUTPUT_CHANNELS))
+            print("  channel peaks: " + "  ".join(f"{ch}: {peak:.3f}" for ch, peak in zip(OUTPUT_CHANNELS, peaks)))
+            for ch, peak in zip(OUTPUT_CHANNELS, peaks):
+                if ch in CLICK_CHANNELS:
+                    assert abs(peak - AMPLITUDE) < 0.05, f"channel {ch} peaks at {peak:.3f}, not {AMPLITUDE}"
+                else:
+                    assert peak < 1e-4, f"channel {ch} should be silent but peaks at {peak:.3f}"
+
+            handles = [decode, *splitters]
+            player.clear_prepared_songs()
+            leaked = [h for h in handles if BASS_ChannelGetInfo(h, byref(BASS_CHANNELINFO()))]
+            assert not leaked, f"handles {leaked} were not freed with the prepared song"
+        finally:
+            player.shutdown()
+    print("One decode fed all three outputs and was freed with its splitters.")
+
+
+if __name__ == '__main__':
+    main()
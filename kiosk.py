@@ -5,7 +5,7 @@ import threading
 import traceback
 
 from waitress import serve
-from app import app, audio_player, config
+from app import app, audio_player, config, SERVER_THREADS
 
 _cleanup_lock = threading.Lock()
 _cleanup_has_run = False
@@ -44,7 +44,7 @@ if __name__ == '__main__':
 
         logging.info(f"kiosk.py: Starting Waitress server on http://127.0.0.1:5001...")
         # For Waitress, there isn't a direct 'server.shutdown()' method easily callable
-        serve(app, host='0.0.0.0', port=5001, threads=8)
+        serve(app, host='0.0.0.0', port=5001, threads=SERVER_THREADS)
         # If serve() returns normally (e.g. not via exception), it means server stopped.
         logging.info("kiosk.py: Waitress serve() call has returned.")
 
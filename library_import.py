@@ -0,0 +1,244 @@
+import codecs
+import json
+import logging
+
+CHUNK_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 100
+TRANSITION_TYPES = ('segue', 'crossfade')
+MAX_CROSSFADE_SECONDS = 30.0
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+class _StreamReader:
+    """Text buffer over a binary stream that is refilled on demand and trimmed as items are consumed."""
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buf = self.buf[self.pos:] + self._utf8.decode(b'', final=True)
+        else:
+            self.buf = self.buf[self.pos:] + (self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        self.pos = 0
+        return True
+
+    def skip_whitespace(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill():
+                return
+
+    def peek(self):
+        self.skip_whitespace()
+        return self.buf[self.pos] if self.pos < len(self.buf) else ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ImportFormatError(f"Expected '{char}' but found '{self.peek() or 'end of file'}'")
+        self.pos += 1
+
+    def decode_value(self):
+        """Decodes the next JSON value, reading more input until it is complete."""
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # A value ending exactly at the buffer end may be a truncated number or literal
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ImportFormatError(f"Invalid JSON: {e.msg}")
+            self.fill()
+
+
+def iter_collection_items(stream, collection_key):
+    """
+    Yields the items of the top-level array stored under collection_key without
+    loading the whole document. Other top-level keys are parsed and discarded.
+    """
+    reader = _StreamReader(stream)
+    reader.expect('{')
+    found = False
+    if reader.peek() == '}':
+        reader.pos += 1
+    else:
+        while True:
+            key = reader.decode_value()
+            if not isinstance(key, str):
+                raise ImportFormatError("Object keys must be strings")
+            reader.expect(':')
+            if key == collection_key and not found:
+                found = True
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.pos += 1
+                else:
+                    while True:
+                        yield reader.decode_value()
+                        if reader.peek() == ',':
+                            reader.pos += 1
+                            continue
+                        reader.expect(']')
+                        break
+            else:
+                reader.decode_value()
+            if reader.peek() == ',':
+                reader.pos += 1
+                continue
+            reader.expect('}')
+            break
+    if not found:
+        raise ImportFormatError(f"Missing top-level '{collection_key}' list")
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate_song(song, max_logical_channels):
+    if not isinstance(song, dict): return "is not an object"
+    if not _is_int(song.get('id')): return "has no integer 'id'"
+    if not isinstance(song.get('name', ''), str): return "'name' must be a string"
+    if 'tempo' in song and not (_is_int(song['tempo']) and song['tempo'] > 0): return "'tempo' must be a positive integer"
+    tracks = song.get('audio_tracks', [])
+    if not isinstance(tracks, list): return "'audio_tracks' must be a list"
+    track_ids = set()
+    for i, track in enumerate(tracks):
+        if not isinstance(track, dict): return f"track {i} is not an object"
+        if not isinstance(track.get('file_path'), str) or not track['file_path']:
+            return f"track {i} has no 'file_path'"
+        if track.get('id') is not None:
+            if not _is_int(track['id']) or track['id'] in track_ids: return f"track {i} has an invalid or duplicate 'id'"
+            track_ids.add(track['id'])
+        channel = track.get('output_channel', 1)
+        if not (_is_int(channel) and 1 <= channel <= max_logical_channels):
+            return f"track {i} has an invalid 'output_channel'"
+        volume = track.get('volume', 1.0)
+        if isinstance(volume, bool) or not isinstance(volume, (int, float)) or volume < 0:
+            return f"track {i} has an invalid 'volume'"
+        if not isinstance(track.get('is_stereo', False), bool): return f"track {i} has a non-boolean 'is_stereo'"
+    return validate_markers(song.get('markers', []))
+
+
+def _is_seconds(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+
+def validate_markers(markers):
+    """
+    A song's markers are cue points {'name', 'position'} in seconds; one with an 'end' after
+    its position is also a loop region.
+    """
+    if not isinstance(markers, list): return "'markers' must be a list"
+    marker_ids = set()
+    for i, marker in enumerate(markers):
+        if not isinstance(marker, dict): return f"marker {i} is not an object"
+        if not isinstance(marker.get('name', ''), str): return f"marker {i} has a non-string 'name'"
+        if not _is_seconds(marker.get('position')): return f"marker {i} needs a 'position' of 0 seconds or more"
+        if marker.get('end') is not None and not (_is_seconds(marker['end']) and marker['end'] > marker['position']):
+            return f"marker {i} has an 'end' that isn't after its position"
+        if marker.get('id') is not None:
+            if not _is_int(marker['id']) or marker['id'] in marker_ids: return f"marker {i} has an invalid or duplicate 'id'"
+            marker_ids.add(marker['id'])
+    return None
+
+
+def validate_track_mix(tracks):
+    """
+    A live mix change maps track ids (as strings) to any of a 'volume' of 0 or more and
+    'muted' and 'solo' flags.
+    """
+    if not isinstance(tracks, dict) or not tracks: return "'tracks' must be a non-empty object"
+    for track_id, change in tracks.items():
+        if not isinstance(change, dict) or not change: return f"track {track_id} has no changes"
+        if set(change) - {'volume', 'muted', 'solo'}: return f"track {track_id} has unknown fields"
+        volume = change.get('volume', 1.0)
+        if isinstance(volume, bool) or not isinstance(volume, (int, float)) or volume < 0:
+            return f"track {track_id} has an invalid 'volume'"
+        if not all(isinstance(change.get(flag, False), bool) for flag in ('muted', 'solo')):
+            return f"track {track_id} has a non-boolean 'muted' or 'solo'"
+    return None
+
+
+def validate_setlist(setlist):
+    if not isinstance(setlist, dict): return "is not an object"
+    if not _is_int(setlist.get('id')): return "has no integer 'id'"
+    if not isinstance(setlist.get('name', ''), str): return "'name' must be a string"
+    song_ids = setlist.get('song_ids', [])
+    if not isinstance(song_ids, list) or not all(_is_int(sid) for sid in song_ids):
+        return "'song_ids' must be a list of integers"
+    return validate_transitions(setlist.get('transitions', []), len(song_ids))
+
+
+def validate_transitions(transitions, entry_count=None):
+    """
+    A setlist's transitions are a list aligned with its song_ids: item i is how entry i
+    flows into the next one, {'type': 'segue'} or {'type': 'crossfade', 'duration': seconds},
+    or null. The older object keyed by song id (as a string) is still accepted.
+    """
+    if isinstance(transitions, dict):
+        for song_id in transitions:
+            if not song_id.isdigit(): return f"transition key '{song_id}' is not a song id"
+        items = [(f"song {song_id}", transition) for song_id, transition in transitions.items()]
+    elif isinstance(transitions, list):
+        if entry_count is not None and len(transitions) > entry_count:
+            return f"there are {len(transitions)} transitions for {entry_count} setlist entries"
+        items = [(f"entry {index}", transition) for index, transition in enumerate(transitions) if transition is not None]
+    else:
+        return "'transitions' must be a list"
+    for name, transition in items:
+        if not isinstance(transition, dict) or transition.get('type') not in TRANSITION_TYPES:
+            return f"transition of {name} must have a 'type' of {' or '.join(TRANSITION_TYPES)}"
+        if transition['type'] == 'crossfade':
+            duration = transition.get('duration')
+            if isinstance(duration, bool) or not isinstance(duration, (int, float)) or \
+                    not 0 < duration <= MAX_CROSSFADE_SECONDS:
+                return f"crossfade of {name} needs a 'duration' between 0 and {MAX_CROSSFADE_SECONDS:g} seconds"
+    return None
+
+
+def stream_import(stream, import_type, max_logical_channels):
+    """
+    Parses and validates an exported songs.json or setlists.json item by item.
+    Invalid items are skipped. Returns (data, errors, error_count) where data is in the
+    file's own format and errors holds up to MAX_REPORTED_ERRORS messages.
+    Raises ImportFormatError if the document itself is malformed.
+    """
+    items, seen_ids, errors, error_count = [], set(), [], 0
+    for index, item in enumerate(iter_collection_items(stream, import_type)):
+        if import_type == 'songs':
+            problem = validate_song(item, max_logical_channels)
+        else:
+            problem = validate_setlist(item)
+        if problem is None and item['id'] in seen_ids:
+            problem = f"duplicates id {item['id']}"
+        if problem is not None:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'index': index, 'id': item.get('id') if isinstance(item, dict) else None,
+                               'error': f"Item {index} {problem}"})
+            continue
+        seen_ids.add(item['id'])
+        items.append(item)
+    if error_count:
+        logging.warning(f"Import of {import_type}: skipped {error_count} invalid item(s).")
+    return {import_type: items}, errors, error_count
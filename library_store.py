@@ -0,0 +1,629 @@
+import copy
+import logging
+import threading
+import time
+from collections import defaultdict
+
+
+def entry_transitions(song_ids, transitions):
+    """
+    A setlist's transitions as a list aligned with its song_ids: item i is how entry i
+    flows into the next one, or None. The older dict keyed by song id, which gave every
+    entry of a song the same transition, is converted.
+    """
+    if isinstance(transitions, dict):
+        return [transitions.get(str(song_id)) for song_id in song_ids]
+    transitions = list(transitions or [])[:len(song_ids)]
+    return transitions + [None] * (len(song_ids) - len(transitions))
+
+
+def _carry_transitions(old_song_ids, old_transitions, new_song_ids):
+    """Keeps each transition with its entry when song_ids change, matching the n-th entry of a song to the n-th."""
+    by_song = defaultdict(list)
+    for song_id, transition in zip(old_song_ids, old_transitions):
+        by_song[song_id].append(transition)
+    return [by_song[song_id].pop(0) if by_song[song_id] else None for song_id in new_song_ids]
+
+
+class BatchOperationError(ValueError):
+    def __init__(self, index, message):
+        super().__init__(f"Operation {index}: {message}")
+        self.index = index
+
+
+class LibraryStore:
+    """
+    Owns the songs and setlists data in memory and keeps lookup indexes over it,
+    so routes and the AudioPlayer never have to scan the whole library.
+    Changes are tracked per item and handed to the backends on save, which only
+    have to persist what changed. Every change also bumps a version counter on the
+    item and its collection, which the API exposes as ETags.
+
+    A backend provides load() -> data dict, commit(data, upserts, deleted_ids, full_rewrite)
+    -> bool, changed_externally() -> bool, flush() and close().
+    """
+
+    def __init__(self, songs_backend, setlists_backend):
+        self._songs_backend = songs_backend
+        self._setlists_backend = setlists_backend
+        self.lock = threading.RLock()
+        self._songs_data = {'songs': []}
+        self._setlists_data = {'setlists': []}
+        self._songs_by_id = {}
+        self._setlists_by_id = {}
+        self._tracks_by_file = defaultdict(dict)  # file_path -> {(song_id, track_id): track}
+        self._setlists_by_song = defaultdict(set)  # song_id -> {setlist_id}
+        self._next_song_id = 1
+        self._next_setlist_id = 1
+        self._generation = ''
+        self._songs_version = 0
+        self._setlists_version = 0
+        self._song_versions = {}
+        self._setlist_versions = {}
+        self._reset_changes()
+        self.reload()
+
+    # Loading and indexing
+    def reload(self):
+        with self.lock:
+            songs_data = self._songs_backend.load()
+            setlists_data = self._setlists_backend.load()
+            if not isinstance(songs_data, dict) or not isinstance(songs_data.get('songs'), list):
+                songs_data = {'songs': []}
+            if not isinstance(setlists_data, dict) or not isinstance(setlists_data.get('setlists'), list):
+                setlists_data = {'setlists': []}
+            self._songs_data = songs_data
+            self._setlists_data = setlists_data
+            self._reindex()
+            self._reset_changes()
+            logging.debug(f"LibraryStore: Loaded {len(self._songs_by_id)} songs and "
+                          f"{len(self._setlists_by_id)} setlists.")
+
+    def reload_if_changed(self):
+        """Reloads the library if its files were changed outside the app (e.g. synced from another machine)."""
+        if self._songs_backend.changed_externally() or self._setlists_backend.changed_externally():
+            logging.info("LibraryStore: Library changed on disk outside the app. Reloading.")
+            self.reload()
+            return True
+        return False
+
+    def _reindex(self):
+        # Versions restart under a new generation, so ETags from before can never match
+        self._generation = format(time.time_ns(), 'x')
+        self._songs_version = self._setlists_version = 0
+        self._song_versions, self._setlist_versions = {}, {}
+        self._index_songs()
+        self._index_setlists()
+
+    def _index_songs(self):
+        self._songs_by_id = {}
+        self._tracks_by_file = defaultdict(dict)
+        for song in self._songs_data['songs']:
+            if isinstance(song, dict) and 'id' in song:
+                self._songs_by_id[song['id']] = song
+                self._index_song_tracks(song)
+        self._next_song_id = max(self._songs_by_id.keys(), default=0) + 1
+
+    def _index_setlists(self):
+        self._setlists_by_id = {}
+        self._setlists_by_song = defaultdict(set)
+        for setlist in self._setlists_data['setlists']:
+            if isinstance(setlist, dict) and 'id' in setlist:
+                if 'transitions' in setlist:
+                    setlist['transitions'] = entry_transitions(setlist.get('song_ids', []), setlist['transitions'])
+                self._setlists_by_id[setlist['id']] = setlist
+                self._index_setlist_membership(setlist)
+        self._next_setlist_id = max(self._setlists_by_id.keys(), default=0) + 1
+
+    def _index_song_tracks(self, song):
+        for track in song.get('audio_tracks', []):
+            if isinstance(track, dict) and track.get('file_path'):
+                self._tracks_by_file[track['file_path']][(song['id'], track.get('id'))] = track
+
+    def _unindex_song_tracks(self, song):
+        for track in song.get('audio_tracks', []):
+            if isinstance(track, dict) and track.get('file_path'):
+                refs = self._tracks_by_file.get(track['file_path'])
+                if refs is not None:
+                    refs.pop((song['id'], track.get('id')), None)
+                    if not refs:
+                        del self._tracks_by_file[track['file_path']]
+
+    def _index_setlist_membership(self, setlist):
+        for song_id in setlist.get('song_ids', []):
+            self._setlists_by_song[song_id].add(setlist['id'])
+
+    def _unindex_setlist_membership(self, setlist):
+        for song_id in setlist.get('song_ids', []):
+            members = self._setlists_by_song.get(song_id)
+            if members is not None:
+                members.discard(setlist['id'])
+                if not members:
+                    del self._setlists_by_song[song_id]
+
+    # Change tracking and persistence
+    def _reset_changes(self):
+        self._dirty_song_ids, self._deleted_song_ids, self._songs_full_rewrite = set(), set(), False
+        self._dirty_setlist_ids, self._deleted_setlist_ids, self._setlists_full_rewrite = set(), set(), False
+
+    def _song_changed(self, song_id):
+        self._dirty_song_ids.add(song_id)
+        self._deleted_song_ids.discard(song_id)
+        self._songs_version += 1
+        self._song_versions[song_id] = self._song_versions.get(song_id, 0) + 1
+
+    def _setlist_changed(self, setlist_id):
+        self._dirty_setlist_ids.add(setlist_id)
+        self._deleted_setlist_ids.discard(setlist_id)
+        self._setlists_version += 1
+        self._setlist_versions[setlist_id] = self._setlist_versions.get(setlist_id, 0) + 1
+
+    def _song_removed(self, song_id):
+        self._dirty_song_ids.discard(song_id)
+        self._deleted_song_ids.add(song_id)
+        self._songs_version += 1
+        self._song_versions.pop(song_id, None)
+
+    def _setlist_removed(self, setlist_id):
+        self._dirty_setlist_ids.discard(setlist_id)
+        self._deleted_setlist_ids.add(setlist_id)
+        self._setlists_version += 1
+        self._setlist_versions.pop(setlist_id, None)
+
+    # Versions (used as ETags)
+    def songs_etag(self):
+        return f"songs-{self._generation}-{self._songs_version}"
+
+    def song_etag(self, song_id):
+        return f"song-{song_id}-{self._generation}-{self._song_versions.get(song_id, 0)}"
+
+    def setlists_etag(self):
+        return f"setlists-{self._generation}-{self._setlists_version}"
+
+    def setlist_etag(self, setlist_id):
+        return f"setlist-{setlist_id}-{self._generation}-{self._setlist_versions.get(setlist_id, 0)}"
+
+    def save_songs(self):
+        with self.lock:
+            upserts = [self._songs_by_id[sid] for sid in self._dirty_song_ids if sid in self._songs_by_id]
+            if not self._songs_backend.commit(self._songs_data, upserts, list(self._deleted_song_ids),
+                                              full_rewrite=self._songs_full_rewrite):
+                return False
+            self._dirty_song_ids, self._deleted_song_ids, self._songs_full_rewrite = set(), set(), False
+            return True
+
+    def save_setlists(self):
+        with self.lock:
+            upserts = [self._setlists_by_id[sid] for sid in self._dirty_setlist_ids if sid in self._setlists_by_id]
+            if not self._setlists_backend.commit(self._setlists_data, upserts, list(self._deleted_setlist_ids),
+                                                 full_rewrite=self._setlists_full_rewrite):
+                return False
+            self._dirty_setlist_ids, self._deleted_setlist_ids, self._setlists_full_rewrite = set(), set(), False
+            return True
+
+    def flush(self, compact=False):
+        """Waits until all saved changes are on disk, optionally folding the journals into the base files."""
+        with self.lock:
+            if compact:
+                self._songs_full_rewrite = self._setlists_full_rewrite = True
+                self.save_songs()
+                self.save_setlists()
+        self._songs_backend.flush()
+        self._setlists_backend.flush()
+
+    def close(self):
+        self._songs_backend.close()
+        self._setlists_backend.close()
+
+    def switch_backends(self, songs_backend, setlists_backend):
+        """Copies the current library into the new backends and persists through them from now on."""
+        with self.lock:
+            if not (songs_backend.commit(self._songs_data, full_rewrite=True) and
+                    setlists_backend.commit(self._setlists_data, full_rewrite=True)):
+                return False
+            songs_backend.flush()
+            setlists_backend.flush()
+            self.flush()
+            old_backends = (self._songs_backend, self._setlists_backend)
+            self._songs_backend, self._setlists_backend = songs_backend, setlists_backend
+            self._reset_changes()
+        for backend in old_backends:
+            backend.close()
+        return True
+
+    def replace_songs_data(self, songs_data):
+        """
+        Replaces the song library, tracking only the songs that actually differ so
+        unchanged songs keep their versions. Returns the ids of changed or removed
+        songs, or None if the data is invalid or could not be saved.
+        """
+        if not isinstance(songs_data, dict) or not isinstance(songs_data.get('songs'), list): return None
+        with self.lock:
+            old_songs_by_id = self._songs_by_id
+            self._songs_data = songs_data
+            self._index_songs()
+            changed_ids = {sid for sid, song in self._songs_by_id.items() if old_songs_by_id.get(sid) != song}
+            removed_ids = set(old_songs_by_id) - set(self._songs_by_id)
+            for song_id in changed_ids:
+                self._song_changed(song_id)
+            for song_id in removed_ids:
+                self._song_removed(song_id)
+            if not self.save_songs(): return None
+            return changed_ids | removed_ids
+
+    def replace_setlists_data(self, setlists_data):
+        """Like replace_songs_data, for setlists."""
+        if not isinstance(setlists_data, dict) or not isinstance(setlists_data.get('setlists'), list): return None
+        with self.lock:
+            old_setlists_by_id = self._setlists_by_id
+            self._setlists_data = setlists_data
+            self._index_setlists()
+            changed_ids = {sid for sid, sl in self._setlists_by_id.items() if old_setlists_by_id.get(sid) != sl}
+            removed_ids = set(old_setlists_by_id) - set(self._setlists_by_id)
+            for setlist_id in changed_ids:
+                self._setlist_changed(setlist_id)
+            for setlist_id in removed_ids:
+                self._setlist_removed(setlist_id)
+            if not self.save_setlists(): return None
+            return changed_ids | removed_ids
+
+    # Songs
+    def songs_data(self):
+        return self._songs_data
+
+    def get_song(self, song_id):
+        return self._songs_by_id.get(song_id)
+
+    def create_song(self, name, tempo):
+        with self.lock:
+            new_song = {'id': self._next_song_id, 'name': name, 'tempo': tempo, 'audio_tracks': []}
+            self._next_song_id += 1
+            self._songs_data['songs'].append(new_song)
+            self._songs_by_id[new_song['id']] = new_song
+            self._song_changed(new_song['id'])
+            return new_song
+
+    def update_song(self, song_id, name=None, tempo=None, audio_tracks=None):
+        with self.lock:
+            song = self._songs_by_id.get(song_id)
+            if song is None: return None
+            if name is not None: song['name'] = name
+            if tempo is not None: song['tempo'] = tempo
+            if audio_tracks is not None:
+                self._unindex_song_tracks(song)
+                next_track_id = max((t['id'] for t in audio_tracks if isinstance(t.get('id'), int)), default=0) + 1
+                for track in audio_tracks:
+                    if not isinstance(track.get('id'), int):  # New tracks from the editor come without an id
+                        track['id'] = next_track_id
+                        next_track_id += 1
+                song['audio_tracks'] = audio_tracks
+                self._index_song_tracks(song)
+            self._song_changed(song_id)
+            return song
+
+    def delete_song(self, song_id):
+        """
+        Removes the song and its setlist entries. Returns the file paths the song
+        referenced that no other song uses anymore, or None if the song was not found.
+        """
+        with self.lock:
+            song = self._songs_by_id.pop(song_id, None)
+            if song is None: return None
+            self._songs_data['songs'] = [s for s in self._songs_data['songs'] if s is not song]
+            self._unindex_song_tracks(song)
+            self._song_removed(song_id)
+            for setlist_id in self._setlists_by_song.pop(song_id, set()):
+                setlist = self._setlists_by_id.get(setlist_id)
+                if setlist:
+                    song_ids = setlist.get('song_ids', [])
+                    kept = [(sid, transition) for sid, transition
+                            in zip(song_ids, entry_transitions(song_ids, setlist.get('transitions'))) if sid != song_id]
+                    setlist['song_ids'] = [sid for sid, _ in kept]
+                    if 'transitions' in setlist: setlist['transitions'] = [transition for _, transition in kept]
+                    self._setlist_changed(setlist_id)
+            return {t.get('file_path') for t in song.get('audio_tracks', [])
+                    if t.get('file_path') and not self.is_file_referenced(t.get('file_path'))}
+
+    def delete_all_songs(self):
+        with self.lock:
+            self._songs_data['songs'] = []
+            for setlist in self._setlists_data['setlists']:
+                if isinstance(setlist, dict): setlist['song_ids'], setlist['transitions'] = [], []
+            self._reindex()
+            self._songs_full_rewrite = self._setlists_full_rewrite = True
+
+    # Tracks
+    def get_track(self, song_id, track_id):
+        song = self._songs_by_id.get(song_id)
+        if song is None: return None
+        return next((t for t in song.get('audio_tracks', []) if t.get('id') == track_id), None)
+
+    def song_has_track_file(self, song_id, file_path):
+        return any(key[0] == song_id for key in self._tracks_by_file.get(file_path, {}))
+
+    def add_track(self, song_id, file_path, output_channel=1, volume=1.0, is_stereo=False):
+        with self.lock:
+            song = self._songs_by_id.get(song_id)
+            if song is None: return None
+            tracks = song.setdefault('audio_tracks', [])
+            new_track = {'id': max((t['id'] for t in tracks if isinstance(t.get('id'), int)), default=0) + 1,
+                         'file_path': file_path,
+                         'output_channel': output_channel, 'volume': volume, 'is_stereo': is_stereo}
+            tracks.append(new_track)
+            self._tracks_by_file[file_path][(song_id, new_track['id'])] = new_track
+            self._song_changed(song_id)
+            return new_track
+
+    def update_track(self, song_id, track_id, changes):
+        """Applies changes (a dict of track fields) and returns True if any value differed."""
+        with self.lock:
+            track = self.get_track(song_id, track_id)
+            if track is None: return False
+            changed = {k: v for k, v in changes.items() if track.get(k) != v}
+            if not changed: return False
+            if 'file_path' in changed:
+                self._remove_track_file_ref(song_id, track)
+            track.update(changed)
+            if track.get('file_path'):
+                self._tracks_by_file[track['file_path']][(song_id, track_id)] = track
+            self._song_changed(song_id)
+            return True
+
+    def remove_track(self, song_id, track_id):
+        """
+        Removes a track and returns its file_path ('' if it had none), or None if not found.
+        """
+        with self.lock:
+            song = self._songs_by_id.get(song_id)
+            if song is None: return None
+            tracks = song.get('audio_tracks', [])
+            track_index = next((i for i, t in enumerate(tracks) if t.get('id') == track_id), -1)
+            if track_index == -1: return None
+            file_path = tracks[track_index].get('file_path') or ''
+            self._remove_track_file_ref(song_id, tracks[track_index])
+            del tracks[track_index]
+            self._song_changed(song_id)
+            return file_path
+
+    def _remove_track_file_ref(self, song_id, track):
+        file_path = track.get('file_path')
+        refs = self._tracks_by_file.get(file_path) if file_path else None
+        if refs is not None:
+            refs.pop((song_id, track.get('id')), None)
+            if not refs: del self._tracks_by_file[file_path]
+
+    def is_file_referenced(self, file_path):
+        return bool(self._tracks_by_file.get(file_path))
+
+    def referenced_files(self):
+        return list(self._tracks_by_file)
+
+    def tracks_for_file(self, file_path):
+        """Returns a list of (song_id, track) tuples that reference file_path."""
+        return [(key[0], track) for key, track in self._tracks_by_file.get(file_path, {}).items()]
+
+    # Markers
+    def set_markers(self, song_id, markers):
+        """Replaces the song's markers, ordered by position. New markers come without an id and get one."""
+        with self.lock:
+            song = self._songs_by_id.get(song_id)
+            if song is None: return None
+            next_marker_id = max((m['id'] for m in markers if isinstance(m.get('id'), int)), default=0) + 1
+            for marker in markers:
+                if not isinstance(marker.get('id'), int):
+                    marker['id'] = next_marker_id
+                    next_marker_id += 1
+            song['markers'] = sorted(markers, key=lambda m: m['position'])
+            self._song_changed(song_id)
+            return song['markers']
+
+    def add_marker(self, song_id, marker):
+        with self.lock:
+            song = self._songs_by_id.get(song_id)
+            if song is None: return None
+            marker = dict(marker, id=max((m['id'] for m in song.get('markers', [])), default=0) + 1)
+            self.set_markers(song_id, song.get('markers', []) + [marker])
+            return marker
+
+    def get_marker(self, song_id, marker_id):
+        song = self._songs_by_id.get(song_id)
+        if song is None: return None
+        return next((m for m in song.get('markers', []) if m.get('id') == marker_id), None)
+
+    def remove_marker(self, song_id, marker_id):
+        with self.lock:
+            song = self._songs_by_id.get(song_id)
+            if song is None or self.get_marker(song_id, marker_id) is None: return False
+            song['markers'] = [m for m in song['markers'] if m.get('id') != marker_id]
+            self._song_changed(song_id)
+            return True
+
+    # Setlists
+    def setlists_data(self):
+        return self._setlists_data
+
+    def get_setlist(self, setlist_id):
+        return self._setlists_by_id.get(setlist_id)
+
+    def setlist_ids_for_song(self, song_id):
+        return set(self._setlists_by_song.get(song_id, set()))
+
+    def create_setlist(self, name, song_ids, transitions=None):
+        with self.lock:
+            new_setlist = {'id': self._next_setlist_id, 'name': name, 'song_ids': song_ids}
+            if transitions: new_setlist['transitions'] = entry_transitions(song_ids, transitions)
+            self._next_setlist_id += 1
+            self._setlists_data['setlists'].append(new_setlist)
+            self._setlists_by_id[new_setlist['id']] = new_setlist
+            self._index_setlist_membership(new_setlist)
+            self._setlist_changed(new_setlist['id'])
+            return new_setlist
+
+    def update_setlist(self, setlist_id, name=None, song_ids=None, transitions=None):
+        with self.lock:
+            setlist = self._setlists_by_id.get(setlist_id)
+            if setlist is None: return None
+            if name is not None: setlist['name'] = name
+            if song_ids is not None:
+                old_song_ids = setlist.get('song_ids', [])
+                self._unindex_setlist_membership(setlist)
+                setlist['song_ids'] = song_ids
+                self._index_setlist_membership(setlist)
+                if transitions is None and 'transitions' in setlist:
+                    setlist['transitions'] = _carry_transitions(
+                        old_song_ids, entry_transitions(old_song_ids, setlist['transitions']), song_ids)
+            if transitions is not None: setlist['transitions'] = entry_transitions(setlist['song_ids'], transitions)
+            self._setlist_changed(setlist_id)
+            return setlist
+
+    def delete_setlist(self, setlist_id):
+        with self.lock:
+            setlist = self._setlists_by_id.pop(setlist_id, None)
+            if setlist is None: return False
+            self._setlists_data['setlists'] = [s for s in self._setlists_data['setlists'] if s is not setlist]
+            self._unindex_setlist_membership(setlist)
+            self._setlist_removed(setlist_id)
+            return True
+
+    # Show bundles
+    def import_show(self, setlist, songs):
+        """
+        Merges a setlist and its songs from a show bundle. A song or setlist identical to
+        an existing one (apart from its id) is reused, anything else is added under a new
+        id so nothing in the library is overwritten. Returns (setlist, song_id_map).
+        """
+        with self.lock:
+            song_id_map = {}
+            for song in songs:
+                existing = self._find_equal(self._songs_by_id, song)
+                if existing is not None:
+                    song_id_map[song['id']] = existing['id']
+                    continue
+                new_song = dict(copy.deepcopy(song), id=self._next_song_id)
+                self._next_song_id += 1
+                self._songs_data['songs'].append(new_song)
+                self._songs_by_id[new_song['id']] = new_song
+                self._index_song_tracks(new_song)
+                self._song_changed(new_song['id'])
+                song_id_map[song['id']] = new_song['id']
+
+            bundle_song_ids = setlist.get('song_ids', [])
+            entries = [(song_id_map[sid], transition) for sid, transition
+                       in zip(bundle_song_ids, entry_transitions(bundle_song_ids, setlist.get('transitions')))
+                       if sid in song_id_map]
+            imported_setlist = dict(copy.deepcopy(setlist), song_ids=[sid for sid, _ in entries])
+            if 'transitions' in setlist:
+                imported_setlist['transitions'] = [copy.deepcopy(transition) for _, transition in entries]
+            existing = self._find_equal(self._setlists_by_id, imported_setlist)
+            if existing is not None: return existing, song_id_map
+            imported_setlist['id'] = self._next_setlist_id
+            self._next_setlist_id += 1
+            self._setlists_data['setlists'].append(imported_setlist)
+            self._setlists_by_id[imported_setlist['id']] = imported_setlist
+            self._index_setlist_membership(imported_setlist)
+            self._setlist_changed(imported_setlist['id'])
+            return imported_setlist, song_id_map
+
+    @staticmethod
+    def _find_equal(items_by_id, item):
+        if items_by_id.get(item['id']) == item: return items_by_id[item['id']]
+        without_id = {k: v for k, v in item.items() if k != 'id'}
+        return next((other for other in items_by_id.values() if other.get('name') == item.get('name') and
+                     {k: v for k, v in other.items() if k != 'id'} == without_id), None)
+
+    # Batches
+    def apply_batch(self, operations):
+        """
+        Applies a list of operations all-or-nothing under the library lock and saves
+        once. Supported ops: set_track (song_id, track_id, fields), add_track (song_id,
+        file_path, fields), remove_track (song_id, track_id) and set_setlist_songs
+        (setlist_id, song_ids). Returns (results, changed_song_ids, removed_file_paths).
+        If an operation or the save fails, the previous state (items, versions and what
+        is pending for disk) is restored and BatchOperationError or IOError raised.
+        """
+        with self.lock:
+            change_state = self._change_state()
+            song_snapshots, setlist_snapshots = {}, {}
+            results, changed_song_ids, removed_file_paths = [], set(), set()
+            songs_saved = False
+            try:
+                for index, operation in enumerate(operations):
+                    op = operation.get('op')
+                    if op in ('set_track', 'add_track', 'remove_track'):
+                        song_id = operation.get('song_id')
+                        song = self._songs_by_id.get(song_id)
+                        if song is None: raise BatchOperationError(index, f"Song {song_id} not found")
+                        song_snapshots.setdefault(song_id, copy.deepcopy(song))
+                        results.append(self._apply_track_operation(index, op, song_id, operation, removed_file_paths))
+                        changed_song_ids.add(song_id)
+                    elif op == 'set_setlist_songs':
+                        setlist_id, song_ids = operation.get('setlist_id'), operation.get('song_ids')
+                        setlist = self._setlists_by_id.get(setlist_id)
+                        if setlist is None: raise BatchOperationError(index, f"Setlist {setlist_id} not found")
+                        if not isinstance(song_ids, list) or any(sid not in self._songs_by_id for sid in song_ids):
+                            raise BatchOperationError(index, "song_ids must be a list of existing song ids")
+                        setlist_snapshots.setdefault(setlist_id, copy.deepcopy(setlist))
+                        results.append(self.update_setlist(setlist_id, song_ids=list(song_ids)))
+                    else:
+                        raise BatchOperationError(index, f"Unknown op '{op}'")
+                if song_snapshots and not self.save_songs():
+                    raise IOError("Failed to save songs after batch")
+                songs_saved = bool(song_snapshots)
+                if setlist_snapshots and not self.save_setlists():
+                    raise IOError("Failed to save setlists after batch")
+            except Exception:
+                self._restore_snapshots(song_snapshots, setlist_snapshots)
+                self._restore_change_state(change_state)
+                if songs_saved:  # The batch's songs already went to the backend; the restored ones replace them
+                    self._dirty_song_ids |= set(song_snapshots)
+                    self.save_songs()
+                raise
+            removed_file_paths = {fp for fp in removed_file_paths if not self.is_file_referenced(fp)}
+            return results, changed_song_ids, removed_file_paths
+
+    def _apply_track_operation(self, index, op, song_id, operation, removed_file_paths):
+        if op == 'add_track':
+            file_path = operation.get('file_path')
+            if not file_path or not isinstance(file_path, str):
+                raise BatchOperationError(index, "add_track needs a file_path")
+            if self.song_has_track_file(song_id, file_path):
+                raise BatchOperationError(index, f"Track '{file_path}' already exists in song {song_id}")
+            new_track = self.add_track(song_id, file_path)
+            self.update_track(song_id, new_track['id'], operation.get('fields', {}))
+            return new_track
+        track_id = operation.get('track_id')
+        if self.get_track(song_id, track_id) is None:
+            raise BatchOperationError(index, f"Track {track_id} not found in song {song_id}")
+        if op == 'remove_track':
+            file_path = self.remove_track(song_id, track_id)
+            if file_path: removed_file_paths.add(file_path)
+            return {'removed_track_id': track_id}
+        self.update_track(song_id, track_id, operation.get('fields', {}))
+        return self.get_track(song_id, track_id)
+
+    def _change_state(self):
+        """The versions, generation and pending changes, for _restore_change_state."""
+        return (set(self._dirty_song_ids), set(self._deleted_song_ids), self._songs_full_rewrite,
+                set(self._dirty_setlist_ids), set(self._deleted_setlist_ids), self._setlists_full_rewrite,
+                self._generation, self._songs_version, self._setlists_version,
+                dict(self._song_versions), dict(self._setlist_versions))
+
+    def _restore_change_state(self, state):
+        (self._dirty_song_ids, self._deleted_song_ids, self._songs_full_rewrite,
+         self._dirty_setlist_ids, self._deleted_setlist_ids, self._setlists_full_rewrite,
+         self._generation, self._songs_version, self._setlists_version,
+         self._song_versions, self._setlist_versions) = state
+
+    def _restore_snapshots(self, song_snapshots, setlist_snapshots):
+        for song_id, snapshot in song_snapshots.items():
+            song = self._songs_by_id[song_id]
+            self._unindex_song_tracks(song)
+            song.clear()
+            song.update(snapshot)
+            self._index_song_tracks(song)
+        for setlist_id, snapshot in setlist_snapshots.items():
+            setlist = self._setlists_by_id[setlist_id]
+            self._unindex_setlist_membership(setlist)
+            setlist.clear()
+            setlist.update(snapshot)
+            self._index_setlist_membership(setlist)
@@ -0,0 +1,356 @@
+import copy
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+JOURNAL_SUFFIX = '.journal'
+DEFAULT_COMMIT_DELAY = 0.25  # Seconds to gather a burst of changes into one disk write
+DEFAULT_COMPACT_THRESHOLD = 500  # Journal entries before the base file is rewritten
+WRITE_RETRY_DELAY = 1.0  # Seconds the writer waits before retrying changes it failed to write
+
+
+def journal_path_for(file_path):
+    return file_path + JOURNAL_SUFFIX
+
+
+def file_signature(*file_paths):
+    """(mtime_ns, size, inode) of every path, None for missing ones. Changes whenever a file is rewritten."""
+    signature = []
+    for file_path in file_paths:
+        try:
+            st = os.stat(file_path)
+            signature.append((st.st_mtime_ns, st.st_size, st.st_ino))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+class JsonFileCache:
+    """
+    Thread-safe cache of parsed JSON files, validated against the file signature
+    instead of a timeout. Callers get their own copy of the cached data, so mutating
+    it never leaks into other requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # cache_key -> (signature, data)
+        self._hits = 0
+        self._misses = 0
+        self._reparses = 0
+
+    def get(self, cache_key, signature):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if entry[0] != signature:
+                self._reparses += 1
+                return None
+            self._hits += 1
+            data = entry[1]
+        return copy.deepcopy(data)
+
+    def set(self, cache_key, signature, data):
+        data = copy.deepcopy(data)
+        with self._lock:
+            self._entries[cache_key] = (signature, data)
+
+    def delete(self, cache_key):
+        with self._lock:
+            self._entries.pop(cache_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses, 'reparses': self._reparses,
+                    'entries': len(self._entries)}
+
+
+def _fsync_directory(dir_path):
+    if os.name == 'nt':
+        return  # Directories can't be opened for fsync on Windows
+    try:
+        dir_fd = os.open(dir_path, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError as e:
+        logging.debug(f"fsync of directory {dir_path} failed: {e}")
+
+
+def atomic_write(file_path, text):
+    """
+    Writes text to file_path through a temp file, fsync and rename, so a crash
+    leaves either the old or the new file, never a truncated one.
+    """
+    dir_path = os.path.dirname(file_path) or '.'
+    os.makedirs(dir_path, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(file_path) + '.', suffix='.tmp', dir=dir_path)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(dir_path)
+
+
+def truncate_journal(file_path):
+    journal_path = journal_path_for(file_path)
+    if os.path.exists(journal_path):
+        with open(journal_path, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def repair_journal(file_path):
+    """
+    Cuts the journal of file_path back to its last complete entry. A line torn by a power
+    cut mid-append would otherwise get the next append glued onto it, and replay stops
+    there. Returns the number of bytes dropped.
+    """
+    journal_path = journal_path_for(file_path)
+    try:
+        with open(journal_path, 'rb') as f:
+            content = f.read()
+    except OSError:
+        return 0
+    intact = 0
+    for line in content.splitlines(keepends=True):
+        if not line.endswith(b'\n'):
+            break
+        if line.strip():
+            try:
+                json.loads(line)
+            except ValueError:
+                break
+        intact += len(line)
+    if intact == len(content):
+        return 0
+    with open(journal_path, 'r+b') as f:
+        f.truncate(intact)
+        f.flush()
+        os.fsync(f.fileno())
+    logging.warning(f"Cut a torn entry and {len(content) - intact} byte(s) after it from {journal_path}.")
+    return len(content) - intact
+
+
+def replay_journal(data, file_path, collection_key):
+    """
+    Applies the change journal of file_path to data[collection_key] in place.
+    A torn last line (power cut mid-append) is ignored.
+    """
+    journal_path = journal_path_for(file_path)
+    if not os.path.exists(journal_path):
+        return 0
+    items = data.get(collection_key)
+    if not isinstance(items, list):
+        items = []
+    items_by_id = {item['id']: item for item in items if isinstance(item, dict) and 'id' in item}
+    items_without_id = [item for item in items if not (isinstance(item, dict) and 'id' in item)]
+    applied = 0
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(f"Ignoring torn journal entry at {journal_path}:{line_no} and everything after it.")
+                break
+            op = entry.get('op')
+            if op == 'put' and isinstance(entry.get('item'), dict) and 'id' in entry['item']:
+                items_by_id[entry['item']['id']] = entry['item']
+            elif op == 'del':
+                items_by_id.pop(entry.get('id'), None)
+            else:
+                logging.warning(f"Unknown journal entry at {journal_path}:{line_no}: {line[:80]}")
+                continue
+            applied += 1
+    data[collection_key] = list(items_by_id.values()) + items_without_id
+    if applied:
+        logging.info(f"Replayed {applied} journal entries from {journal_path}.")
+    return applied
+
+
+class JournaledJsonFile:
+    """
+    Persists one JSON collection file ({collection_key: [items with 'id']}) as a base
+    file plus an append-only journal of item puts and deletes. Commits are queued and
+    written by a background thread, so a burst of changes becomes a single append and
+    fsync. The base file is rewritten atomically once the journal grows past
+    compact_threshold entries.
+    """
+
+    def __init__(self, file_path, collection_key, load_func, on_write=None,
+                 commit_delay=DEFAULT_COMMIT_DELAY, compact_threshold=DEFAULT_COMPACT_THRESHOLD):
+        self.file_path = file_path
+        self.journal_path = journal_path_for(file_path)
+        self.collection_key = collection_key
+        self._load_func = load_func
+        self._on_write = on_write
+        self.commit_delay = commit_delay
+        self.compact_threshold = compact_threshold
+        self._cond = threading.Condition()
+        self._pending_lines = []
+        self._pending_snapshot = None
+        self._journal_entries = self._count_journal_entries()
+        self._busy = False
+        self._closed = False
+        self._writer_thread = None
+        self._known_signature = None
+
+    def _count_journal_entries(self):
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                return sum(1 for line in f if line.strip())
+        except OSError:
+            return 0
+
+    def _signature(self):
+        return file_signature(self.file_path, self.journal_path)
+
+    def load(self):
+        self.flush()
+        with self._cond:
+            repair_journal(self.file_path)
+            self._journal_entries = self._count_journal_entries()
+            self._known_signature = self._signature()
+        return self._load_func()
+
+    def changed_externally(self):
+        """True if the files were replaced or edited by something other than this writer since the last load."""
+        with self._cond:
+            if self._busy or self._has_pending() or self._known_signature is None:
+                return False
+            return self._signature() != self._known_signature
+
+    def commit(self, data, upserts=(), deleted_ids=(), full_rewrite=False):
+        """
+        Queues the given changes. The caller must hold the lock guarding data so the
+        serialized items are consistent. Returns True once they are queued, before they
+        are written and fsynced (flush() waits for that), or False if the data can't be
+        serialized. Changes that fail to write stay queued and are retried.
+        """
+        try:
+            lines = [json.dumps({'op': 'put', 'item': item}) for item in upserts]
+            lines += [json.dumps({'op': 'del', 'id': item_id}) for item_id in deleted_ids]
+            snapshot = None
+            if full_rewrite or self._journal_entries + len(lines) >= self.compact_threshold:
+                snapshot = json.dumps(data, indent=2)
+        except (TypeError, ValueError) as e:
+            logging.error(f"Error serializing changes for {self.file_path}: {e}")
+            return False
+
+        with self._cond:
+            if self._closed:
+                logging.error(f"Commit to {self.file_path} after close. Writing synchronously.")
+            if snapshot is not None:
+                # The snapshot already contains every queued change
+                self._pending_snapshot = snapshot
+                self._pending_lines = []
+                self._journal_entries = 0
+            else:
+                self._pending_lines.extend(lines)
+                self._journal_entries += len(lines)
+            self._ensure_writer()
+            self._cond.notify_all()
+        if self._closed:
+            self.flush()
+        return True
+
+    def _ensure_writer(self):
+        if self._closed:
+            return
+        if self._writer_thread is None or not self._writer_thread.is_alive():
+            self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True,
+                                                   name=f"journal-{os.path.basename(self.file_path)}")
+            self._writer_thread.start()
+
+    def _has_pending(self):
+        return self._pending_snapshot is not None or bool(self._pending_lines)
+
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                while not self._has_pending() and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._has_pending():
+                    return
+            if self.commit_delay > 0 and not self._closed:
+                time.sleep(self.commit_delay)  # Let the rest of the burst arrive
+            if not self._write_pending():
+                time.sleep(WRITE_RETRY_DELAY)
+
+    def _write_pending(self):
+        """Writes what is queued. Whatever fails to write is queued again; returns False then."""
+        with self._cond:
+            while self._busy:
+                self._cond.wait()
+            snapshot, lines = self._pending_snapshot, self._pending_lines
+            self._pending_snapshot, self._pending_lines = None, []
+            self._busy = True
+        compacted = False
+        try:
+            written = snapshot is not None or bool(lines)
+            if snapshot is not None:
+                atomic_write(self.file_path, snapshot)
+                truncate_journal(self.file_path)
+                snapshot, compacted = None, True
+                logging.debug(f"Compacted {self.file_path}.")
+            if lines:
+                with open(self.journal_path, 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                logging.debug(f"Group-committed {len(lines)} change(s) to {self.journal_path}.")
+                lines = []
+            if written and self._on_write:
+                self._on_write()
+        except OSError as e:
+            logging.error(f"Error writing {self.file_path}: {e}. Retrying.")
+        finally:
+            with self._cond:
+                if self._pending_snapshot is None and (snapshot is not None or lines):
+                    # A snapshot queued meanwhile already holds these changes
+                    self._pending_snapshot = snapshot
+                    self._pending_lines = lines + self._pending_lines
+                if self._known_signature is not None or compacted:
+                    # A full rewrite, e.g. of a backend just switched to, makes the files ours like a load()
+                    self._known_signature = self._signature()
+                self._busy = False
+                self._cond.notify_all()
+        return snapshot is None and not lines
+
+    def flush(self):
+        """Blocks until every queued change is written. Returns False if some could not be."""
+        with self._cond:
+            pending = self._has_pending()
+        if pending:
+            self._write_pending()
+        with self._cond:
+            while self._busy:
+                self._cond.wait()
+            return not self._has_pending()
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
@@ -0,0 +1,99 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+
+LISTENER_BACKLOG = 256
+
+
+class PlaybackEvents:
+    """
+    Dispatcher for playback events. BASS sync callbacks and the player post events,
+    dicts with a 'type', a sequence number 'seq' and a wall-clock 'time'. post() only
+    enqueues, so it is safe from the mixing thread. A single dispatcher thread hands
+    every event, in order, first to the subscribed handlers and then to the listener
+    queues of streaming consumers, whose oldest events are dropped when they fall
+    behind. call_later() runs a function on the same thread, ordered with the events.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._handlers = []
+        self._listeners = []
+        self._seq = itertools.count(1)
+        self._thread = threading.Thread(target=self._run, name='PlaybackEvents', daemon=True)
+        self._thread.start()
+
+    def post(self, event_type, **data):
+        event = {'type': event_type, 'seq': next(self._seq), 'time': time.time(), **data}
+        self._queue.put(event)
+        return event
+
+    def call_later(self, delay, func, *args):
+        """Runs func(*args) on the dispatcher thread after delay seconds."""
+        if delay <= 0:
+            self._queue.put((func, args))
+            return None
+        timer = threading.Timer(delay, self._queue.put, ((func, args),))
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def subscribe(self, handler):
+        """handler(event) is called on the dispatcher thread for every event. It must not block for long."""
+        with self._lock:
+            self._handlers.append(handler)
+        return handler
+
+    def unsubscribe(self, handler):
+        with self._lock:
+            if handler in self._handlers:
+                self._handlers.remove(handler)
+
+    def listen(self, backlog=LISTENER_BACKLOG):
+        """A queue.Queue receiving every event from now on. Pass it to unlisten() when done."""
+        listener = queue.Queue(maxsize=backlog)
+        with self._lock:
+            self._listeners.append(listener)
+        return listener
+
+    def unlisten(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join(timeout=2.0)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if isinstance(item, tuple):
+                func, args = item
+                try:
+                    func(*args)
+                except Exception as e:
+                    logging.error(f"Playback events: scheduled call {getattr(func, '__name__', func)} failed: {e}")
+                continue
+            with self._lock:
+                handlers, listeners = list(self._handlers), list(self._listeners)
+            for handler in handlers:
+                try:
+                    handler(item)
+                except Exception as e:
+                    logging.error(f"Playback events: handler failed on '{item['type']}' event: {e}")
+            for listener in listeners:
+                while True:
+                    try:
+                        listener.put_nowait(item)
+                        break
+                    except queue.Full:
+                        try:
+                            listener.get_nowait()  # Drop the oldest for a consumer that fell behind
+                        except queue.Empty:
+                            pass
@@ -0,0 +1,160 @@
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_HISTORY = 32  # Finished jobs kept for status lookups
+ACTIVE_STATES = ('queued', 'running')
+
+
+class PreloadJob:
+    """
+    One server-side preload of a song. The preparation reports each track as it opens
+    and checks cancelled at its checkpoints; a cancelled job stops there and frees
+    what it opened.
+    """
+
+    def __init__(self, job_id, song_id, tracks, on_done=None):
+        self.id = job_id
+        self.song_id = song_id
+        self.state = 'queued'  # queued, running, done, failed or cancelled
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.on_done = on_done
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._tracks = [{'track_id': track.get('id'), 'file_path': track.get('file_path'), 'state': 'pending'}
+                        for track in tracks]
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def active(self):
+        return self.state in ACTIVE_STATES
+
+    def cancel(self):
+        self._cancel.set()
+
+    def set_track(self, track_idx, state):
+        """state is one of pending, opening, ready, failed or skipped."""
+        with self._lock:
+            if 0 <= track_idx < len(self._tracks):
+                self._tracks[track_idx]['state'] = state
+
+    def settle_tracks(self, state):
+        """Gives every track that is still pending or opening its final state."""
+        with self._lock:
+            for track in self._tracks:
+                if track['state'] in ('pending', 'opening'):
+                    track['state'] = state
+
+    def start(self):
+        self.state = 'running'
+
+    def finish(self, state, error=None):
+        self.state, self.error, self.finished = state, error, time.time()
+        self._done.set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def status(self):
+        with self._lock:
+            tracks = [dict(track) for track in self._tracks]
+        return {'id': self.id, 'song_id': self.song_id, 'state': self.state, 'error': self.error,
+                'created': self.created, 'finished': self.finished, 'tracks': tracks,
+                'tracks_ready': sum(track['state'] == 'ready' for track in tracks), 'tracks_total': len(tracks)}
+
+
+class PreloadJobs:
+    """
+    Latest-wins queue of preload jobs, run one at a time by run_func(job), which returns
+    whether the song got prepared. A new job for the song already being preloaded joins
+    that job; a job for another song cancels the ones before it, so quick skips through
+    a setlist only prepare where they stop.
+    """
+
+    def __init__(self, run_func, history=JOB_HISTORY):
+        self._run = run_func
+        self._history = history
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Preload')
+
+    def submit(self, song_id, tracks, on_done=None):
+        with self._lock:
+            for job in self._jobs.values():
+                if job.active and job.song_id == song_id and not job.cancelled:
+                    return job
+            self._supersede(song_id)
+            job = PreloadJob(next(self._ids), song_id, tracks, on_done)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._history and not next(iter(self._jobs.values())).active:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._execute, job)
+        return job
+
+    def supersede(self, song_id):
+        """Cancels the active jobs of other songs. Returns the active job of song_id, if any."""
+        with self._lock:
+            self._supersede(song_id)
+            return next((job for job in self._jobs.values() if job.active and job.song_id == song_id
+                         and not job.cancelled), None)
+
+    def _supersede(self, song_id):
+        for job in self._jobs.values():
+            if job.active and job.song_id != song_id and not job.cancelled:
+                logging.info(f"Preload job {job.id} of song {job.song_id} superseded by song {song_id}.")
+                job.cancel()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel_all(self):
+        with self._lock:
+            for job in self._jobs.values():
+                if job.active:
+                    job.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=True)
+
+    def _execute(self, job):
+        if job.cancelled:
+            job.settle_tracks('skipped')
+            job.finish('cancelled')
+            return
+        job.start()
+        try:
+            prepared = self._run(job)
+        except Exception as e:
+            logging.error(f"Preload job {job.id} of song {job.song_id} failed: {e}")
+            job.settle_tracks('skipped')
+            job.finish('failed', str(e))
+            return
+        if job.cancelled:
+            job.settle_tracks('skipped')
+            job.finish('cancelled')
+        elif not prepared:
+            job.settle_tracks('skipped')
+            job.finish('failed', f"Song {job.song_id} could not be prepared")
+        else:
+            job.finish('done')
+            if job.on_done is not None:
+                try:
+                    job.on_done(job)
+                except Exception as e:
+                    logging.error(f"Preload job {job.id}: completion callback failed: {e}")
@@ -0,0 +1,121 @@
+import logging
+from collections import OrderedDict
+
+DEFAULT_MEMORY_BUDGET_MB = 1024
+DEFAULT_HANDLE_BUDGET = 512
+
+
+class PreparedSongCache:
+    """
+    Bounded LRU of fully prepared songs, keyed by (song_id, fingerprint) where the
+    fingerprint covers everything the prepared mixers depend on (tracks, routing,
+    sample rate, files). Entries are dicts with at least 'song_id', 'fingerprint',
+    'memory' (estimated bytes) and 'handles' (BASS handles held).
+
+    Eviction frees least recently used entries until both budgets are met. Keys
+    passed as pinned (the armed and the playing song) are never evicted, and songs
+    in the lookahead set only go once nothing else is left. free_func(entry)
+    releases an entry. Not thread-safe: the AudioPlayer calls it under its state lock.
+    """
+
+    def __init__(self, free_func, memory_budget=DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024,
+                 handle_budget=DEFAULT_HANDLE_BUDGET):
+        self._free = free_func
+        self._entries = OrderedDict()
+        self.memory_budget = memory_budget
+        self.handle_budget = handle_budget
+        self._lookahead = set()
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def key(entry):
+        return entry['song_id'], entry['fingerprint']
+
+    def get(self, song_id, fingerprint):
+        entry = self._entries.get((song_id, fingerprint))
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((song_id, fingerprint))
+        self.hits += 1
+        return entry
+
+    def peek(self, song_id, fingerprint):
+        """Like get() but leaves the LRU order and the hit counts alone."""
+        return self._entries.get((song_id, fingerprint))
+
+    def latest(self, song_id):
+        """The most recently used entry of song_id, or None."""
+        return next((entry for key, entry in reversed(self._entries.items()) if key[0] == song_id), None)
+
+    def entries(self, song_id):
+        return [entry for key, entry in self._entries.items() if key[0] == song_id]
+
+    def put(self, entry, pinned=()):
+        key = self.key(entry)
+        old = self._entries.pop(key, None)
+        if old is not None and old is not entry:
+            self._free(old)
+        self._entries[key] = entry
+        # Entries of the same song under another fingerprint can never be used again
+        for stale_key in [k for k in self._entries if k[0] == key[0] and k != key and k not in pinned]:
+            self._free(self._entries.pop(stale_key))
+        self.enforce_budget(set(pinned) | {key})
+
+    def detach(self, entry):
+        """Removes entry from the cache without freeing it. Returns whether it was cached."""
+        key = self.key(entry)
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+            return True
+        return False
+
+    def invalidate_song(self, song_id, pinned=()):
+        for key in [k for k in self._entries if k[0] == song_id and k not in pinned]:
+            self._free(self._entries.pop(key))
+
+    def clear(self, pinned=()):
+        for key in [k for k in self._entries if k not in pinned]:
+            self._free(self._entries.pop(key))
+
+    def set_lookahead(self, song_ids):
+        self._lookahead = set(song_ids)
+
+    def is_lookahead(self, song_id):
+        return song_id in self._lookahead
+
+    def set_budget(self, memory_budget, handle_budget, pinned=()):
+        if (memory_budget, handle_budget) != (self.memory_budget, self.handle_budget):
+            self.memory_budget, self.handle_budget = memory_budget, handle_budget
+            self.enforce_budget(pinned)
+
+    def memory(self):
+        return sum(entry['memory'] for entry in self._entries.values())
+
+    def handles(self):
+        return sum(entry['handles'] for entry in self._entries.values())
+
+    def enforce_budget(self, pinned=()):
+        while self.memory() > self.memory_budget or self.handles() > self.handle_budget:
+            candidates = [k for k in self._entries if k not in pinned]  # Oldest first
+            victim = next((k for k in candidates if k[0] not in self._lookahead), None) or \
+                next(iter(candidates), None)
+            if victim is None:
+                logging.warning("Prepared-song cache is over budget but everything left is in use.")
+                return
+            logging.info(f"Prepared-song cache: evicting song {victim[0]} to stay within budget.")
+            self._free(self._entries.pop(victim))
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def song_ids(self):
+        return [k[0] for k in self._entries]
+
+    def stats(self):
+        return {'songs': self.song_ids(), 'memory_bytes': self.memory(), 'handles': self.handles(),
+                'memory_budget': self.memory_budget, 'handle_budget': self.handle_budget,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': [{'song_id': e['song_id'], 'memory_bytes': e['memory'], 'ram_bytes': e.get('ram_bytes', 0),
+                             'handles': e['handles']} for e in self._entries.values()]}
@@ -0,0 +1,83 @@
+import ctypes
+import logging
+import os
+import threading
+
+DEFAULT_RAM_BUDGET_MB = 512
+
+
+class RamSampleStore:
+    """
+    Whole-file copies of stems held in RAM for BASS memory streams, bounded by a byte
+    budget. load() reserves and reads a file, returning a ctypes buffer or None when the
+    file doesn't fit (the caller then streams from disk). The buffer must outlive its
+    stream, so it is registered under the stream handle with attach() and dropped with
+    release() right after the stream is freed. Thread-safe.
+    """
+
+    def __init__(self, budget=DEFAULT_RAM_BUDGET_MB * 1024 * 1024):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._reserved = 0
+        self._buffers = {}
+        self.fallbacks = 0
+
+    def load(self, file_path):
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return None
+        if size == 0:
+            return None
+        with self._lock:
+            if self._reserved + size > self.budget:
+                self.fallbacks += 1
+                logging.info(f"RAM mode: '{os.path.basename(file_path)}' ({size / 1048576:.1f} MB) is over the "
+                             f"RAM budget. Streaming it from disk.")
+                return None
+            self._reserved += size
+        buffer = (ctypes.c_char * size)()
+        try:
+            with open(file_path, 'rb') as f:
+                if f.readinto(buffer) != size:
+                    raise IOError("file changed while reading")
+        except (OSError, IOError) as e:
+            logging.warning(f"RAM mode: could not read '{file_path}' into memory: {e}. Streaming it from disk.")
+            self._unreserve(size)
+            return None
+        return buffer
+
+    def discard(self, buffer):
+        """Returns a loaded buffer that never got a stream."""
+        self._unreserve(len(buffer))
+
+    def attach(self, stream, buffer):
+        with self._lock:
+            self._buffers[stream] = buffer
+
+    def release(self, stream):
+        """Drops the buffer behind a freed stream. Returns the bytes released."""
+        with self._lock:
+            buffer = self._buffers.pop(stream, None)
+        if buffer is None:
+            return 0
+        self._unreserve(len(buffer))
+        return len(buffer)
+
+    def held(self, stream):
+        with self._lock:
+            buffer = self._buffers.get(stream)
+        return len(buffer) if buffer is not None else 0
+
+    def _unreserve(self, size):
+        with self._lock:
+            self._reserved -= size
+
+    def set_budget(self, budget):
+        with self._lock:
+            self.budget = budget
+
+    def stats(self):
+        with self._lock:
+            return {'budget': self.budget, 'reserved_bytes': self._reserved, 'buffers': len(self._buffers),
+                    'fallbacks': self.fallbacks}
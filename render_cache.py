@@ -0,0 +1,294 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+
+from persistence import atomic_write
+
+RENDER_CACHE_DIR_NAME = 'render_cache'
+INDEX_NAME = 'renders.json'
+INDEX_FORMAT_VERSION = 1
+RENDER_SUFFIX = '.wav'
+PARTIAL_SUFFIX = '.part'
+HASH_CHUNK_SIZE = 1024 * 1024
+MAX_WAV_DATA_SIZE = 0xFFFFFFFF - 64  # RIFF sizes are 32-bit
+DEFAULT_RENDER_CACHE_MB = 2048
+
+WAVE_FORMAT_IEEE_FLOAT = 3
+_WAV_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sII4sI')
+
+
+def wav_float_header(channels, sample_rate, data_size):
+    """RIFF/WAVE header for 32-bit float PCM with a fact chunk, 58 bytes."""
+    block_align = channels * 4
+    return _WAV_HEADER.pack(b'RIFF', 50 + data_size, b'WAVE', b'fmt ', 16, WAVE_FORMAT_IEEE_FLOAT, channels,
+                            sample_rate, sample_rate * block_align, block_align, 32,
+                            b'fact', 4, data_size // block_align, b'data', data_size)
+
+
+def content_hash(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """
+    Decoded and resampled copies of the audio files, rendered once in the background so
+    playback can skip decoding and live resampling. Renders are named by the source's
+    content hash and the sample rate, so identical files share one render and a rate
+    change simply asks for different names. The hash of each source is remembered
+    together with its (size, mtime_ns) and recomputed only when the file changes.
+
+    render_func(source_path, target_path, sample_rate) writes a render and returns
+    whether it succeeded. needs_render_func(source_path, sample_rate) lets files that
+    are already plain PCM at the right rate be skipped.
+
+    The renders are kept within a disk budget: once a new render pushes them over it, the
+    least recently used ones are deleted and not rendered again until their file changes
+    or the budget grows.
+    """
+
+    def __init__(self, render_func, needs_render_func, budget_bytes=DEFAULT_RENDER_CACHE_MB * 1024 * 1024):
+        self._render = render_func
+        self._needs_render = needs_render_func
+        self._lock = threading.Lock()
+        self._folder = None
+        self._budget = budget_bytes
+        self._sources = {}  # Absolute source path -> {'size', 'mtime_ns', 'hash', 'used', 'evicted'}
+        self._wanted = set()
+        self._rate = None
+        self._dirty = False
+        self._queue = queue.Queue()
+        self._queued = set()
+        self.rendered = self.failed = self.evicted = 0
+        self._worker = threading.Thread(target=self._work, daemon=True, name='RenderCache')
+        self._worker.start()
+
+    def set_folder(self, folder):
+        folder = os.path.abspath(folder)
+        with self._lock:
+            if folder == self._folder:
+                return
+            self._save_locked()
+            self._folder = folder
+            self._sources, self._wanted = self._load(folder), set()
+
+    def _load(self, folder):
+        index_path = os.path.join(folder, INDEX_NAME)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read render cache index {index_path}: {e}. Starting empty.")
+            return {}
+        if not isinstance(data, dict) or data.get('version') != INDEX_FORMAT_VERSION:
+            return {}
+        return {path: entry for path, entry in data.get('sources', {}).items() if os.path.exists(path)}
+
+    def _render_path(self, digest, rate):
+        return os.path.join(self._folder, f"{digest}_{rate}{RENDER_SUFFIX}")
+
+    def lookup(self, source_path, rate):
+        """Path of a current render of source_path at rate, or None."""
+        source_path = os.path.abspath(source_path)
+        try:
+            st = os.stat(source_path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._sources.get(source_path)
+            if self._folder is None or not entry or (entry['size'], entry['mtime_ns']) != (st.st_size, st.st_mtime_ns):
+                return None
+            render_path = self._render_path(entry['hash'], rate)
+            if not os.path.isfile(render_path):
+                return None
+            entry['used'] = time.time()
+            self._dirty = True
+        return render_path
+
+    def set_budget(self, budget_bytes):
+        """Evicts renders when the budget shrinks; re-queues the evicted ones when it grows."""
+        with self._lock:
+            old_budget, self._budget = self._budget, budget_bytes
+            rate = self._rate
+            if budget_bytes > old_budget:
+                for entry in self._sources.values():
+                    entry.pop('evicted', None)
+                self._dirty = True
+        if budget_bytes < old_budget:
+            self._enforce_budget()
+        elif budget_bytes > old_budget and rate is not None:
+            self.schedule(self.wanted(), rate)
+
+    def sync(self, source_paths, rate):
+        """
+        Makes source_paths the set of files to keep rendered at rate: deletes renders
+        nothing needs any more (other rates, removed or changed files) and queues the
+        missing ones.
+        """
+        with self._lock:
+            self._wanted = {os.path.abspath(path) for path in source_paths}
+            self._rate = rate
+            self._sources = {path: entry for path, entry in self._sources.items() if path in self._wanted}
+            self._dirty = True
+        self.prune()
+        self.schedule(self._wanted, rate)
+
+    def wanted(self):
+        with self._lock:
+            return set(self._wanted)
+
+    def schedule(self, source_paths, rate):
+        for path in source_paths:
+            key = (os.path.abspath(path), rate)
+            with self._lock:
+                if key in self._queued:
+                    continue
+                self._queued.add(key)
+            self._queue.put(key)
+
+    def prune(self):
+        with self._lock:
+            folder, rate = self._folder, self._rate
+            keep = {f"{entry['hash']}_{rate}{RENDER_SUFFIX}" for entry in self._sources.values()}
+        if folder is None or not os.path.isdir(folder):
+            return
+        for name in os.listdir(folder):
+            final_name = name[:-len(PARTIAL_SUFFIX)] if name.endswith(PARTIAL_SUFFIX) else name
+            if final_name.endswith(RENDER_SUFFIX) and final_name not in keep:  # Keeps a render in progress
+                try:
+                    os.unlink(os.path.join(folder, name))
+                except OSError as e:
+                    logging.warning(f"Render cache: could not delete {name}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._sources, self._wanted, self._dirty = {}, set(), True
+        self.prune()
+        self.save()
+
+    def _work(self):
+        while True:
+            source_path, rate = self._queue.get()
+            try:
+                self._render_one(source_path, rate)
+            except Exception as e:
+                logging.error(f"Render cache: rendering '{source_path}' failed: {e}")
+                self.failed += 1
+            finally:
+                with self._lock:
+                    self._queued.discard((source_path, rate))
+                if self._queue.empty():
+                    self.save()
+
+    def _render_one(self, source_path, rate):
+        with self._lock:
+            if source_path not in self._wanted or rate != self._rate or self._folder is None:
+                return  # Superseded by a later sync
+        try:
+            st = os.stat(source_path)
+        except OSError:
+            return
+        if not self._needs_render(source_path, rate):
+            return
+        with self._lock:
+            entry = self._sources.get(source_path)
+        if entry and entry.get('evicted') == rate and (entry['size'], entry['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+            return  # Did not fit the budget last time
+        if not entry or (entry['size'], entry['mtime_ns']) != (st.st_size, st.st_mtime_ns):
+            entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hash': content_hash(source_path)}
+            with self._lock:
+                self._sources[source_path] = entry
+                self._dirty = True
+            self.prune()  # The previous render of a changed file is stale now
+        with self._lock:
+            render_path = self._render_path(entry['hash'], rate)
+        if os.path.isfile(render_path):
+            return
+        os.makedirs(os.path.dirname(render_path), exist_ok=True)
+        partial_path = render_path + PARTIAL_SUFFIX
+        if self._render(source_path, partial_path, rate):
+            os.replace(partial_path, render_path)
+            with self._lock:
+                entry['used'] = time.time()
+                self._dirty = True
+            self.rendered += 1
+            logging.info(f"Render cache: rendered '{os.path.basename(source_path)}' at {rate} Hz.")
+            self._enforce_budget(keep=source_path)
+        else:
+            self.failed += 1
+            if os.path.exists(partial_path):
+                os.unlink(partial_path)
+
+    def _render_sizes(self):
+        """(last used, source paths, render path, size) of every render on disk at the current rate."""
+        renders = {}  # Identical files share a render
+        with self._lock:
+            if self._folder is None or self._rate is None:
+                return []
+            for path, entry in self._sources.items():
+                render_path = self._render_path(entry['hash'], self._rate)
+                used, paths = renders.get(render_path, (0, []))
+                renders[render_path] = (max(used, entry.get('used', 0)), paths + [path])
+        sizes = []
+        for render_path, (used, source_paths) in renders.items():
+            try:
+                sizes.append((used, source_paths, render_path, os.path.getsize(render_path)))
+            except OSError:
+                continue
+        return sizes
+
+    def _enforce_budget(self, keep=None):
+        """Deletes the least recently used renders until the rest fit the budget, keep last of all."""
+        renders = sorted(self._render_sizes(), key=lambda r: (keep in r[1], r[0]))
+        total = sum(r[3] for r in renders)
+        with self._lock:
+            budget, rate = self._budget, self._rate
+        for _, source_paths, render_path, size in renders:
+            if total <= budget:
+                break
+            try:
+                os.unlink(render_path)
+            except OSError as e:
+                logging.warning(f"Render cache: could not delete {os.path.basename(render_path)}: {e}")
+                continue
+            total -= size
+            self.evicted += 1
+            with self._lock:
+                for source_path in source_paths:
+                    if source_path in self._sources:
+                        self._sources[source_path]['evicted'] = rate
+                self._dirty = True
+            logging.info(f"Render cache: evicted the render of '{os.path.basename(source_paths[0])}' to stay within "
+                         f"{budget // (1024 * 1024)} MB.")
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        if not self._dirty or self._folder is None:
+            return
+        try:
+            os.makedirs(self._folder, exist_ok=True)
+            atomic_write(os.path.join(self._folder, INDEX_NAME),
+                         json.dumps({'version': INDEX_FORMAT_VERSION, 'sources': self._sources}))
+            self._dirty = False
+        except OSError as e:
+            logging.error(f"Error writing render cache index: {e}")
+
+    def stats(self):
+        disk_bytes = sum(r[3] for r in self._render_sizes())
+        with self._lock:
+            return {'folder': self._folder, 'sample_rate': self._rate, 'sources': len(self._sources),
+                    'pending': len(self._queued), 'rendered': self.rendered, 'failed': self.failed,
+                    'evicted': self.evicted, 'disk_bytes': disk_bytes, 'budget_bytes': self._budget}
@@ -5,7 +5,7 @@ import sys
 import atexit
 import logging
 from waitress import serve
-from app import app, audio_player
+from app import app, audio_player, SERVER_THREADS
 
 shutdown_event = threading.Event()
 
@@ -67,7 +67,7 @@ class Api:
 def start_waitress_server():
     logging.info(f"Starting Waitress server on http://127.0.0.1:5001...")
     try:
-        serve(app, host='0.0.0.0', port=5001, threads=8)
+        serve(app, host='0.0.0.0', port=5001, threads=SERVER_THREADS)
     except Exception as e:
         logging.critical(f"Failed to start Waitress server: {e}", exc_info=True)
         if not shutdown_event.is_set():
@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import tarfile
+import time
+
+from library_import import validate_setlist, validate_song
+
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_MIMETYPE = 'application/x-tar'
+MANIFEST_NAME = 'bundle.json'
+AUDIO_DIR_NAME = 'audio'
+CHUNK_SIZE = 1024 * 1024
+MAX_MANIFEST_SIZE = 64 * 1024 * 1024
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+PARTIAL_SUFFIX = '.part'
+
+
+class BundleFormatError(ValueError):
+    pass
+
+
+def resolve_audio_path(audio_folder, file_path):
+    """Absolute path of a track file inside audio_folder, or None if it would escape the folder."""
+    if not file_path or os.path.isabs(file_path) or '\\' in file_path:
+        return None
+    audio_folder = os.path.abspath(audio_folder)
+    abs_path = os.path.normpath(os.path.join(audio_folder, file_path))
+    if os.path.commonpath([audio_folder, abs_path]) != audio_folder or abs_path == audio_folder:
+        return None
+    return abs_path
+
+
+def _tar_header(name, size, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding='utf-8')
+
+
+def _padding(size):
+    return b'\0' * (-size % TAR_BLOCK_SIZE)
+
+
+#Export
+class ShowBundleExport:
+    """
+    An uncompressed tar stream of a setlist, its songs and exactly the audio files they
+    reference. Files are stat'ed up front so the total size is known before sending,
+    then read in CHUNK_SIZE pieces while streaming, so nothing is staged on disk and
+    no stem is ever held in memory as a whole.
+    """
+
+    def __init__(self, setlist, songs, audio_folder):
+        referenced = sorted({t['file_path'] for song in songs for t in song.get('audio_tracks', [])
+                             if isinstance(t, dict) and t.get('file_path')})
+        self._entries, missing = [], []
+        for file_path in referenced:
+            abs_path = resolve_audio_path(audio_folder, file_path)
+            try:
+                st = os.stat(abs_path) if abs_path else None
+            except OSError:
+                st = None
+            if st is None:
+                missing.append(file_path)
+                continue
+            header = _tar_header(f"{AUDIO_DIR_NAME}/{file_path}", st.st_size, st.st_mtime)
+            self._entries.append((file_path, abs_path, st.st_size, header))
+        if missing:
+            logging.warning(f"Show bundle for setlist {setlist['id']}: {len(missing)} referenced audio file(s) not found.")
+
+        manifest = {'format': BUNDLE_FORMAT_VERSION, 'setlist': setlist, 'songs': songs,
+                    'audio_files': [entry[0] for entry in self._entries], 'missing_audio_files': missing}
+        self._manifest = json.dumps(manifest, indent=2).encode('utf-8')
+        self._manifest_header = _tar_header(MANIFEST_NAME, len(self._manifest), time.time())
+        self.size = (len(self._manifest_header) + len(self._manifest) + len(_padding(len(self._manifest))) +
+                     sum(len(header) + size + len(_padding(size)) for _, _, size, header in self._entries) +
+                     2 * TAR_BLOCK_SIZE)
+
+    def __iter__(self):
+        yield self._manifest_header
+        yield self._manifest + _padding(len(self._manifest))
+        for file_path, abs_path, size, header in self._entries:
+            yield header
+            remaining = size
+            with open(abs_path, 'rb') as f:
+                while remaining:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        # The announced size can no longer be honoured; abort rather than send a corrupt archive
+                        raise IOError(f"Audio file '{file_path}' shrank while exporting the show bundle")
+                    remaining -= len(chunk)
+                    yield chunk
+            yield _padding(size)
+        yield b'\0' * (2 * TAR_BLOCK_SIZE)
+
+
+#Import
+def _unique_path(abs_path):
+    base, ext = os.path.splitext(abs_path)
+    n = 2
+    while os.path.exists(f"{base}_{n}{ext}"):
+        n += 1
+    return f"{base}_{n}{ext}"
+
+
+def _copy_prefix(src_path, dst, length):
+    with open(src_path, 'rb') as src:
+        while length:
+            chunk = src.read(min(CHUNK_SIZE, length))
+            if not chunk: raise IOError(f"'{src_path}' changed while importing")
+            dst.write(chunk)
+            length -= len(chunk)
+
+
+def _store_audio_file(src, size, target_path):
+    """
+    Writes an incoming bundle member to target_path. If a file of the same size is
+    already there, the stream is compared against it chunk by chunk and nothing is
+    written when the content is identical. A different file is never overwritten, the
+    member is stored under a free name instead. Returns (abs path, whether it was written).
+    """
+    existing_path, matched, pending = target_path, 0, b''
+    if os.path.isfile(existing_path) and os.path.getsize(existing_path) == size:
+        with open(existing_path, 'rb') as existing:
+            while True:
+                pending = src.read(CHUNK_SIZE)
+                if not pending: return existing_path, False
+                if existing.read(len(pending)) != pending: break
+                matched += len(pending)
+    if os.path.exists(target_path):
+        target_path = _unique_path(target_path)
+
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    partial_path = target_path + PARTIAL_SUFFIX
+    try:
+        with open(partial_path, 'wb') as out:
+            if matched:  # That identical prefix was already consumed from the stream
+                _copy_prefix(existing_path, out, matched)
+            out.write(pending)
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk: break
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(partial_path, target_path)
+    except BaseException:
+        if os.path.exists(partial_path): os.unlink(partial_path)
+        raise
+    return target_path, True
+
+
+def _read_manifest(tar, max_logical_channels):
+    member = tar.next()
+    if member is None or member.name != MANIFEST_NAME or not member.isfile():
+        raise BundleFormatError(f"Bundle must start with {MANIFEST_NAME}")
+    if member.size > MAX_MANIFEST_SIZE:
+        raise BundleFormatError(f"{MANIFEST_NAME} is too large")
+    try:
+        manifest = json.loads(tar.extractfile(member).read().decode('utf-8-sig'))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise BundleFormatError(f"Invalid {MANIFEST_NAME}: {e}")
+    if not isinstance(manifest, dict) or manifest.get('format') != BUNDLE_FORMAT_VERSION:
+        raise BundleFormatError(f"Unsupported bundle format {manifest.get('format') if isinstance(manifest, dict) else None}")
+    setlist, songs = manifest.get('setlist'), manifest.get('songs')
+    if validate_setlist(setlist) is not None or not isinstance(songs, list):
+        raise BundleFormatError("Bundle has no valid setlist")
+    for index, song in enumerate(songs):
+        problem = validate_song(song, max_logical_channels)
+        if problem is not None:
+            raise BundleFormatError(f"Song {index} {problem}")
+    return manifest
+
+
+def read_show_bundle(stream, audio_folder, max_logical_channels):
+    """
+    Reads a show bundle from a non-seekable stream, storing its audio files into
+    audio_folder as they arrive. Returns (manifest, file_path_map, stats), where
+    file_path_map maps a track file_path to the name it was stored under when a
+    different file already used that name. Raises BundleFormatError.
+    """
+    file_path_map, stats = {}, {'audio_written': 0, 'audio_skipped': 0, 'bytes_written': 0}
+    try:
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            manifest = _read_manifest(tar, max_logical_channels)
+            expected = set(manifest.get('audio_files', []))
+            prefix = f"{AUDIO_DIR_NAME}/"
+            for member in tar:
+                if member.name == MANIFEST_NAME: continue  # Already read, iteration starts over at the first member
+                file_path = member.name[len(prefix):] if member.name.startswith(prefix) else None
+                target_path = resolve_audio_path(audio_folder, file_path)
+                if not member.isfile() or file_path not in expected or target_path is None:
+                    logging.warning(f"Show bundle: ignoring unexpected member '{member.name}'")
+                    continue
+                stored_path, written = _store_audio_file(tar.extractfile(member), member.size, target_path)
+                if written:
+                    stats['audio_written'] += 1
+                    stats['bytes_written'] += member.size
+                else:
+                    stats['audio_skipped'] += 1
+                if stored_path != target_path:
+                    file_path_map[file_path] = os.path.relpath(stored_path, os.path.abspath(audio_folder)).replace(os.sep, '/')
+    except tarfile.TarError as e:
+        raise BundleFormatError(f"Invalid bundle archive: {e}")
+
+    for song in manifest['songs']:
+        for track in song.get('audio_tracks', []):
+            track['file_path'] = file_path_map.get(track['file_path'], track['file_path'])
+    return manifest, file_path_map, stats
@@ -0,0 +1,60 @@
+import logging
+import os
+import threading
+
+BOUNCE_DIR_NAME = 'bounces'
+BOUNCE_SUFFIX = '.wav'
+PARTIAL_SUFFIX = '.part'
+
+
+class BounceStore:
+    """
+    Pre-mixed bounces of songs: one multichannel file per output device holding exactly
+    what that device's mixer would play. A bounce is named after the song and a key
+    covering everything the mix depends on (tracks, their files, output routing, sample
+    rate), so any change simply looks for a different name. Older bounces of a song are
+    purged once a new one is complete.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._folder = None
+        self.bounced = self.failed = 0
+
+    def set_folder(self, folder):
+        with self._lock:
+            self._folder = os.path.abspath(folder)
+
+    def path(self, song_id, key, device_id):
+        with self._lock:
+            return os.path.join(self._folder, f"song{song_id}_{key}_dev{device_id}{BOUNCE_SUFFIX}")
+
+    def lookup(self, song_id, key, device_ids):
+        """{device_id: path} if the bounce is complete for every device, else None."""
+        if self._folder is None or not device_ids:
+            return None
+        paths = {device_id: self.path(song_id, key, device_id) for device_id in device_ids}
+        return paths if all(os.path.isfile(p) for p in paths.values()) else None
+
+    def purge(self, song_id=None, keep_key=None):
+        """Deletes the bounces of song_id (all songs if None), except those under keep_key."""
+        with self._lock:
+            folder = self._folder
+        if folder is None or not os.path.isdir(folder):
+            return
+        prefix = f"song{song_id}_" if song_id is not None else 'song'
+        keep_prefix = f"song{song_id}_{keep_key}_" if keep_key else None
+        for name in os.listdir(folder):
+            if not name.startswith(prefix) or (keep_prefix and name.startswith(keep_prefix)):
+                continue
+            if name.endswith(BOUNCE_SUFFIX) or name.endswith(PARTIAL_SUFFIX):
+                try:
+                    os.unlink(os.path.join(folder, name))
+                except OSError as e:
+                    logging.warning(f"Bounce store: could not delete {name}: {e}")
+
+    def stats(self):
+        with self._lock:
+            folder = self._folder
+        files = [n for n in os.listdir(folder) if n.endswith(BOUNCE_SUFFIX)] if folder and os.path.isdir(folder) else []
+        return {'folder': folder, 'files': len(files), 'bounced': self.bounced, 'failed': self.failed}
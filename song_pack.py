@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import threading
+from array import array
+
+from persistence import atomic_write
+
+PACK_DIR_NAME = '.packed'
+PACK_SUFFIX = '.wav'
+INDEX_SUFFIX = '.json'
+PARTIAL_SUFFIX = '.part'
+
+
+def interleave_into(out, out_channels, offset, samples, channels):
+    """Copies the interleaved float samples (channels wide) into columns offset.. of out."""
+    frames = min(len(samples) // channels, len(out) // out_channels)
+    for c in range(channels):
+        out[offset + c:offset + c + frames * out_channels:out_channels] = samples[c:c + frames * channels:channels]
+
+
+def silent_frames(frames, channels):
+    return array('f', bytes(frames * channels * 4))
+
+
+class PackStore:
+    """
+    Packed songs: all distinct stems of a song interleaved into one multichannel file
+    inside the audio folder, so playback reads one file sequentially instead of every
+    stem at its own position. Each pack has an index mapping file_path to its first
+    channel and channel count. Packs are named after the song and a key over its files
+    and the sample rate, so editing the tracks looks for a new pack and older ones are
+    purged once it exists.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._folder = None
+        self.packed = self.failed = 0
+
+    def set_folder(self, audio_folder):
+        with self._lock:
+            self._folder = os.path.join(os.path.abspath(audio_folder), PACK_DIR_NAME)
+
+    def path(self, song_id, key):
+        with self._lock:
+            return os.path.join(self._folder, f"song{song_id}_{key}{PACK_SUFFIX}")
+
+    def lookup(self, song_id, key):
+        """(pack path, index) if the song is packed under key, else None."""
+        if self._folder is None:
+            return None
+        pack_path = self.path(song_id, key)
+        try:
+            with open(pack_path[:-len(PACK_SUFFIX)] + INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return (pack_path, index) if os.path.isfile(pack_path) else None
+
+    def store(self, song_id, key, partial_path, index):
+        pack_path = self.path(song_id, key)
+        atomic_write(pack_path[:-len(PACK_SUFFIX)] + INDEX_SUFFIX, json.dumps(index))
+        os.replace(partial_path, pack_path)
+        self.purge(song_id, keep_key=key)
+        self.packed += 1
+
+    def purge(self, song_id=None, keep_key=None):
+        """Deletes the packs of song_id (all songs if None), except the one under keep_key."""
+        with self._lock:
+            folder = self._folder
+        if folder is None or not os.path.isdir(folder):
+            return
+        prefix = f"song{song_id}_" if song_id is not None else 'song'
+        keep_prefix = f"song{song_id}_{keep_key}." if keep_key else None
+        for name in os.listdir(folder):
+            if name.startswith(prefix) and not (keep_prefix and name.startswith(keep_prefix)):
+                try:
+                    os.unlink(os.path.join(folder, name))
+                except OSError as e:
+                    logging.warning(f"Pack store: could not delete {name}: {e}")
+
+    def stats(self):
+        with self._lock:
+            folder = self._folder
+        files = [n for n in os.listdir(folder) if n.endswith(PACK_SUFFIX)] if folder and os.path.isdir(folder) else []
+        return {'folder': folder, 'packs': len(files), 'packed': self.packed, 'failed': self.failed}
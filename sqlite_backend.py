@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    tempo INTEGER,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS audio_tracks (
+    song_id INTEGER NOT NULL REFERENCES songs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    id INTEGER,
+    file_path TEXT,
+    output_channel INTEGER,
+    volume REAL,
+    is_stereo INTEGER,
+    extra TEXT,
+    PRIMARY KEY (song_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_audio_tracks_file_path ON audio_tracks(file_path);
+CREATE TABLE IF NOT EXISTS setlists (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS setlist_entries (
+    setlist_id INTEGER NOT NULL REFERENCES setlists(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    song_id INTEGER,
+    PRIMARY KEY (setlist_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_setlist_entries_song_id ON setlist_entries(song_id);
+"""
+
+SONG_COLUMNS = ('id', 'name', 'tempo')
+TRACK_COLUMNS = ('id', 'file_path', 'output_channel', 'volume', 'is_stereo')
+SETLIST_COLUMNS = ('id', 'name')
+
+
+def _split_extra(item, columns, nested_keys=()):
+    extra = {k: v for k, v in item.items() if k not in columns and k not in nested_keys}
+    return json.dumps(extra) if extra else None
+
+
+def _merge_row(row, columns, extra_json):
+    item = {col: row[col] for col in columns if row[col] is not None}
+    if extra_json:
+        item.update(json.loads(extra_json))
+    return item
+
+
+class SqliteLibraryDatabase:
+    """
+    SQLite storage for songs, tracks and setlists in WAL mode. Every commit runs in
+    a single transaction. songs_backend() and setlists_backend() return the objects
+    the LibraryStore persists through.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self._data_version = self._read_data_version()
+        logging.info(f"SQLite library database opened at {db_path}")
+
+    def songs_backend(self):
+        return _SqliteCollectionBackend(self, 'songs')
+
+    def setlists_backend(self):
+        return _SqliteCollectionBackend(self, 'setlists')
+
+    def is_empty(self):
+        with self._lock:
+            return (self._conn.execute("SELECT COUNT(*) FROM songs").fetchone()[0] == 0 and
+                    self._conn.execute("SELECT COUNT(*) FROM setlists").fetchone()[0] == 0)
+
+    def migrate_from(self, songs_data, setlists_data):
+        """Replaces the database contents with data in the songs.json/setlists.json format."""
+        self.commit('songs', songs_data, full_rewrite=True)
+        self.commit('setlists', setlists_data, full_rewrite=True)
+        logging.info(f"Migrated {len(songs_data.get('songs', []))} songs and "
+                     f"{len(setlists_data.get('setlists', []))} setlists into {self.db_path}")
+
+    def _read_data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def changed_externally(self):
+        """True if another connection committed since the last check (data_version ignores our own commits)."""
+        with self._lock:
+            data_version = self._read_data_version()
+            changed, self._data_version = data_version != self._data_version, data_version
+            return changed
+
+    # Loading
+    def load(self, kind):
+        with self._lock:
+            return self._load_songs() if kind == 'songs' else self._load_setlists()
+
+    def _load_songs(self):
+        tracks_by_song = {}
+        for row in self._conn.execute("SELECT * FROM audio_tracks ORDER BY song_id, position"):
+            track = _merge_row(row, TRACK_COLUMNS, row['extra'])
+            if 'is_stereo' in track: track['is_stereo'] = bool(track['is_stereo'])
+            tracks_by_song.setdefault(row['song_id'], []).append(track)
+        songs = []
+        for row in self._conn.execute("SELECT * FROM songs ORDER BY id"):
+            song = _merge_row(row, SONG_COLUMNS, row['extra'])
+            song['audio_tracks'] = tracks_by_song.get(row['id'], [])
+            songs.append(song)
+        return {'songs': songs}
+
+    def _load_setlists(self):
+        entries_by_setlist = {}
+        for row in self._conn.execute("SELECT setlist_id, song_id FROM setlist_entries ORDER BY setlist_id, position"):
+            entries_by_setlist.setdefault(row['setlist_id'], []).append(row['song_id'])
+        setlists = []
+        for row in self._conn.execute("SELECT * FROM setlists ORDER BY id"):
+            setlist = _merge_row(row, SETLIST_COLUMNS, row['extra'])
+            setlist['song_ids'] = entries_by_setlist.get(row['id'], [])
+            setlists.append(setlist)
+        return {'setlists': setlists}
+
+    # Writing
+    def commit(self, kind, data, upserts=(), deleted_ids=(), full_rewrite=False):
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if kind == 'songs':
+                        self._write_songs(data, upserts, deleted_ids, full_rewrite)
+                    else:
+                        self._write_setlists(data, upserts, deleted_ids, full_rewrite)
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            return True
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logging.error(f"Error committing {kind} to {self.db_path}: {e}")
+            return False
+
+    def _write_songs(self, data, upserts, deleted_ids, full_rewrite):
+        if full_rewrite:
+            self._conn.execute("DELETE FROM audio_tracks")
+            self._conn.execute("DELETE FROM songs")
+            upserts, deleted_ids = [s for s in data.get('songs', []) if isinstance(s, dict) and 'id' in s], ()
+        for song_id in deleted_ids:
+            self._conn.execute("DELETE FROM songs WHERE id = ?", (song_id,))
+        for song in upserts:
+            self._conn.execute(
+                "INSERT INTO songs (id, name, tempo, extra) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET name = excluded.name, tempo = excluded.tempo, extra = excluded.extra",
+                (song['id'], song.get('name'), song.get('tempo'), _split_extra(song, SONG_COLUMNS, ('audio_tracks',))))
+            self._conn.execute("DELETE FROM audio_tracks WHERE song_id = ?", (song['id'],))
+            self._conn.executemany(
+                "INSERT INTO audio_tracks (song_id, position, id, file_path, output_channel, volume, is_stereo, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(song['id'], pos, t.get('id'), t.get('file_path'), t.get('output_channel'), t.get('volume'),
+                  None if t.get('is_stereo') is None else int(bool(t.get('is_stereo'))),
+                  _split_extra(t, TRACK_COLUMNS))
+                 for pos, t in enumerate(song.get('audio_tracks', [])) if isinstance(t, dict)])
+
+    def _write_setlists(self, data, upserts, deleted_ids, full_rewrite):
+        if full_rewrite:
+            self._conn.execute("DELETE FROM setlist_entries")
+            self._conn.execute("DELETE FROM setlists")
+            upserts, deleted_ids = [s for s in data.get('setlists', []) if isinstance(s, dict) and 'id' in s], ()
+        for setlist_id in deleted_ids:
+            self._conn.execute("DELETE FROM setlists WHERE id = ?", (setlist_id,))
+        for setlist in upserts:
+            self._conn.execute(
+                "INSERT INTO setlists (id, name, extra) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET name = excluded.name, extra = excluded.extra",
+                (setlist['id'], setlist.get('name'), _split_extra(setlist, SETLIST_COLUMNS, ('song_ids',))))
+            self._conn.execute("DELETE FROM setlist_entries WHERE setlist_id = ?", (setlist['id'],))
+            self._conn.executemany(
+                "INSERT INTO setlist_entries (setlist_id, position, song_id) VALUES (?, ?, ?)",
+                [(setlist['id'], pos, song_id) for pos, song_id in enumerate(setlist.get('song_ids', []))])
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except sqlite3.Error as e:
+                logging.error(f"Error closing {self.db_path}: {e}")
+
+
+class _SqliteCollectionBackend:
+    def __init__(self, database, kind):
+        self.database = database
+        self.kind = kind
+
+    def load(self):
+        return self.database.load(self.kind)
+
+    def commit(self, data, upserts=(), deleted_ids=(), full_rewrite=False):
+        return self.database.commit(self.kind, data, upserts, deleted_ids, full_rewrite)
+
+    def changed_externally(self):
+        return self.database.changed_externally() if self.kind == 'songs' else False
+
+    def flush(self):
+        pass  # Every commit is already a durable transaction
+
+    def close(self):
+        self.database.close()
@@ -6,6 +6,8 @@ document.addEventListener('DOMContentLoaded', function() {
     const playBtn = document.getElementById('play-btn');
     const stopBtn = document.getElementById('stop-btn');
     const nextBtn = document.getElementById('next-btn');
+    const levelMeters = document.getElementById('level-meters');
+    const songMarkers = document.getElementById('song-markers');
 
     let currentSetlistId = null;
     let currentSongIndex = 0;
@@ -16,6 +18,14 @@ document.addEventListener('DOMContentLoaded', function() {
     let timerInterval = null;
     let remainingSeconds = 0;
     let currentPreloadController = null;
+    let playbackEvents = null;
+    let isPaused = false;
+    let activeLoopMarkerId = null;
+    let lastPosition = null;
+    const PRELOAD_POLL_MS = 150;
+    const METER_FLOOR_DB = -60;
+    const METER_INTERVAL_S = 0.2;  // Meter events this tablet asks for; the server measures every 0.1 s
+    const EVENTS_RETRY_MS = 5000;  // Wait before reconnecting when the server turned the event stream away
 
     function _showGlobalNotification(message, type = 'info') {
         if (typeof window.showGlobalNotification === 'function') {
@@ -72,12 +82,249 @@ document.addEventListener('DOMContentLoaded', function() {
         remainingSeconds = 0;
     }
 
+    // Follow the server's playback events: after a segue or crossfade it starts the next song by itself,
+    // and a song that plays to its end (or a failing device) ends playback without the stop button
+    function followPlayback() {
+        stopFollowingPlayback();
+        const source = playbackEvents = new EventSource('/api/playback/events?meter_interval=' + METER_INTERVAL_S);
+        // A dropped stream reconnects by itself; one the server refused (all slots taken) closes for good
+        source.addEventListener('error', () => {
+            if (source.readyState !== EventSource.CLOSED) return;
+            setTimeout(() => { if (playbackEvents === source) followPlayback(); }, EVENTS_RETRY_MS);
+        });
+        playbackEvents.addEventListener('status', (e) => {
+            if (!JSON.parse(e.data).playing) handlePlaybackEnded(null);
+        });
+        playbackEvents.addEventListener('transition', (e) => {
+            const event = JSON.parse(e.data);
+            const nextSong = currentSetlist.songs[currentSongIndex + 1];
+            if (isPlayingOrLoading && nextSong && event.song_id === nextSong.id) {
+                currentSongIndex++;
+                activeLoopMarkerId = null;
+                lastPosition = null;
+                preloadedSongId = nextSong.id;
+                setActiveSongUI(currentSongIndex);
+                updateNowPlayingUI(nextSong);
+                startTimer(nextSong.duration);
+            }
+        });
+        // The server's position replaces the local countdown once its meter events arrive
+        playbackEvents.addEventListener('meter', (e) => {
+            const meter = JSON.parse(e.data);
+            const song = currentSetlist.songs[currentSongIndex];
+            if (!isPlayingOrLoading || !song || meter.song_id !== song.id) return;
+            if (timerInterval) { clearInterval(timerInterval); timerInterval = null; }
+            lastPosition = meter.position;
+            if (meter.position !== null && meter.duration) updateTimerDisplay(meter.duration - meter.position);
+            renderLevelMeters(meter.outputs);
+        });
+        // Another tablet may pause, resume or end a loop too
+        playbackEvents.addEventListener('paused', () => setPaused(true));
+        playbackEvents.addEventListener('unpaused', () => setPaused(false));
+        playbackEvents.addEventListener('loop', (e) => {
+            if (JSON.parse(e.data).start === null && activeLoopMarkerId !== null) {
+                activeLoopMarkerId = null;
+                renderMarkers(currentSetlist.songs[currentSongIndex]);
+            }
+        });
+        playbackEvents.addEventListener('stopped', (e) => {
+            const event = JSON.parse(e.data);
+            if (event.reason !== 'stop') handlePlaybackEnded(event.reason);
+        });
+    }
+
+    function stopFollowingPlayback() {
+        if (playbackEvents) { playbackEvents.close(); playbackEvents = null; }
+        renderLevelMeters({});
+    }
+
+    function resetTransport() {
+        isPaused = false;
+        activeLoopMarkerId = null;
+        lastPosition = null;
+        renderMarkers(currentSetlist.songs[currentSongIndex]);
+    }
+
+    function setPaused(paused) {
+        isPaused = paused;
+        if (playBtn && isPlayingOrLoading) playBtn.textContent = paused ? '▶ Resume' : '⏸ Playing';
+    }
+
+    function handlePlayButton() {
+        if (isPlayingOrLoading && playbackEvents) togglePause();
+        else playCurrentSong();
+    }
+
+    async function postPlayback(path, body, method = 'POST') {
+        const response = await fetch('/api/playback/' + path, {
+            method: method, headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(body || {})
+        });
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.error || 'HTTP error! status: ' + response.status);
+        return data;
+    }
+
+    async function togglePause() {
+        try {
+            const data = await postPlayback(isPaused ? 'resume' : 'pause');
+            setPaused(data.paused);
+        } catch (error) {
+            _showGlobalNotification('Pause failed: ' + error.message, 'error');
+        }
+    }
+
+    // Markers jump within the playing song, or start the song there; markers with an end can loop
+    function renderMarkers(song) {
+        if (!songMarkers) return;
+        songMarkers.innerHTML = '';
+        if (!song) return;
+        (song.markers || []).forEach(marker => {
+            const jumpBtn = document.createElement('button');
+            jumpBtn.className = 'marker-btn';
+            jumpBtn.textContent = marker.name + ' ' + formatTime(marker.position);
+            jumpBtn.addEventListener('click', () => jumpToMarker(marker));
+            songMarkers.appendChild(jumpBtn);
+            if (marker.end !== undefined && marker.end !== null) {
+                const loopBtn = document.createElement('button');
+                loopBtn.className = 'marker-btn loop-btn' + (activeLoopMarkerId === marker.id ? ' active' : '');
+                loopBtn.textContent = '⟲';
+                loopBtn.title = 'Loop ' + marker.name + ' (' + formatTime(marker.position) + '-' + formatTime(marker.end) + ')';
+                loopBtn.addEventListener('click', () => toggleLoop(marker));
+                songMarkers.appendChild(loopBtn);
+            }
+        });
+        const addBtn = document.createElement('button');
+        addBtn.className = 'marker-btn add-marker-btn';
+        addBtn.textContent = '+ Marker';
+        addBtn.title = 'Add a marker at the current position';
+        addBtn.addEventListener('click', () => addMarkerHere(song));
+        songMarkers.appendChild(addBtn);
+    }
+
+    async function jumpToMarker(marker) {
+        if (!(isPlayingOrLoading && playbackEvents)) {
+            playCurrentSong(marker.id);
+            return;
+        }
+        try {
+            await postPlayback('seek', { marker_id: marker.id });
+        } catch (error) {
+            _showGlobalNotification('Jump failed: ' + error.message, 'error');
+        }
+    }
+
+    async function toggleLoop(marker) {
+        if (!(isPlayingOrLoading && playbackEvents)) {
+            _showGlobalNotification('Start the song to loop ' + marker.name + '.', 'info');
+            return;
+        }
+        try {
+            if (activeLoopMarkerId === marker.id) {
+                await postPlayback('loop', null, 'DELETE');
+                activeLoopMarkerId = null;
+            } else {
+                await postPlayback('loop', { marker_id: marker.id });
+                activeLoopMarkerId = marker.id;
+            }
+        } catch (error) {
+            _showGlobalNotification('Loop failed: ' + error.message, 'error');
+        }
+        renderMarkers(currentSetlist.songs[currentSongIndex]);
+    }
+
+    async function addMarkerHere(song) {
+        if (!(isPlayingOrLoading && playbackEvents) || lastPosition === null) {
+            _showGlobalNotification('Markers are added at the playing position.', 'info');
+            return;
+        }
+        const position = lastPosition;
+        const name = window.prompt('Marker name', 'Marker ' + ((song.markers || []).length + 1));
+        if (name === null) return;
+        try {
+            const response = await fetch('/api/songs/' + song.id + '/markers', {
+                method: 'POST', headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ name: name, position: position })
+            });
+            const marker = await response.json();
+            if (!response.ok) throw new Error(marker.error || 'HTTP error! status: ' + response.status);
+            song.markers = (song.markers || []).concat([marker]).sort((a, b) => a.position - b.position);
+            if (song === currentSetlist.songs[currentSongIndex]) renderMarkers(song);
+        } catch (error) {
+            _showGlobalNotification('Could not add the marker: ' + error.message, 'error');
+        }
+    }
+
+    function levelToPercent(level) {
+        if (!level) return 0;
+        const db = 20 * Math.log10(level);
+        return Math.max(0, Math.min(100, (db - METER_FLOOR_DB) / -METER_FLOOR_DB * 100));
+    }
+
+    function renderLevelMeters(outputs) {
+        if (!levelMeters) return;
+        const layout = Object.keys(outputs).map(dev => dev + ':' + (outputs[dev] ? outputs[dev].peak.length : 0)).join(',');
+        if (levelMeters.dataset.layout !== layout) {
+            levelMeters.dataset.layout = layout;
+            levelMeters.innerHTML = '';
+            Object.keys(outputs).forEach(dev => {
+                const group = document.createElement('div');
+                group.className = 'level-meter-output';
+                group.dataset.device = dev;
+                const label = document.createElement('span');
+                label.className = 'level-meter-label';
+                label.textContent = 'Out ' + dev;
+                group.appendChild(label);
+                const channels = outputs[dev] ? outputs[dev].peak.length : 0;
+                for (let c = 0; c < channels; c++) {
+                    group.insertAdjacentHTML('beforeend',
+                        '<div class="level-meter-bar"><div class="level-meter-rms"></div><div class="level-meter-peak"></div></div>');
+                }
+                levelMeters.appendChild(group);
+            });
+        }
+        Object.keys(outputs).forEach(dev => {
+            if (!outputs[dev]) return;
+            const bars = levelMeters.querySelectorAll('.level-meter-output[data-device="' + dev + '"] .level-meter-bar');
+            bars.forEach((bar, c) => {
+                const peak = outputs[dev].peak[c];
+                bar.firstChild.style.width = levelToPercent(outputs[dev].rms[c]) + '%';
+                bar.lastChild.style.left = levelToPercent(peak) + '%';
+                bar.classList.toggle('clipping', peak >= 1.0);
+            });
+        });
+    }
+
+    function handlePlaybackEnded(reason) {
+        if (!isPlayingOrLoading) return;
+        stopFollowingPlayback();
+        isPlayingOrLoading = false;
+        resetTransport();
+        if(playBtn) { playBtn.textContent = '▶ Play'; playBtn.disabled = false; }
+        stopTimer();
+        const song = currentSetlist.songs[currentSongIndex];
+        if (song) updateNowPlayingUI(song);
+        if (reason === 'device_failed') _showGlobalNotification('Playback stopped: an output device failed.', 'error');
+    }
+
     function updateTimerDisplay(seconds) {
         if (timeRemainingDisplay) {
             timeRemainingDisplay.textContent = "Time: " + formatTime(seconds);
         }
     }
 
+    async function waitForPreloadJob(jobId, signal) {
+        while (true) {
+            const response = await fetch('/api/preload/jobs/' + jobId, { signal: signal });
+            const job = await response.json();
+            if (!response.ok) throw new Error(job.error || 'HTTP error! status: ' + response.status);
+            if (job.state !== 'queued' && job.state !== 'running') return job;
+            if (!isPlayingOrLoading && playBtn && job.tracks_total > 0) {
+                playBtn.textContent = '⏳ Preloading ' + job.tracks_ready + '/' + job.tracks_total;
+            }
+            await new Promise(resolve => setTimeout(resolve, PRELOAD_POLL_MS));
+        }
+    }
+
     async function triggerPreload(songIndexToPreload) {
         if (currentPreloadController) currentPreloadController.abort();
         currentPreloadController = new AbortController();
@@ -113,7 +360,13 @@ document.addEventListener('DOMContentLoaded', function() {
             if (!response.ok || !data.success) {
                 throw new Error(data.error || "Failed to preload '" + songToPreload.name + "'");
             }
-            preloadedSongId = data.preloaded_song_id;
+            // The server preloads in the background; a newer preload request supersedes this job there
+            const job = await waitForPreloadJob(data.job.id, signal);
+            if (signal.aborted) { console.log('Preload aborted for', songToPreload.name); return; }
+            if (job.state !== 'done') {
+                throw new Error(job.error || "Failed to preload '" + songToPreload.name + "' (" + job.state + ")");
+            }
+            preloadedSongId = job.song_id;
             console.log("Successfully preloaded song ID " + preloadedSongId + " ('" + songToPreload.name + "')");
             _showGlobalNotification("'" + songToPreload.name + "' is ready.", 'success');
         } catch (error) {
@@ -134,7 +387,7 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    async function playCurrentSong() {
+    async function playCurrentSong(markerId = null) {
         if (isActivelyPreloading) {
             _showGlobalNotification("Please wait, song is preloading...", "info"); return;
         }
@@ -158,7 +411,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
             const response = await fetch("/api/setlists/" + currentSetlistId + "/play", {
                 method: 'POST', headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ current_song_index: currentSongIndex })
+                body: JSON.stringify({ current_song_index: currentSongIndex, marker_id: markerId })
             });
             const responseData = await response.json();
             if (!response.ok) throw new Error(responseData.error || 'HTTP error! status: ' + response.status);
@@ -168,6 +421,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 setActiveSongUI(currentSongIndex);
                 if(playBtn) playBtn.textContent = '⏸ Playing';
                 startTimer(responseData.duration);
+                resetTransport();
+                followPlayback();
             } else {
                 throw new Error(responseData.error || 'Playback initiation failed on backend.');
             }
@@ -190,6 +445,8 @@ document.addEventListener('DOMContentLoaded', function() {
         if (currentPreloadController) { currentPreloadController.abort(); currentPreloadController = null; }
         isActivelyPreloading = false;
         stopTimer();
+        stopFollowingPlayback();
+        resetTransport();
 
         if (!isPlayingOrLoading && playBtn && playBtn.textContent === '▶ Play') {
             if(playBtn) playBtn.disabled = false;
@@ -275,7 +532,8 @@ document.addEventListener('DOMContentLoaded', function() {
             const duration = parseFloat(item.dataset.duration) || 0;
             const tempoMatch = detailsEl ? detailsEl.textContent.match(/(\d+)\s*BPM/i) : null;
             if (!nameEl || isNaN(songId) || !tempoMatch) return null;
-            return { id: songId, name: nameEl.textContent, tempo: parseInt(tempoMatch[1]), duration: duration };
+            return { id: songId, name: nameEl.textContent, tempo: parseInt(tempoMatch[1]), duration: duration,
+                     transition: item.dataset.transition || '', markers: JSON.parse(item.dataset.markers || '[]') };
         }).filter(song => song !== null);
 
         if (currentSetlist.songs.length === 0) {
@@ -288,7 +546,7 @@ document.addEventListener('DOMContentLoaded', function() {
             triggerPreload(0);
         }
 
-        if(playBtn) playBtn.addEventListener('click', playCurrentSong);
+        if(playBtn) playBtn.addEventListener('click', handlePlayButton);
         if(stopBtn) stopBtn.addEventListener('click', stopPlayback);
         if(prevBtn) prevBtn.addEventListener('click', handlePreviousSong);
         if(nextBtn) nextBtn.addEventListener('click', handleNextSong);
@@ -333,6 +591,7 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         if(currentSongName) currentSongName.textContent = song.name;
         if(currentSongBpm) currentSongBpm.textContent = "BPM: " + song.tempo;
+        renderMarkers(song);
         if (!isPlayingOrLoading && !isActivelyPreloading && !timerInterval) {
              if(timeRemainingDisplay) timeRemainingDisplay.textContent = "Length: " + formatTime(song.duration || 0);
         }
@@ -14,9 +14,11 @@ document.addEventListener('DOMContentLoaded', function() {
     const playSetlistBtn = document.getElementById('play-setlist');
 
     let currentSetlistId = null;
+    let currentSetlistEtag = null;
     let isNewSetlist = false;
     let isSaving = false;
     let allSongs = [];
+    let currentTransitions = [];  // Entry i -> how it flows into entry i + 1: {type: 'segue'|'crossfade', duration} or null
     let currentSetlistSongs = [];
 
     initSetlistsPage();
@@ -81,9 +83,18 @@ document.addEventListener('DOMContentLoaded', function() {
             const songItem = document.createElement('div');
             songItem.className = 'setlist-song-item';
             songItem.dataset.songId = song.id;
+            const transition = currentTransitions[index] || {};
+            const transitionControls = index === currentSetlistSongs.length - 1 ? '' :
+                '<select class="setlist-song-transition" title="Into the next song">' +
+                    '<option value="">Stop</option>' +
+                    '<option value="segue"' + (transition.type === 'segue' ? ' selected' : '') + '>Segue</option>' +
+                    '<option value="crossfade"' + (transition.type === 'crossfade' ? ' selected' : '') + '>Crossfade</option>' +
+                '</select>' +
+                '<input type="number" class="setlist-song-crossfade" min="0.1" max="30" step="0.1" title="Crossfade seconds" value="' +
+                    (transition.duration || 3) + '"' + (transition.type === 'crossfade' ? '' : ' style="display: none;"') + '>';
             songItem.innerHTML =
                 '<div class="setlist-song-name">' + (index + 1) + '. ' + song.name + ' (' + song.tempo + ' BPM)</div>' +
-                '<div class="setlist-song-actions">' +
+                '<div class="setlist-song-actions">' + transitionControls +
                     '<span class="setlist-song-move move-up" title="Move up">↑</span>' +
                     '<span class="setlist-song-move move-down" title="Move down">↓</span>' +
                     '<span class="setlist-song-remove" title="Remove">✕</span>' +
@@ -92,11 +103,24 @@ document.addEventListener('DOMContentLoaded', function() {
             songItem.querySelector('.move-up').addEventListener('click', () => moveSongInSetlist(index, 'up'));
             songItem.querySelector('.move-down').addEventListener('click', () => moveSongInSetlist(index, 'down'));
             songItem.querySelector('.setlist-song-remove').addEventListener('click', () => removeSongFromSetlist(index));
+            const transitionSelect = songItem.querySelector('.setlist-song-transition');
+            const crossfadeInput = songItem.querySelector('.setlist-song-crossfade');
+            if (transitionSelect) {
+                const updateTransition = () => {
+                    crossfadeInput.style.display = transitionSelect.value === 'crossfade' ? '' : 'none';
+                    if (!transitionSelect.value) { currentTransitions[index] = null; return; }
+                    currentTransitions[index] = transitionSelect.value === 'crossfade'
+                        ? { type: 'crossfade', duration: Math.min(30, Math.max(0.1, parseFloat(crossfadeInput.value) || 3)) }
+                        : { type: 'segue' };
+                };
+                transitionSelect.addEventListener('change', updateTransition);
+                crossfadeInput.addEventListener('change', updateTransition);
+            }
         });
     }
 
     function createNewSetlist() {
-        currentSetlistId = null; isNewSetlist = true; currentSetlistSongs = [];
+        currentSetlistId = null; isNewSetlist = true; currentSetlistSongs = []; currentTransitions = [];
         if(setlistTitle) setlistTitle.textContent = 'New Setlist';
         if(setlistNameInput) setlistNameInput.value = '';
         updateSongsSelector(); updateSetlistSongsList();
@@ -114,12 +138,15 @@ document.addEventListener('DOMContentLoaded', function() {
             const setlist = await response.json();
             if (!setlist?.id) throw new Error('Invalid setlist data received');
             currentSetlistId = setlist.id; isNewSetlist = false;
+            currentSetlistEtag = response.headers.get('ETag');
             if(setlistTitle) setlistTitle.textContent = setlist.name;
             if(setlistNameInput) setlistNameInput.value = setlist.name;
-            currentSetlistSongs = [];
-            (setlist.song_ids || []).forEach(songId => {
+            currentSetlistSongs = []; currentTransitions = [];
+            (setlist.song_ids || []).forEach((songId, index) => {
                 const song = allSongs.find(s => s.id === songId);
-                if (song) currentSetlistSongs.push(song);
+                if (!song) return;
+                currentSetlistSongs.push(song);
+                currentTransitions.push((setlist.transitions || [])[index] || null);
             });
             updateSetlistSongsList(); updateSongsSelector();
             if(emptyState) emptyState.style.display = 'none';
@@ -147,22 +174,24 @@ document.addEventListener('DOMContentLoaded', function() {
             const song = allSongs.find(s => s.id === songId);
             if (song && !currentSetlistSongs.some(s => s.id === songId)) {
                 currentSetlistSongs.push(song);
+                currentTransitions.push(null);
             }
         });
         updateSongsSelector(); updateSetlistSongsList();
     }
 
     function moveSongInSetlist(index, direction) {
-        if (direction === 'up' && index > 0) {
-            [currentSetlistSongs[index - 1], currentSetlistSongs[index]] = [currentSetlistSongs[index], currentSetlistSongs[index - 1]];
-        } else if (direction === 'down' && index < currentSetlistSongs.length - 1) {
-            [currentSetlistSongs[index], currentSetlistSongs[index + 1]] = [currentSetlistSongs[index + 1], currentSetlistSongs[index]];
-        }
+        // A transition belongs to its entry and moves with it
+        const other = direction === 'up' ? index - 1 : index + 1;
+        if (other < 0 || other >= currentSetlistSongs.length) return;
+        [currentSetlistSongs[other], currentSetlistSongs[index]] = [currentSetlistSongs[index], currentSetlistSongs[other]];
+        [currentTransitions[other], currentTransitions[index]] = [currentTransitions[index], currentTransitions[other]];
         updateSetlistSongsList();
     }
 
     function removeSongFromSetlist(index) {
         currentSetlistSongs.splice(index, 1);
+        currentTransitions.splice(index, 1);
         updateSongsSelector(); updateSetlistSongsList();
     }
 
@@ -176,14 +205,21 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         isSaving = true; saveSetlistBtn.disabled = true; saveSetlistBtn.textContent = 'Saving...';
 
-        const setlistData = { name: setlistName, song_ids: currentSetlistSongs.map(song => song.id) };
+        // One transition per entry; the last one has nothing to flow into
+        const transitions = currentSetlistSongs.map((song, index) =>
+            index < currentSetlistSongs.length - 1 ? currentTransitions[index] || null : null);
+        const setlistData = { name: setlistName, song_ids: currentSetlistSongs.map(song => song.id), transitions: transitions };
         try {
             const url = isNewSetlist ? '/api/setlists' : '/api/setlists/' + currentSetlistId;
             const method = isNewSetlist ? 'POST' : 'PUT';
+            const headers = { 'Content-Type': 'application/json' };
+            // Sending the loaded version makes the server refuse to overwrite edits made on another device
+            if (!isNewSetlist && currentSetlistEtag) headers['If-Match'] = currentSetlistEtag;
             const response = await fetch(url, {
-                method: method, headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(setlistData)
+                method: method, headers: headers, body: JSON.stringify(setlistData)
             });
             const savedSetlist = await response.json();
+            if (response.ok) currentSetlistEtag = response.headers.get('ETag');
             if (!response.ok) throw new Error(savedSetlist.error || 'Failed to save setlist');
 
             if(setlistTitle) setlistTitle.textContent = savedSetlist.name;
@@ -8,6 +8,13 @@ document.addEventListener('DOMContentLoaded', function() {
     const globalVolumeValue = document.getElementById('global-volume-value');
     const audioSaveStatus = document.getElementById('audio-save-status');
     const sampleRateSelect = document.getElementById('sample-rate-select');
+    const ramModeCheckbox = document.getElementById('ram-mode-checkbox');
+    const ramBudgetInput = document.getElementById('ram-budget-input');
+    const premixSongsCheckbox = document.getElementById('premix-songs-checkbox');
+    const packSongsCheckbox = document.getElementById('pack-songs-checkbox');
+    const renderCacheCheckbox = document.getElementById('render-cache-checkbox');
+    const renderCacheBudgetInput = document.getElementById('render-cache-budget-input');
+    const synchronizedStartCheckbox = document.getElementById('synchronized-start-checkbox');
     const audioOutputSection = document.getElementById('audio-output-section');
     const keyboardControlSection = document.getElementById('keyboard-control-section');
     const dataManagementSection = document.getElementById('data-management-section');
@@ -22,6 +29,11 @@ document.addEventListener('DOMContentLoaded', function() {
     const importSetlistsBtn = document.getElementById('import-setlists-btn');
     const importSetlistsFileEl = document.getElementById('import-setlists-file');
     const importSetlistsStatusEl = document.getElementById('import-setlists-status');
+    const bundleSetlistSelect = document.getElementById('bundle-setlist-select');
+    const exportBundleBtn = document.getElementById('export-bundle-btn');
+    const importBundleBtn = document.getElementById('import-bundle-btn');
+    const importBundleFileEl = document.getElementById('import-bundle-file');
+    const importBundleStatusEl = document.getElementById('import-bundle-status');
     const openAudioDirBtn = document.getElementById('open-audio-dir');
     const clearCacheBtn = document.getElementById('clear-cache');
     const factoryResetBtn = document.getElementById('factory-reset');
@@ -310,6 +322,13 @@ document.addEventListener('DOMContentLoaded', function() {
             } else {
                 sampleRateSelect.value = "48000";
             }
+            ramModeCheckbox.checked = !!data.ram_mode;
+            if (data.ram_budget_mb !== undefined) ramBudgetInput.value = data.ram_budget_mb;
+            premixSongsCheckbox.checked = !!data.premix_songs;
+            packSongsCheckbox.checked = !!data.pack_songs;
+            renderCacheCheckbox.checked = !!data.render_cache;
+            if (data.render_cache_mb !== undefined) renderCacheBudgetInput.value = data.render_cache_mb;
+            synchronizedStartCheckbox.checked = data.synchronized_start !== false;
 
         } catch (error) {
             console.error("Error loading audio settings:", error);
@@ -389,7 +408,14 @@ document.addEventListener('DOMContentLoaded', function() {
         const payload = {
             audio_outputs: outputs,
             volume: volume,
-            sample_rate: sampleRate
+            sample_rate: sampleRate,
+            ram_mode: ramModeCheckbox.checked,
+            ram_budget_mb: Math.max(0, parseInt(ramBudgetInput.value, 10) || 0),
+            premix_songs: premixSongsCheckbox.checked,
+            pack_songs: packSongsCheckbox.checked,
+            render_cache: renderCacheCheckbox.checked,
+            render_cache_mb: Math.max(0, parseInt(renderCacheBudgetInput.value, 10) || 0),
+            synchronized_start: synchronizedStartCheckbox.checked
         };
         try {
             const response = await fetch('/api/settings/audio_device', {
@@ -538,6 +564,7 @@ document.addEventListener('DOMContentLoaded', function() {
             const result = await response.json();
             if (!response.ok) throw new Error(result.error || 'HTTP ' + response.status);
             if (result.success) {
+                if (result.skipped) console.warn('Import (' + importType + ') skipped invalid items:', result.errors);
                 showStatusMessage(statusEl, result.message || importType.charAt(0).toUpperCase() + importType.slice(1) + ' imported successfully.', false);
                 showGlobalNotification(result.message || importType.charAt(0).toUpperCase() + importType.slice(1) + ' imported. Please refresh relevant pages if needed.', "success", 6000);
             } else {
@@ -587,6 +614,66 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    async function loadBundleSetlists() {
+        if (!bundleSetlistSelect) return;
+        try {
+            const response = await fetch('/api/setlists');
+            if (!response.ok) throw new Error('HTTP ' + response.status);
+            const data = await response.json();
+            bundleSetlistSelect.innerHTML = '';
+            (data.setlists || []).forEach(setlist => {
+                const option = document.createElement('option');
+                option.value = setlist.id;
+                option.textContent = setlist.name;
+                bundleSetlistSelect.appendChild(option);
+            });
+            if (exportBundleBtn) exportBundleBtn.disabled = bundleSetlistSelect.options.length === 0;
+        } catch (error) {
+            console.error('Error loading setlists for bundle export:', error);
+        }
+    }
+
+    async function handleImportBundle() {
+        if (!importBundleFileEl.files || importBundleFileEl.files.length === 0) {
+            showStatusMessage(importBundleStatusEl, "Please select a bundle file first.", true);
+            return;
+        }
+        const originalButtonText = importBundleBtn.textContent;
+        importBundleBtn.disabled = true;
+        importBundleBtn.textContent = 'Importing...';
+        showStatusMessage(importBundleStatusEl, "Importing show bundle...", false, 600000);
+        try {
+            // Sent as the raw body so the server can stream it instead of parsing a multipart form
+            const response = await fetch('/api/import/bundle', {
+                method: 'POST', headers: { 'Content-Type': 'application/x-tar' }, body: importBundleFileEl.files[0]
+            });
+            const result = await response.json();
+            if (!response.ok || !result.success) throw new Error(result.error || 'HTTP ' + response.status);
+            let message = 'Imported ' + result.songs + ' song(s): ' + result.audio_written + ' audio file(s) copied, ' +
+                result.audio_skipped + ' already present.';
+            if (result.missing_audio_files.length) message += ' ' + result.missing_audio_files.length + ' file(s) were missing from the bundle.';
+            showStatusMessage(importBundleStatusEl, message, false);
+            showGlobalNotification(message, 'success', 6000);
+            loadBundleSetlists();
+        } catch (error) {
+            console.error('Show bundle import error:', error);
+            showStatusMessage(importBundleStatusEl, 'Error: ' + error.message, true);
+            showGlobalNotification('Bundle import failed: ' + error.message, 'error');
+        } finally {
+            importBundleBtn.disabled = false;
+            importBundleBtn.textContent = originalButtonText;
+            importBundleFileEl.value = '';
+        }
+    }
+
+    if (exportBundleBtn && bundleSetlistSelect) {
+        exportBundleBtn.addEventListener('click', () => {
+            if (bundleSetlistSelect.value) window.location.href = '/api/export/bundle/' + bundleSetlistSelect.value;
+        });
+        loadBundleSetlists();
+    }
+    if (importBundleBtn && importBundleFileEl && importBundleStatusEl) importBundleBtn.addEventListener('click', handleImportBundle);
+
     if (openAudioDirBtn) {
         openAudioDirBtn.addEventListener('click', function() {
             fetch('/api/settings/open_directory', { method: 'POST' })
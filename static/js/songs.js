@@ -23,6 +23,7 @@ document.addEventListener('DOMContentLoaded', function () {
     const audioFileSelectorList = document.getElementById('audio-file-selector-list');
 
     let currentSongId = null;
+    let currentSongEtag = null;
     let isNewSong = false;
     let isSaving = false;
     let allAvailableAudioFiles = [];
@@ -128,6 +129,12 @@ document.addEventListener('DOMContentLoaded', function () {
         nextTrackTempId = -1;
     }
 
+    // Sends the version we loaded, so the server refuses to overwrite edits made on another device.
+    function songWriteHeaders(headers) {
+        if (currentSongEtag) headers['If-Match'] = currentSongEtag;
+        return headers;
+    }
+
     async function loadSong(songId) {
         if(emptyState) emptyState.style.display = 'none';
         if(!songForm) { console.error('songForm element not found in loadSong!'); return; }
@@ -141,12 +148,14 @@ document.addEventListener('DOMContentLoaded', function () {
             }
             const song = await response.json();
             currentSongId = song.id; isNewSong = false;
+            currentSongEtag = response.headers.get('ETag');
             if(songTitle) songTitle.textContent = song.name;
             if(songNameInput) songNameInput.value = song.name;
             if(songTempoInput) songTempoInput.value = song.tempo;
             if(tracksList) tracksList.innerHTML = '';
             nextTrackTempId = -1;
             (song.audio_tracks || []).forEach(track => addTrackToUI(track));
+            loadTrackMix(song.id);
             document.querySelectorAll('.songs-list .song-item').forEach(item => {
                 item.classList.toggle('active', parseInt(item.dataset.songId) === song.id);
             });
@@ -314,6 +323,13 @@ document.addEventListener('DOMContentLoaded', function () {
                         '<span class="volume-value">' + Math.round((track.volume ?? 1.0) * 100) + '%</span>' +
                     '</div>' +
                 '</div>' +
+                '<div class="track-control-row">' +
+                    '<label class="track-control-label">Live:</label>' +
+                    '<div class="track-mix-buttons">' +
+                        '<button type="button" class="track-mix-button" data-mix="muted">Mute</button>' +
+                        '<button type="button" class="track-mix-button" data-mix="solo">Solo</button>' +
+                    '</div>' +
+                '</div>' +
                 '<div class="delete-track-container">' +
                     '<button class="delete-track action-button delete">Delete</button>' +
                 '</div>' +
@@ -326,6 +342,7 @@ document.addEventListener('DOMContentLoaded', function () {
         const volumeSlider = trackElement.querySelector('.volume-slider');
         const volumeValue = trackElement.querySelector('.volume-value');
         const deleteButton = trackElement.querySelector('.delete-track');
+        const mixButtons = trackElement.querySelectorAll('.track-mix-button');
 
         const updateStereoHintText = () => {
             if (stereoHint && channelSelect) {
@@ -355,14 +372,26 @@ document.addEventListener('DOMContentLoaded', function () {
             });
         }
         if (volumeSlider && volumeValue) {
-            volumeSlider.addEventListener('input', async (event) => {
+            // Dragging rides the prepared song's live mix; the volume is saved once the slider is let go
+            volumeSlider.addEventListener('input', (event) => {
                 const newVolume = parseFloat(event.target.value);
                 volumeValue.textContent = Math.round(newVolume * 100) + '%';
+                if (track.id > 0) sendTrackMix(track.id, { volume: newVolume });
+            });
+            volumeSlider.addEventListener('change', async (event) => {
                 if (track.id > 0) {
-                    try { await updateTrackBackend(track.id, { volume: newVolume }); } catch (error) {}
+                    try { await updateTrackBackend(track.id, { volume: parseFloat(event.target.value) }); } catch (error) {}
                 }
             });
         }
+        mixButtons.forEach(button => {
+            button.disabled = !(track.id > 0);
+            button.addEventListener('click', () => {
+                const active = !button.classList.contains('active');
+                button.classList.toggle('active', active);
+                sendTrackMix(track.id, { [button.dataset.mix]: active });
+            });
+        });
         if (deleteButton) {
             deleteButton.addEventListener('click', async () => {
                 if (track.id > 0) {
@@ -375,6 +404,57 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
+    // Live mix changes in flight per track; a newer one waiting replaces the older, so dragging never queues up requests
+    const pendingTrackMix = {};
+
+    async function sendTrackMix(trackId, change) {
+        if (!currentSongId || trackId <= 0) return;
+        const pending = pendingTrackMix[trackId];
+        if (pending) { Object.assign(pending.change, change); pending.queued = true; return; }
+        const state = pendingTrackMix[trackId] = { change: {}, queued: false };
+        const songId = currentSongId;
+        let body = change;
+        while (body) {
+            try {
+                const response = await fetch('/api/songs/' + songId + '/mix', {
+                    method: 'POST', headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ tracks: { [trackId]: body } })
+                });
+                if (!response.ok) {
+                    const result = await response.json().catch(() => ({}));
+                    throw new Error(result.error || 'HTTP Error ' + response.status);
+                }
+            } catch (err) {
+                console.error('Live mix error for track ' + trackId + ':', err);
+                _showGlobalNotification('Live mix error: ' + err.message, 'error');
+            }
+            body = state.queued ? state.change : null;
+            state.change = {}; state.queued = false;
+        }
+        delete pendingTrackMix[trackId];
+    }
+
+    async function loadTrackMix(songId) {
+        try {
+            const response = await fetch('/api/songs/' + songId + '/mix');
+            if (!response.ok || songId !== currentSongId) return;
+            const mix = (await response.json()).tracks || {};
+            Object.entries(mix).forEach(([trackId, state]) => {
+                const trackElement = tracksList && tracksList.querySelector('.track-item[data-track-id="' + trackId + '"]');
+                if (!trackElement) return;
+                trackElement.querySelectorAll('.track-mix-button').forEach(button => {
+                    button.classList.toggle('active', Boolean(state[button.dataset.mix]));
+                });
+                const slider = trackElement.querySelector('.volume-slider');
+                const value = trackElement.querySelector('.volume-value');
+                if (slider) slider.value = state.volume;
+                if (value) value.textContent = Math.round(state.volume * 100) + '%';
+            });
+        } catch (err) {
+            console.error('Failed to load the live mix of song ' + songId + ':', err);
+        }
+    }
+
     async function updateTrackBackend(trackId, data) {
         if (!currentSongId || typeof currentSongId !== 'number' || currentSongId <= 0) {
             console.warn('updateTrackBackend: Invalid currentSongId (' + currentSongId + '). Skipping update for track ' + trackId + '.');
@@ -386,9 +466,10 @@ document.addEventListener('DOMContentLoaded', function () {
         }
         try {
             const response = await fetch('/api/songs/' + currentSongId + '/tracks/' + trackId, {
-                method: 'PUT', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(data)
+                method: 'PUT', headers: songWriteHeaders({ 'Content-Type': 'application/json' }), body: JSON.stringify(data)
             });
             const result = await response.json();
+            if (response.ok) currentSongEtag = response.headers.get('ETag') || currentSongEtag;
             if (!response.ok || !result.success) {
                 throw new Error(result.error || 'HTTP Error ' + response.status + ' while updating track.');
             }
@@ -409,8 +490,9 @@ document.addEventListener('DOMContentLoaded', function () {
 
         if (confirmed) {
             try {
-                const response = await fetch('/api/songs/' + currentSongId + '/tracks/' + trackId, { method: 'DELETE' });
+                const response = await fetch('/api/songs/' + currentSongId + '/tracks/' + trackId, { method: 'DELETE', headers: songWriteHeaders({}) });
                 const data = await response.json();
+                if (response.ok) currentSongEtag = response.headers.get('ETag') || currentSongEtag;
                 if (!response.ok || !data.success) throw new Error(data.error || 'HTTP ' + response.status);
                 trackElement.remove();
                 _showGlobalNotification(data.message || 'Track deleted successfully.', 'success');
@@ -455,10 +537,12 @@ document.addEventListener('DOMContentLoaded', function () {
         const url = isNewSong ? '/api/songs' : '/api/songs/' + currentSongId;
         const method = isNewSong ? 'POST' : 'PUT';
         try {
+            const headers = { 'Content-Type': 'application/json' };
             const response = await fetch(url, {
-                method: method, headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(songDataPayload)
+                method: method, headers: isNewSong ? headers : songWriteHeaders(headers), body: JSON.stringify(songDataPayload)
             });
             const savedSong = await response.json();
+            if (response.ok) currentSongEtag = response.headers.get('ETag');
             if (!response.ok) throw new Error(savedSong.error || 'Save failed with HTTP ' + response.status);
             _showGlobalNotification('Song saved successfully!', 'success');
             if(songTitle) songTitle.textContent = savedSong.name;
@@ -519,7 +603,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
         if (confirmed) {
             try {
-                const response = await fetch('/api/songs/' + currentSongId, { method: 'DELETE' });
+                const response = await fetch('/api/songs/' + currentSongId, { method: 'DELETE', headers: songWriteHeaders({}) });
                 const data = await response.json();
                 if (!response.ok) throw new Error(data.error || 'HTTP ' + response.status);
                 if (data.success) {